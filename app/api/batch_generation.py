@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Geração de questões em lote pelo Batch API da OpenAI.
+
+Para gerar milhares de questões por domínio (ex.: rodada noturna) sem usar os
+endpoints interativos: um job 'batch_generate' monta um arquivo JSONL com uma
+requisição da engine fused por questão (distribuídas entre os resumos do
+domínio), envia o arquivo, cria o batch, acompanha o processamento e, ao final,
+baixa os resultados e os valida e salva em bloco (no estoque do domínio, ou na
+tabela questions se o estoque estiver desativado).
+
+O arquivo enviado, o ID do batch e a marca de resultados salvos ficam gravados
+nos parâmetros do job, então um worker que assume o job depois de uma queda
+continua acompanhando o mesmo batch (ou o encontra pelo metadata.job_id, se a
+queda foi entre a criação e a gravação do ID) e não salva as questões duas vezes.
+
+Para testar o fluxo sem a API, use o servidor local em fake_openai_server.py
+e aponte OPENAI_API_BASE para ele.
+"""
+
+import os
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from . import job_queue, question_inventory
+from .question_service import find_summary_ids_for_domain, load_summary, summary_prompt_context, insert_question
+from .prompt_context import as_prompt_context
+from .token_budget import context_budget, estimate_messages_tokens, fit_max_tokens
+from ..database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+BATCH_JOB_TYPE = 'batch_generate'
+
+# Endpoint das requisições do batch e prazo de processamento aceito pelo provedor
+BATCH_ENDPOINT = '/v1/chat/completions'
+BATCH_COMPLETION_WINDOW = os.getenv('BATCH_COMPLETION_WINDOW', '24h')
+
+# Intervalo (segundos) entre as consultas ao status do batch
+BATCH_POLL_INTERVAL = float(os.getenv('BATCH_POLL_INTERVAL', '60'))
+
+# Limite de requisições por batch imposto pelo provedor
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '50000'))
+
+# Timeout (segundos) das chamadas HTTP ao Batch API (upload e download incluídos)
+BATCH_HTTP_TIMEOUT = float(os.getenv('BATCH_HTTP_TIMEOUT', '120'))
+
+# Diretório dos arquivos JSONL enviados e recebidos
+BATCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'instance', 'batches')
+
+# Status finais de um batch no provedor
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+class BatchAPIError(Exception):
+    """Erro retornado pelo Batch API."""
+
+class BatchAPI:
+    """Cliente mínimo dos endpoints /files e /batches (não disponíveis no SDK openai==1.3.0)."""
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 timeout: float = BATCH_HTTP_TIMEOUT):
+        api_key = api_key or os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            raise ValueError("API key não encontrada nas variáveis de ambiente")
+        base_url = (base_url or os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')).rstrip('/')
+        if base_url.startswith('fake'):
+            # O cliente em processo não tem /files nem /batches: use o servidor HTTP fake
+            raise ValueError("O Batch API exige um servidor HTTP; use a URL de fake_openai_server.py em OPENAI_API_BASE")
+        self.http = httpx.Client(base_url=base_url, timeout=timeout,
+                                 headers={'Authorization': f'Bearer {api_key}'})
+
+    def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        response = self.http.request(method, path, **kwargs)
+        if response.status_code >= 400:
+            raise BatchAPIError(f"{method} {path} retornou {response.status_code}: {response.text[:500]}")
+        return response
+
+    def upload_file(self, path: str) -> str:
+        """Envia o arquivo JSONL de requisições e retorna o ID do arquivo."""
+        with open(path, 'rb') as batch_file:
+            response = self._request('POST', '/files', data={'purpose': 'batch'},
+                                     files={'file': (os.path.basename(path), batch_file, 'application/jsonl')})
+        return response.json()['id']
+
+    def create_batch(self, input_file_id: str, metadata: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        return self._request('POST', '/batches', json={
+            'input_file_id': input_file_id,
+            'endpoint': BATCH_ENDPOINT,
+            'completion_window': BATCH_COMPLETION_WINDOW,
+            'metadata': metadata or {}
+        }).json()
+
+    def retrieve_batch(self, batch_id: str) -> Dict[str, Any]:
+        return self._request('GET', f'/batches/{batch_id}').json()
+
+    def find_batch(self, metadata_key: str, value: str) -> Optional[Dict[str, Any]]:
+        """Procura, entre os batches da conta (mais recentes primeiro), o que tem metadata[metadata_key] == value."""
+        after = None
+        while True:
+            params = {'limit': 100}
+            if after:
+                params['after'] = after
+            page = self._request('GET', '/batches', params=params).json()
+            for batch in page.get('data') or []:
+                if (batch.get('metadata') or {}).get(metadata_key) == value:
+                    return batch
+            if not page.get('has_more') or not page.get('data'):
+                return None
+            after = page['data'][-1]['id']
+
+    def cancel_batch(self, batch_id: str) -> Dict[str, Any]:
+        return self._request('POST', f'/batches/{batch_id}/cancel').json()
+
+    def file_content(self, file_id: str) -> str:
+        return self._request('GET', f'/files/{file_id}/content').text
+
+    def close(self):
+        self.http.close()
+
+def batch_model() -> str:
+    """Modelo do batch: BATCH_MODEL_ID, FUSED_MODEL_ID ou o modelo de respostas padrão."""
+    model = os.getenv('BATCH_MODEL_ID') or os.getenv('FUSED_MODEL_ID')
+    if model:
+        return model
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT model_id FROM ai_models WHERE model_type = 'answer' AND is_default = 1 LIMIT 1")
+        row = cursor.fetchone()
+    return row[0] if row else 'gpt-3.5-turbo'
+
+def write_jsonl(records: List[Dict[str, Any]], output_path: str) -> str:
+    """Grava os registros no formato JSONL (um objeto JSON por linha)."""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as jsonl_file:
+        for record in records:
+            jsonl_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    logger.info(f"[BATCH] {len(records)} registros gravados em {output_path}")
+    return output_path
+
+def build_batch_requests(domain: str, num_questions: int, model: str) -> List[Dict[str, Any]]:
+    """
+    Monta uma requisição da engine fused por questão, alternando entre os resumos
+    do domínio. O custom_id guarda o resumo usado ("<summary_id>:<índice>").
+    """
+    from .openai_client import fused_prompt
+
+    summary_ids = find_summary_ids_for_domain(domain)
+    if not summary_ids:
+        return []
+
+    budget = context_budget({'fused': model})
+    prompt = fused_prompt(domain)
+    messages_by_summary = {}
+    requests = []
+    for i in range(min(num_questions, BATCH_MAX_REQUESTS)):
+        summary_id = summary_ids[i % len(summary_ids)]
+        if summary_id not in messages_by_summary:
+            summary_data = load_summary(summary_id)
+            if not summary_data:
+                continue
+            prompt_context = as_prompt_context(summary_prompt_context(summary_data)).fit(budget)
+            messages_by_summary[summary_id] = prompt_context.messages(prompt)
+        messages = messages_by_summary[summary_id]
+        requests.append({
+            'custom_id': f'{summary_id}:{i}',
+            'method': 'POST',
+            'url': BATCH_ENDPOINT,
+            'body': {
+                'model': model,
+                'messages': messages,
+                'temperature': 0.7,
+                'max_tokens': fit_max_tokens('fused', model, estimate_messages_tokens(messages))
+            }
+        })
+    return requests
+
+def iter_batch_output(output_text: str) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    Percorre o arquivo de resultados do batch.
+
+    Yields:
+        Tuplas (custom_id, conteúdo da resposta ou None, erro ou None)
+    """
+    for line in output_text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.error(f"[BATCH] Linha inválida no resultado: {str(e)}")
+            continue
+        custom_id = record.get('custom_id', '')
+        response = record.get('response') or {}
+        if record.get('error') or response.get('status_code') != 200:
+            error = record.get('error') or (response.get('body') or {}).get('error')
+            yield custom_id, None, json.dumps(error, ensure_ascii=False)
+            continue
+        try:
+            choice = response['body']['choices'][0]
+            content = choice['message']['content']
+        except (KeyError, IndexError, TypeError):
+            yield custom_id, None, 'Resposta sem conteúdo'
+            continue
+        if choice.get('finish_reason') == 'length':
+            yield custom_id, None, 'Resposta truncada pelo limite de tokens'
+            continue
+        yield custom_id, content, None
+
+def save_batch_results(domain: str, output_text: str, job_id: Optional[str] = None,
+                       worker_id: Optional[str] = None) -> Optional[Dict[str, int]]:
+    """
+    Valida as respostas do batch com o mesmo parser da engine fused e salva as
+    questões aprovadas em uma única transação.
+
+    Com `job_id`, a contagem é gravada em params['results_saved'] do job na mesma
+    transação: um worker que retoma o job depois de uma queda não salva as questões de novo.
+
+    Returns:
+        Contagem {'saved', 'invalid', 'errors'}, ou None se o worker não possui mais o job
+    """
+    from .openai_client import fused_prompt, parse_fused_response, assemble_question
+
+    prompt = fused_prompt(domain)
+    frontend_by_summary = {}
+    counts = {'saved': 0, 'invalid': 0, 'errors': 0}
+    to_inventory = question_inventory.inventory_enabled()
+
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        for custom_id, content, error in iter_batch_output(output_text):
+            if error:
+                logger.warning(f"[BATCH] Requisição {custom_id} falhou: {error}")
+                counts['errors'] += 1
+                continue
+
+            fused_data = parse_fused_response(content.strip(), prompt)
+            if not fused_data:
+                counts['invalid'] += 1
+                continue
+
+            summary_id = int(custom_id.split(':', 1)[0])
+            if summary_id not in frontend_by_summary:
+                summary_data = load_summary(summary_id)
+                frontend_by_summary[summary_id] = (
+                    as_prompt_context(summary_prompt_context(summary_data)).frontend if summary_data
+                    else {'summary': '', 'key_points': []}
+                )
+            question = assemble_question(fused_data['question'], fused_data['answer'], fused_data['distractors'],
+                                         fused_data['warnings'], frontend_by_summary[summary_id])
+            if to_inventory:
+                question_inventory.insert_inventory_question(cursor, question, domain, summary_id)
+            else:
+                insert_question(cursor, question, domain, summary_id)
+            counts['saved'] += 1
+        if job_id and not job_queue.mark_params(cursor, job_id, worker_id, results_saved=counts):
+            # O job passou para outro worker: descarta as inserções, que ele fará
+            conn.rollback()
+            return None
+        conn.commit()
+
+    logger.info(f"[BATCH] Resultados de {domain}: {counts['saved']} questões salvas, "
+                f"{counts['invalid']} inválidas, {counts['errors']} com erro")
+    return counts
+
+def enqueue_batch_generation(domain: str, num_questions: int, user_id: Optional[int] = None) -> str:
+    """Enfileira a geração em lote de `num_questions` questões para o domínio."""
+    return job_queue.enqueue_job(BATCH_JOB_TYPE, {'domain': domain, 'num_questions': num_questions},
+                                 user_id=user_id)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Circuit breaker das chamadas ao modelo, por model id.
+
+Cada modelo tem um circuito com três estados:
+- closed: chamadas normais. CIRCUIT_FAILURE_THRESHOLD falhas seguidas
+  (timeout, erro de conexão, 429 ou 5xx) abrem o circuito.
+- open: as chamadas falham na hora com CircuitOpenError, sem prender threads
+  e workers esperando um provedor fora do ar. Dura CIRCUIT_OPEN_SECONDS,
+  dobrando a cada sondagem que falha (até CIRCUIT_MAX_OPEN_SECONDS).
+- half_open: passado o intervalo, uma única chamada de sondagem é liberada;
+  se der certo o circuito fecha, se falhar volta a abrir.
+
+Erros da requisição (400, 401, JSON inválido) e cancelamentos não contam como
+falha: o modelo respondeu, ou a chamada foi abandonada por quem a fez.
+O estado fica em memória por processo, como as métricas (ver metrics.py).
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+import httpx
+import openai
+
+from .deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# Falhas seguidas de um modelo que abrem o circuito (0 desativa o circuit breaker)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+
+# Tempo (segundos) que o circuito fica aberto antes da primeira sondagem
+CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+
+# Limite do tempo aberto, que dobra a cada sondagem que falha
+CIRCUIT_MAX_OPEN_SECONDS = float(os.getenv('CIRCUIT_MAX_OPEN_SECONDS', '300'))
+
+class CircuitOpenError(Exception):
+    """O circuito do modelo está aberto: a chamada não foi feita."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Modelo {model} indisponível (circuito aberto); nova tentativa em {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+def is_failure(error: Exception) -> bool:
+    """Indica se o erro de uma chamada sugere indisponibilidade do modelo."""
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    # APITimeoutError é subclasse de APIConnectionError; httpx cobre falhas durante o streaming
+    return isinstance(error, (openai.APIConnectionError, httpx.TransportError))
+
+def is_cancellation(error: Exception) -> bool:
+    return isinstance(error, DeadlineExceeded)
+
+class CircuitBreaker:
+    """Estado do circuito de um modelo."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.open_for = CIRCUIT_OPEN_SECONDS
+        self.retry_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+        self.last_error: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def _open(self, seconds: float):
+        self.state = STATE_OPEN
+        self.open_for = seconds
+        self.retry_at = time.monotonic() + seconds
+        self.probe_in_flight = False
+        self.times_opened += 1
+        logger.warning(f"[CIRCUIT] Circuito do modelo {self.model} aberto por {seconds:.0f}s "
+                       f"({self.failures} falhas seguidas; último erro: {self.last_error})")
+
+    def retry_after(self) -> float:
+        """Segundos até a próxima sondagem (0 se o modelo pode ser chamado)."""
+        with self.lock:
+            if self.state == STATE_CLOSED:
+                return 0.0
+            if self.state == STATE_HALF_OPEN:
+                # Sondagem em andamento: quem chega espera o resultado dela
+                return self.open_for if self.probe_in_flight else 0.0
+            return max(0.0, self.retry_at - time.monotonic())
+
+    def before_call(self):
+        """Libera a chamada ou levanta CircuitOpenError."""
+        with self.lock:
+            if self.state == STATE_CLOSED:
+                return
+            if self.state == STATE_OPEN and time.monotonic() >= self.retry_at:
+                self.state = STATE_HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == STATE_HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                logger.info(f"[CIRCUIT] Sondagem do modelo {self.model}")
+                return
+            retry_after = self.open_for if self.state == STATE_HALF_OPEN else self.retry_at - time.monotonic()
+        raise CircuitOpenError(self.model, max(0.0, retry_after))
+
+    def record_success(self):
+        with self.lock:
+            if self.state != STATE_CLOSED:
+                logger.info(f"[CIRCUIT] Circuito do modelo {self.model} fechado")
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self.open_for = CIRCUIT_OPEN_SECONDS
+            self.probe_in_flight = False
+
+    def record_failure(self, error: Exception):
+        with self.lock:
+            self.failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"[:200]
+            if self.state == STATE_HALF_OPEN:
+                self._open(min(self.open_for * 2, CIRCUIT_MAX_OPEN_SECONDS))
+            elif self.state == STATE_CLOSED and self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+                self._open(CIRCUIT_OPEN_SECONDS)
+
+    def release_probe(self):
+        """Sondagem cancelada antes do resultado: libera outra sondagem."""
+        with self.lock:
+            self.probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        retry_after = self.retry_after()
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'retry_after': round(retry_after, 1),
+                'times_opened': self.times_opened,
+                'last_error': self.last_error
+            }
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+def enabled() -> bool:
+    return CIRCUIT_FAILURE_THRESHOLD > 0
+
+def breaker(model: Optional[str]) -> CircuitBreaker:
+    with _registry_lock:
+        model = model or 'desconhecido'
+        return _breakers.setdefault(model, CircuitBreaker(model))
+
+def before_call(model: Optional[str]):
+    """Verifica o circuito do modelo antes de uma chamada (levanta CircuitOpenError)."""
+    if enabled():
+        breaker(model).before_call()
+
+def record_success(model: Optional[str]):
+    if enabled():
+        breaker(model).record_success()
+
+def record_error(model: Optional[str], error: Exception):
+    """Registra o erro de uma chamada conforme o tipo (falha, cancelamento ou erro da requisição)."""
+    if not enabled() or isinstance(error, CircuitOpenError):
+        return
+    if is_cancellation(error):
+        breaker(model).release_probe()
+    elif is_failure(error):
+        breaker(model).record_failure(error)
+    else:
+        breaker(model).record_success()
+
+def release_probe(model: Optional[str]):
+    if enabled():
+        breaker(model).release_probe()
+
+def is_open(model: Optional[str]) -> bool:
+    """Indica se uma chamada ao modelo seria recusada agora."""
+    return enabled() and breaker(model).retry_after() > 0
+
+def retry_after(models: Iterable[Optional[str]]) -> Optional[float]:
+    """
+    Maior tempo de espera entre os modelos com circuito aberto.
+
+    Returns:
+        Segundos até a próxima sondagem, ou None se todos os modelos podem ser chamados
+    """
+    if not enabled():
+        return None
+    waits = [breaker(model).retry_after() for model in set(models)]
+    longest = max(waits, default=0.0)
+    return longest if longest > 0 else None
+
+def check(models: Iterable[Optional[str]]):
+    """Levanta CircuitOpenError se o circuito de algum dos modelos estiver aberto."""
+    if not enabled():
+        return
+    for model in set(models):
+        wait = breaker(model).retry_after()
+        if wait > 0:
+            raise CircuitOpenError(model or 'desconhecido', wait)
+
+def states() -> Dict[str, Dict[str, Any]]:
+    """Estado do circuito de cada modelo já chamado."""
+    with _registry_lock:
+        breakers = dict(_breakers)
+    return {model: breakers[model].snapshot() for model in sorted(breakers)}
+
+def reset():
+    """Fecha todos os circuitos (ex.: entre rodadas de um benchmark)."""
+    with _registry_lock:
+        _breakers.clear()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Prazo (deadline) e cancelamento de uma requisição de geração.
+
+O Deadline é criado pela rota ou pelo worker e repassado até as chamadas ao
+modelo: é verificado entre as etapas, limita o timeout de cada chamada ao
+tempo restante e, quando cancelado, fecha as respostas em andamento para que
+o provedor pare de gerar (e cobrar) tokens que seriam descartados.
+"""
+
+import os
+import time
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Timeout padrão (segundos) de cada chamada ao modelo
+REQUEST_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '30'))
+
+# Prazo total (segundos) das requisições síncronas de geração; deve ser menor
+# que o timeout do gunicorn para que a resposta parcial ainda seja enviada
+GENERATION_DEADLINE = float(os.getenv('GENERATION_DEADLINE_SECONDS', '110'))
+
+# Abaixo deste tempo restante uma nova chamada não é iniciada
+MIN_CALL_TIMEOUT = float(os.getenv('MIN_CALL_TIMEOUT', '2'))
+
+class DeadlineExceeded(Exception):
+    """Prazo da requisição esgotado ou geração cancelada."""
+
+    def __init__(self, message: str, cancelled: bool = False):
+        super().__init__(message)
+        self.cancelled = cancelled
+
+class Deadline:
+    """
+    Prazo e token de cancelamento de uma requisição.
+
+    Implementa a interface usada de threading.Event (set, is_set, wait), então
+    pode substituir o stop_event dos jobs: set() cancela a geração e fecha as
+    chamadas em andamento.
+
+    Args:
+        timeout: Segundos até o prazo expirar (None = sem prazo)
+        should_cancel: Função consultada a cada verificação (ex.: cliente desconectado)
+        abort_in_flight: Se True, as chamadas usam streaming para que cancel(), chamado
+            de outra thread, possa interrompê-las no meio da geração
+    """
+
+    def __init__(self, timeout: Optional[float] = None, should_cancel: Optional[Callable[[], bool]] = None,
+                 abort_in_flight: bool = False):
+        self.expires_at = time.monotonic() + timeout if timeout else None
+        self.should_cancel = should_cancel
+        self.abort_in_flight = abort_in_flight
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._children = weakref.WeakSet()
+
+    def remaining(self) -> Optional[float]:
+        """Segundos restantes até o prazo (None se não houver prazo)."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._cancelled.is_set() and self.should_cancel and self.should_cancel():
+            self.cancel()
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def is_set(self) -> bool:
+        return self.cancelled or self.expired
+
+    def set(self):
+        self.cancel()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        self._cancelled.wait(timeout)
+        return self.is_set()
+
+    def cancel(self):
+        """Cancela a geração e fecha as respostas em andamento."""
+        if self._cancelled.is_set():
+            return
+        self._cancelled.set()
+        with self._lock:
+            in_flight = list(self._in_flight)
+            children = list(self._children)
+        for child in children:
+            child.cancel()
+        for response in in_flight:
+            _close(response)
+        if in_flight:
+            logger.info(f"[DEADLINE] Geração cancelada: {len(in_flight)} chamadas em andamento interrompidas")
+
+    def child(self, abort_in_flight: Optional[bool] = None) -> 'Deadline':
+        """
+        Deadline de uma tentativa (ex.: requisição hedged): mesmo prazo, cancelado
+        junto com este, mas que também pode ser cancelado sozinho.
+        """
+        child = Deadline(should_cancel=lambda: self.cancelled,
+                         abort_in_flight=self.abort_in_flight if abort_in_flight is None else abort_in_flight)
+        child.expires_at = self.expires_at
+        with self._lock:
+            self._children.add(child)
+        if self._cancelled.is_set():
+            child.cancel()
+        return child
+
+    def check(self, stage: Optional[str] = None):
+        """Levanta DeadlineExceeded se o prazo expirou ou a geração foi cancelada."""
+        where = f" na etapa {stage}" if stage else ""
+        if self.cancelled:
+            raise DeadlineExceeded(f"Geração cancelada{where}", cancelled=True)
+        if self.expired:
+            raise DeadlineExceeded(f"Prazo da requisição esgotado{where}")
+
+    def call_timeout(self, stage: Optional[str] = None, default: float = REQUEST_TIMEOUT) -> float:
+        """Timeout da próxima chamada: o padrão, reduzido ao tempo restante do prazo."""
+        self.check(stage)
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if remaining < MIN_CALL_TIMEOUT:
+            raise DeadlineExceeded(f"Tempo restante insuficiente para a etapa {stage} ({remaining:.1f}s)")
+        return min(default, remaining)
+
+    @contextmanager
+    def track(self, response):
+        """Registra uma resposta em andamento para ser fechada se a geração for cancelada."""
+        with self._lock:
+            self._in_flight.add(response)
+        try:
+            # Cancelado entre a criação da chamada e o registro
+            if self._cancelled.is_set():
+                _close(response)
+            yield response
+        finally:
+            with self._lock:
+                self._in_flight.discard(response)
+
+def _close(response):
+    try:
+        response.close()
+    except Exception as e:
+        logger.warning(f"[DEADLINE] Erro ao fechar chamada em andamento: {str(e)}")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Chunks de cada PDF, guardados em document_chunks.
+
+A divisão (utils/chunking.py) é feita uma vez por conteúdo de arquivo
+(SHA-256) e guarda só a posição de cada chunk no texto extraído; o texto vem
+do cache de extração quando os chunks são lidos.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from ..database.db_manager import DatabaseManager
+from ..utils.chunking import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNKER_VERSION, Chunk, iter_chunks
+from ..utils.extraction_cache import content_hash
+from ..utils.pdf_utils import extract_pdf_document, iter_pdf_pages
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+def save_chunks(document_sha256: str, chunks: List[Chunk], max_tokens: int, overlap_tokens: int):
+    """Substitui os chunks guardados do documento."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM document_chunks WHERE document_sha256 = ?', (document_sha256,))
+        cursor.executemany('''
+            INSERT INTO document_chunks (document_sha256, chunk_index, start_offset, end_offset, tokens,
+                                         max_tokens, overlap_tokens, chunker_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(document_sha256, chunk.index, chunk.start_offset, chunk.end_offset, chunk.tokens,
+               max_tokens, overlap_tokens, CHUNKER_VERSION) for chunk in chunks])
+        conn.commit()
+    logger.info(f"[DOCUMENT-CHUNKS] {len(chunks)} chunks guardados para o documento {document_sha256[:12]}")
+
+def load_chunks(document_sha256: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Optional[List[Dict[str, Any]]]:
+    """Chunks guardados do documento (None se ainda não foi dividido com a versão e os tamanhos atuais)."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT chunk_index, start_offset, end_offset, tokens FROM document_chunks
+            WHERE document_sha256 = ? AND chunker_version = ? AND max_tokens = ? AND overlap_tokens = ?
+            ORDER BY chunk_index
+        ''', (document_sha256, CHUNKER_VERSION, max_tokens, overlap_tokens))
+        rows = cursor.fetchall()
+    return [dict(row) for row in rows] or None
+
+def document_chunks(pdf_path: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                    overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Hash do PDF e os chunks com o texto de cada um, dividindo o documento
+    (em streaming, página a página) se ainda não houver chunks guardados.
+    """
+    document_sha256 = content_hash(pdf_path)
+    stored = load_chunks(document_sha256, max_tokens, overlap_tokens)
+    if stored is None:
+        pages = (page_text for _, page_text in iter_pdf_pages(pdf_path))
+        chunks = list(iter_chunks(pages, max_tokens, overlap_tokens))
+        save_chunks(document_sha256, chunks, max_tokens, overlap_tokens)
+        return document_sha256, [{'chunk_index': chunk.index, 'start_offset': chunk.start_offset,
+                                  'end_offset': chunk.end_offset, 'tokens': chunk.tokens, 'text': chunk.text}
+                                 for chunk in chunks]
+
+    text = extract_pdf_document(pdf_path).text
+    for chunk in stored:
+        chunk['text'] = text[chunk['start_offset']:chunk['end_offset']]
+    return document_sha256, stored
+
+def search_chunks(pdf_path: str, query: str, limit: int = 3) -> List[Dict[str, Any]]:
+    """Chunks do PDF mais parecidos com a consulta (TF-IDF), com o score de cada um."""
+    _, chunks = document_chunks(pdf_path)
+    if not chunks or not query.strip():
+        return []
+    try:
+        matrix = TfidfVectorizer(strip_accents='unicode', ngram_range=(1, 2)).fit_transform(
+            [chunk['text'] for chunk in chunks] + [query])
+    except ValueError:
+        return []
+    scores = cosine_similarity(matrix[-1], matrix[:-1])[0]
+    ranked = np.argsort(scores)[::-1][:limit]
+    return [dict(chunks[index], relevance_score=float(scores[index])) for index in ranked if scores[index] > 0]
@@ -0,0 +1,643 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Servidor e cliente falsos compatíveis com a API da OpenAI, para testes de carga
+e benchmarks sem gastar com a API.
+
+- FakeLLM gera, para cada tipo de prompt da aplicação (question, answer,
+  distractors, fused, summary), respostas determinísticas que passam pelos
+  validadores, com latência sorteada de uma distribuição configurável,
+  injeção de erros 500 e 429 e campos usage.
+- FakeOpenAIClient usa o FakeLLM dentro do processo, com a interface do SDK
+  usada pela aplicação (client.chat.completions.create, inclusive stream=True).
+  get_openai_client() o retorna quando OPENAI_API_BASE=fake.
+- O servidor HTTP expõe /chat/completions (com streaming SSE), /files e
+  /batches. Um batch criado é concluído após --batch-delay segundos, gerando
+  o arquivo de resultados no mesmo formato do provedor.
+
+O servidor usa apenas a biblioteca padrão.
+
+Configuração (variáveis de ambiente ou argumentos do servidor):
+    FAKE_LLM_LATENCY            Distribuição da latência até o primeiro token:
+                                "0.5", "uniform:0.2,1.5", "normal:0.8,0.2",
+                                "lognormal:0.8,0.5" (mediana, sigma), "exponential:0.8"
+    FAKE_LLM_LATENCY_<TIPO>     Distribuição específica de um tipo de prompt
+    FAKE_LLM_TOKEN_LATENCY      Segundos por token gerado (padrão 0)
+    FAKE_LLM_ERROR_RATE         Fração das chamadas que retornam 500
+    FAKE_LLM_RATE_LIMIT_RATE    Fração das chamadas que retornam 429
+    FAKE_LLM_SEED               Semente dos sorteios (padrão 42)
+
+Uso:
+    python app/api/fake_openai_server.py --port 8089 --latency lognormal:0.8,0.5 --rate-limit-rate 0.05
+    OPENAI_API_BASE=http://127.0.0.1:8089/v1 OPENAI_API_KEY=teste python worker.py
+    python benchmarks/load_test.py --latency lognormal:0.8,0.5
+"""
+
+import os
+import re
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# Trechos que identificam o tipo de prompt (testados na ordem, na última mensagem do usuário)
+PROMPT_MARKERS = [
+    ('fused', 'Gere uma questão completa de múltipla escolha'),
+    ('question', 'Gere um cenário e uma pergunta'),
+    ('distractors', 'pergunta e resposta correta sobre'),
+    ('answer', 'Analise o seguinte cenário e pergunta'),
+    ('summary_fields', 'gere um resumo estruturado'),
+    ('summary', 'gere um resumo detalhado')
+]
+
+PROMPT_TYPES = [prompt_type for prompt_type, _ in PROMPT_MARKERS] + ['text']
+
+# Número de palavras da resposta correta gerada (distratores seguem a faixa pedida no prompt)
+ANSWER_WORDS = 14
+
+def detect_prompt_type(messages: List[Dict[str, Any]]) -> str:
+    """Tipo do prompt a partir da última mensagem do usuário ('text' se não reconhecido)."""
+    user_messages = [str(message.get('content', '')) for message in messages if message.get('role') == 'user']
+    content = user_messages[-1].lower() if user_messages else ''
+    for prompt_type, marker in PROMPT_MARKERS:
+        if marker.lower() in content:
+            return prompt_type
+    return 'text'
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa simples de tokens (~4 caracteres por token)."""
+    return max(1, len(text) // 4) if text else 0
+
+def _words(seed: str, prefix: str, count: int) -> str:
+    """Frase determinística com `count` palavras."""
+    digest = hashlib.sha1(seed.encode('utf-8')).hexdigest()
+    words = [prefix] + [f"termo{digest[i % len(digest)]}{i}" for i in range(count - 1)]
+    return ' '.join(words)
+
+def _distractor_words(content: str) -> int:
+    """Tamanho dos distratores: meio da faixa pedida no prompt ("Ter entre X e Y palavras")."""
+    match = re.search(r'Ter entre (\d+) e (\d+) palavras', content)
+    if not match:
+        return ANSWER_WORDS
+    return (int(match.group(1)) + int(match.group(2))) // 2
+
+def fake_content(prompt_type: str, messages: List[Dict[str, Any]], index: int = 0) -> str:
+    """Conteúdo determinístico e válido no esquema do tipo de prompt."""
+    seed = json.dumps(messages, sort_keys=True, ensure_ascii=False) + str(index)
+    if prompt_type == 'question':
+        data = {'scenario': _words(seed + 's', 'Cenário', 20),
+                'question': _words(seed + 'q', 'Pergunta', 10) + '?'}
+    elif prompt_type == 'answer':
+        data = {'correct_answer': _words(seed + 'a', 'Correta', ANSWER_WORDS),
+                'justification': _words(seed + 'j', 'Justificativa', 25),
+                'pmbok_references': ['PMBOK 7ª edição'],
+                'practical_examples': [_words(seed + 'e', 'Exemplo', 12)]}
+    elif prompt_type == 'distractors':
+        length = _distractor_words(str(messages[-1].get('content', '')) if messages else '')
+        data = [_words(seed + f'd{i}', f'Distrator{i + 1}', length) for i in range(3)]
+    elif prompt_type == 'fused':
+        data = {'scenario': _words(seed + 's', 'Cenário', 20),
+                'question': _words(seed + 'q', 'Pergunta', 10) + '?',
+                'correct_answer': _words(seed + 'a', 'Correta', ANSWER_WORDS),
+                'justification': _words(seed + 'j', 'Justificativa', 25),
+                'pmbok_references': ['PMBOK 7ª edição'],
+                'practical_examples': [_words(seed + 'e', 'Exemplo', 12)],
+                'distractors': [_words(seed + f'd{i}', f'Distrator{i + 1}', ANSWER_WORDS) for i in range(3)]}
+    elif prompt_type == 'summary_fields':
+        data = {'summary': _words(seed + 'r', 'Resumo', 60),
+                'key_points': [_words(seed + f'k{i}', 'Ponto', 12) for i in range(3)],
+                'practical_examples': [_words(seed + f'e{i}', 'Exemplo', 12) for i in range(2)],
+                'pmbok_references': ['PMBOK 7ª edição'],
+                'domains': ['Pessoas', 'Processos']}
+    elif prompt_type == 'summary':
+        data = {'summary': _words(seed + 'r', 'Resumo', 60),
+                'key_points': [{'point': _words(seed + f'k{i}', 'Ponto', 8),
+                                'explanation': _words(seed + f'x{i}', 'Explicação', 15),
+                                'pmbok_relation': 'PMBOK 7ª edição'} for i in range(3)],
+                'practical_examples': [{'example': _words(seed + f'e{i}', 'Exemplo', 12),
+                                        'context': _words(seed + f'c{i}', 'Contexto', 8),
+                                        'lessons': _words(seed + f'l{i}', 'Lição', 8)} for i in range(2)],
+                'pmbok_references': [{'section': 'PMBOK 7ª edição', 'description': 'Princípios',
+                                      'relevance': 'alta'}],
+                'domains': [{'name': 'Processos', 'relation': 'direta', 'impact': 'alto'}]}
+    else:
+        return _words(seed, 'Resposta', 40)
+    return json.dumps(data, ensure_ascii=False)
+
+class LatencyModel:
+    """Distribuição de latência (segundos) descrita por uma string (ver docstring do módulo)."""
+
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal', 'exponential')
+
+    def __init__(self, spec: Optional[str] = None):
+        self.spec = (spec or '0').strip()
+        kind, _, args = self.spec.partition(':')
+        if not args:
+            kind, args = 'fixed', kind
+        self.kind = kind.lower()
+        self.args = [float(value) for value in args.split(',') if value.strip()]
+        if self.kind not in self.KINDS:
+            raise ValueError(f"Distribuição de latência desconhecida: {self.spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == 'fixed':
+            return self.args[0] if self.args else 0.0
+        if self.kind == 'uniform':
+            return rng.uniform(self.args[0], self.args[1])
+        if self.kind == 'normal':
+            return max(0.0, rng.gauss(self.args[0], self.args[1]))
+        if self.kind == 'lognormal':
+            return rng.lognormvariate(math.log(self.args[0]), self.args[1])
+        return rng.expovariate(1.0 / self.args[0])
+
+class FakeCall:
+    """Resultado sorteado para uma chamada: status, atrasos e conteúdo de cada resposta."""
+
+    def __init__(self, prompt_type: str, status: int, first_token_delay: float, token_delay: float,
+                 contents: List[str], prompt_tokens: int):
+        self.prompt_type = prompt_type
+        self.status = status
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.contents = contents
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = sum(estimate_tokens(content) for content in contents)
+
+    @property
+    def total_delay(self) -> float:
+        return self.first_token_delay + self.token_delay * self.completion_tokens
+
+    def error_body(self) -> Dict[str, Any]:
+        if self.status == 429:
+            return {'error': {'message': 'Rate limit reached (fake)', 'type': 'rate_limit_error',
+                              'code': 'rate_limit_exceeded'}}
+        return {'error': {'message': 'The server had an error (fake)', 'type': 'server_error', 'code': None}}
+
+    def completion(self, model: str) -> Dict[str, Any]:
+        return {
+            'id': f'chatcmpl-{uuid.uuid4().hex[:24]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [
+                {'index': i, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}
+                for i, content in enumerate(self.contents)
+            ],
+            'usage': {
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'total_tokens': self.prompt_tokens + self.completion_tokens
+            }
+        }
+
+    def chunks(self, model: str, piece_chars: int = 16) -> List[Tuple[float, Dict[str, Any]]]:
+        """Trechos do stream: pares (atraso antes do trecho, chunk no formato chat.completion.chunk)."""
+        chunk_id = f'chatcmpl-{uuid.uuid4().hex[:24]}'
+        created = int(time.time())
+
+        def chunk(index: int, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+            return {'id': chunk_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                    'choices': [{'index': index, 'delta': delta, 'finish_reason': finish_reason}]}
+
+        pieces = [(0.0, chunk(i, {'role': 'assistant', 'content': ''})) for i in range(len(self.contents))]
+        if pieces:
+            pieces[0] = (self.first_token_delay, pieces[0][1])
+        offsets = [0] * len(self.contents)
+        # Intercala as respostas, como o provedor faz com n > 1
+        while any(offset < len(content) for offset, content in zip(offsets, self.contents)):
+            for i, content in enumerate(self.contents):
+                if offsets[i] >= len(content):
+                    continue
+                piece = content[offsets[i]:offsets[i] + piece_chars]
+                offsets[i] += len(piece)
+                pieces.append((self.token_delay * estimate_tokens(piece), chunk(i, {'content': piece})))
+        pieces += [(0.0, chunk(i, {}, 'stop')) for i in range(len(self.contents))]
+        return pieces
+
+class FakeLLM:
+    """Modelo falso: sorteia latência e falhas (com semente) e gera respostas válidas por tipo de prompt."""
+
+    def __init__(self, latency: Optional[str] = None, type_latency: Optional[Dict[str, str]] = None,
+                 token_latency: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 seed: Optional[int] = 42):
+        self.latency = LatencyModel(latency)
+        self.type_latency = {prompt_type: LatencyModel(spec) for prompt_type, spec in (type_latency or {}).items()}
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_env(cls, **overrides) -> 'FakeLLM':
+        """FakeLLM configurado pelas variáveis FAKE_LLM_* (argumentos informados têm prioridade)."""
+        seed = os.getenv('FAKE_LLM_SEED', '42')
+        config = {
+            'latency': os.getenv('FAKE_LLM_LATENCY', '0'),
+            'type_latency': {prompt_type: os.environ[f'FAKE_LLM_LATENCY_{prompt_type.upper()}']
+                             for prompt_type in PROMPT_TYPES
+                             if os.getenv(f'FAKE_LLM_LATENCY_{prompt_type.upper()}')},
+            'token_latency': float(os.getenv('FAKE_LLM_TOKEN_LATENCY', '0')),
+            'error_rate': float(os.getenv('FAKE_LLM_ERROR_RATE', '0')),
+            'rate_limit_rate': float(os.getenv('FAKE_LLM_RATE_LIMIT_RATE', '0')),
+            'seed': int(seed) if seed else None
+        }
+        config.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**config)
+
+    def plan(self, body: Dict[str, Any], inject_faults: bool = True) -> FakeCall:
+        """Sorteia o resultado de uma chamada a /chat/completions."""
+        messages = body.get('messages') or []
+        prompt_type = detect_prompt_type(messages)
+        n = int(body.get('n') or 1)
+        with self.lock:
+            draw = self.rng.random()
+            delay = self.type_latency.get(prompt_type, self.latency).sample(self.rng)
+        status = 200
+        if inject_faults and draw < self.rate_limit_rate:
+            status, delay = 429, 0.0
+        elif inject_faults and draw < self.rate_limit_rate + self.error_rate:
+            status = 500
+        contents = [fake_content(prompt_type, messages, i) for i in range(n)] if status == 200 else []
+        prompt_tokens = sum(estimate_tokens(str(message.get('content', ''))) for message in messages)
+        call = FakeCall(prompt_type, status, delay, self.token_latency, contents, prompt_tokens)
+        self._count(call)
+        return call
+
+    def _count(self, call: FakeCall):
+        with self.lock:
+            counters = self.counters.setdefault(call.prompt_type, {
+                'calls': 0, 'errors': 0, 'rate_limited': 0, 'prompt_tokens': 0, 'completion_tokens': 0})
+            counters['calls'] += 1
+            counters['errors'] += call.status == 500
+            counters['rate_limited'] += call.status == 429
+            counters['prompt_tokens'] += call.prompt_tokens
+            counters['completion_tokens'] += call.completion_tokens
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Contadores de chamadas, falhas injetadas e tokens por tipo de prompt."""
+        with self.lock:
+            return {prompt_type: dict(counters) for prompt_type, counters in self.counters.items()}
+
+_default_llm: Optional[FakeLLM] = None
+_default_llm_lock = threading.Lock()
+
+def default_llm() -> FakeLLM:
+    """FakeLLM do processo, configurado pelas variáveis FAKE_LLM_*."""
+    global _default_llm
+    with _default_llm_lock:
+        if _default_llm is None:
+            _default_llm = FakeLLM.from_env()
+        return _default_llm
+
+def _to_object(value: Any) -> Any:
+    """Converte dicionários em objetos com acesso por atributo, como os tipos do SDK."""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _to_object(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_to_object(item) for item in value]
+    return value
+
+def _api_error(call: FakeCall, timeout: bool = False) -> Exception:
+    """Exceção do SDK equivalente à falha sorteada (429, 500 ou timeout)."""
+    import httpx
+    import openai
+
+    request = httpx.Request('POST', 'https://fake.local/v1/chat/completions')
+    if timeout:
+        return openai.APITimeoutError(request=request)
+    response = httpx.Response(call.status, request=request, json=call.error_body(),
+                              headers={'retry-after': '1'} if call.status == 429 else None)
+    error_class = openai.RateLimitError if call.status == 429 else openai.InternalServerError
+    return error_class(call.error_body()['error']['message'], response=response, body=call.error_body())
+
+class _FakeResponse:
+    """Imita a resposta HTTP de um stream: close() interrompe o envio dos trechos."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+class _FakeStream:
+    """Stream de chunks com os atrasos sorteados; termina assim que a resposta é fechada."""
+
+    def __init__(self, call: FakeCall, model: str, timeout: Optional[float]):
+        self.response = _FakeResponse()
+        self.call = call
+        self.model = model
+        self.timeout = timeout
+
+    def __iter__(self):
+        started = time.monotonic()
+        for delay, data in self.call.chunks(self.model):
+            if self.timeout is not None and time.monotonic() - started + delay > self.timeout:
+                if self.response.closed.wait(max(0.0, self.timeout - (time.monotonic() - started))):
+                    return
+                raise _api_error(self.call, timeout=True)
+            if self.response.closed.wait(delay) if delay else self.response.closed.is_set():
+                return
+            yield _to_object(data)
+
+class _FakeCompletions:
+    def __init__(self, llm: FakeLLM):
+        self.llm = llm
+
+    def create(self, **kwargs):
+        call = self.llm.plan(kwargs)
+        model = kwargs.get('model') or 'fake'
+        timeout = kwargs.get('timeout')
+        if not isinstance(timeout, (int, float)) or timeout <= 0:
+            timeout = None
+        if call.status != 200:
+            time.sleep(call.first_token_delay)
+            raise _api_error(call)
+        if kwargs.get('stream'):
+            return _FakeStream(call, model, timeout)
+        if timeout is not None and call.total_delay > timeout:
+            time.sleep(timeout)
+            raise _api_error(call, timeout=True)
+        time.sleep(call.total_delay)
+        return _to_object(call.completion(model))
+
+class FakeOpenAIClient:
+    """Cliente em processo com a interface do SDK usada pela aplicação (chat.completions.create)."""
+
+    def __init__(self, llm: Optional[FakeLLM] = None):
+        self.llm = llm or default_llm()
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self.llm))
+
+class FakeOpenAIState:
+    """Arquivos e batches guardados em memória."""
+
+    def __init__(self, batch_delay: float = 0.0, llm: Optional[FakeLLM] = None):
+        self.batch_delay = batch_delay
+        self.llm = llm or default_llm()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def add_file(self, content: bytes, filename: str, purpose: str) -> Dict[str, Any]:
+        file_id = f'file-{uuid.uuid4().hex[:24]}'
+        record = {'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+                  'filename': filename, 'purpose': purpose}
+        with self.lock:
+            self.files[file_id] = dict(record, content=content)
+        return record
+
+    def create_batch(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        input_file = self.files.get(params.get('input_file_id'))
+        if not input_file:
+            return None
+        lines = [line for line in input_file['content'].decode('utf-8').splitlines() if line.strip()]
+        batch = {
+            'id': f'batch_{uuid.uuid4().hex[:24]}',
+            'object': 'batch',
+            'endpoint': params.get('endpoint'),
+            'input_file_id': params['input_file_id'],
+            'completion_window': params.get('completion_window', '24h'),
+            'status': 'validating',
+            'output_file_id': None,
+            'error_file_id': None,
+            'created_at': int(time.time()),
+            'metadata': params.get('metadata') or {},
+            'request_counts': {'total': len(lines), 'completed': 0, 'failed': 0}
+        }
+        with self.lock:
+            self.batches[batch['id']] = batch
+        return batch
+
+    def retrieve_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch and batch['status'] in ('validating', 'in_progress'):
+                if time.time() - batch['created_at'] >= self.batch_delay:
+                    self._complete(batch)
+                else:
+                    batch['status'] = 'in_progress'
+            return batch
+
+    def _complete(self, batch: Dict[str, Any]):
+        """Processa todas as requisições do batch e gera o arquivo de resultados."""
+        input_file = self.files[batch['input_file_id']]
+        output, errors = [], []
+        for line in input_file['content'].decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            body = request.get('body') or {}
+            if not body.get('messages'):
+                errors.append({'id': f'batch_req_{uuid.uuid4().hex[:24]}', 'custom_id': request.get('custom_id'),
+                               'response': None,
+                               'error': {'code': 'invalid_request', 'message': 'messages é obrigatório'}})
+                continue
+            # Latência e falhas injetadas valem apenas para as chamadas síncronas
+            call = self.llm.plan(body, inject_faults=False)
+            output.append({'id': f'batch_req_{uuid.uuid4().hex[:24]}', 'custom_id': request.get('custom_id'),
+                           'response': {'status_code': 200, 'request_id': uuid.uuid4().hex,
+                                        'body': call.completion(body.get('model', 'fake'))},
+                           'error': None})
+        for records, key, name in ((output, 'output_file_id', 'output'), (errors, 'error_file_id', 'errors')):
+            if records:
+                content = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+                file_id = f'file-{uuid.uuid4().hex[:24]}'
+                self.files[file_id] = {'id': file_id, 'object': 'file', 'bytes': len(content),
+                                       'filename': f"{batch['id']}_{name}.jsonl", 'purpose': 'batch_output',
+                                       'created_at': int(time.time()), 'content': content.encode('utf-8')}
+                batch[key] = file_id
+        batch['status'] = 'completed'
+        batch['completed_at'] = int(time.time())
+        batch['request_counts'].update(completed=len(output), failed=len(errors))
+
+    def list_batches(self, limit: int = 20, after: Optional[str] = None) -> Dict[str, Any]:
+        """Batches do mais recente para o mais antigo, paginados por `after` como no provedor."""
+        with self.lock:
+            batches = list(reversed(list(self.batches.values())))
+        if after:
+            ids = [batch['id'] for batch in batches]
+            batches = batches[ids.index(after) + 1:] if after in ids else []
+        page = batches[:limit]
+        return {'object': 'list', 'data': page, 'has_more': len(batches) > limit,
+                'first_id': page[0]['id'] if page else None, 'last_id': page[-1]['id'] if page else None}
+
+    def cancel_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch and batch['status'] not in ('completed', 'failed', 'expired'):
+                batch['status'] = 'cancelled'
+            return batch
+
+def _parse_multipart(content_type: str, body: bytes) -> Tuple[Dict[str, str], Dict[str, Tuple[str, bytes]]]:
+    """Separa os campos e os arquivos de um corpo multipart/form-data."""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + body)
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        filename = part.get_filename()
+        payload = part.get_payload(decode=True) or b''
+        if filename:
+            files[name] = (filename, payload)
+        else:
+            fields[name] = payload.decode('utf-8')
+    return fields, files
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Roteia as requisições para o estado do servidor (prefixo /v1 opcional)."""
+
+    server_version = 'FakeOpenAI/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self) -> FakeOpenAIState:
+        return self.server.state
+
+    def _path(self) -> str:
+        path = self.path.split('?', 1)[0]
+        return path[3:] if path.startswith('/v1/') else path
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self):
+        self._send_json(404, {'error': {'message': f'Rota não encontrada: {self.path}', 'type': 'invalid_request_error'}})
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _chat_completion(self, body: Dict[str, Any]):
+        call = self.state.llm.plan(body)
+        model = body.get('model', 'fake')
+        if call.status != 200:
+            time.sleep(call.first_token_delay)
+            headers = {'Retry-After': '1'} if call.status == 429 else None
+            return self._send_json(call.status, call.error_body(), headers)
+        if not body.get('stream'):
+            time.sleep(call.total_delay)
+            return self._send_json(200, call.completion(model))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            for delay, data in call.chunks(model):
+                time.sleep(delay)
+                self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # O cliente fechou a conexão (ex.: geração cancelada)
+            pass
+
+    def do_GET(self):
+        path = self._path()
+        if path == '/stats':
+            return self._send_json(200, self.state.llm.stats())
+        match = re.fullmatch(r'/files/([^/]+)/content', path)
+        if match:
+            record = self.state.files.get(match.group(1))
+            if not record:
+                return self._not_found()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(record['content'])))
+            self.end_headers()
+            self.wfile.write(record['content'])
+            return
+        if path == '/batches':
+            query = parse_qs(urlsplit(self.path).query)
+            return self._send_json(200, self.state.list_batches(int(query.get('limit', ['20'])[0]),
+                                                                query.get('after', [None])[0]))
+        match = re.fullmatch(r'/batches/([^/]+)', path)
+        if match:
+            batch = self.state.retrieve_batch(match.group(1))
+            return self._send_json(200, batch) if batch else self._not_found()
+        self._not_found()
+
+    def do_POST(self):
+        path = self._path()
+        body = self._body()
+        if path == '/chat/completions':
+            return self._chat_completion(json.loads(body or b'{}'))
+        if path == '/files':
+            fields, files = _parse_multipart(self.headers.get('Content-Type', ''), body)
+            if 'file' not in files:
+                return self._send_json(400, {'error': {'message': 'Campo file ausente'}})
+            filename, content = files['file']
+            return self._send_json(200, self.state.add_file(content, filename, fields.get('purpose', 'batch')))
+        if path == '/batches':
+            batch = self.state.create_batch(json.loads(body or b'{}'))
+            if not batch:
+                return self._send_json(400, {'error': {'message': 'input_file_id inválido'}})
+            return self._send_json(200, batch)
+        match = re.fullmatch(r'/batches/([^/]+)/cancel', path)
+        if match:
+            batch = self.state.cancel_batch(match.group(1))
+            return self._send_json(200, batch) if batch else self._not_found()
+        self._not_found()
+
+def start_server(host: str = '127.0.0.1', port: int = 0, batch_delay: float = 0.0,
+                 llm: Optional[FakeLLM] = None) -> ThreadingHTTPServer:
+    """
+    Inicia o servidor em uma thread daemon (porta 0 = porta livre) e o retorna.
+    A URL base para OPENAI_API_BASE fica em server.base_url.
+    """
+    server = ThreadingHTTPServer((host, port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.state = FakeOpenAIState(batch_delay=batch_delay, llm=llm)
+    server.base_url = f'http://{host}:{server.server_address[1]}/v1'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor local que imita a API da OpenAI')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--batch-delay', type=float, default=0.0,
+                        help='Segundos até um batch criado ser concluído')
+    parser.add_argument('--latency', help='Distribuição da latência até o primeiro token (ex.: lognormal:0.8,0.5)')
+    parser.add_argument('--token-latency', type=float, help='Segundos por token gerado')
+    parser.add_argument('--error-rate', type=float, help='Fração das chamadas que retornam 500')
+    parser.add_argument('--rate-limit-rate', type=float, help='Fração das chamadas que retornam 429')
+    parser.add_argument('--seed', type=int, help='Semente dos sorteios')
+    args = parser.parse_args()
+
+    llm = FakeLLM.from_env(latency=args.latency, token_latency=args.token_latency, error_rate=args.error_rate,
+                           rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.state = FakeOpenAIState(batch_delay=args.batch_delay, llm=llm)
+    print(f"Servidor fake da OpenAI em http://{args.host}:{args.port}/v1 (estatísticas em /v1/stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Requisições hedged e fallback de modelo por latência.
+
+Para as etapas listadas em HEDGE_STAGES, se a chamada ao modelo passar do
+percentil HEDGE_PERCENTILE da latência observada da etapa, uma segunda
+chamada idêntica é disparada (ou para o modelo de fallback configurado em
+HEDGE_FALLBACK_<ETAPA>). A primeira resposta válida é usada e a outra
+chamada é cancelada. A fração de chamadas hedged é limitada por HEDGE_MAX_RATE.
+O modelo de fallback também substitui o principal enquanto o circuito
+deste estiver aberto.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Optional
+
+from . import circuit_breaker
+from .deadline import Deadline
+from ..database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+# Etapas com hedging ativo (ex.: "answer,distractors"); vazio desativa
+HEDGE_STAGES = {stage.strip() for stage in os.getenv('HEDGE_STAGES', '').split(',') if stage.strip()}
+
+# Percentil da latência da etapa após o qual a segunda chamada é disparada
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+
+# Amostras mínimas no histograma antes de começar a fazer hedging
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+
+# Fração máxima das chamadas de uma etapa que podem ser hedged
+HEDGE_MAX_RATE = float(os.getenv('HEDGE_MAX_RATE', '0.1'))
+
+# Número de chamadas recentes consideradas nos histogramas e no orçamento
+HEDGE_WINDOW = int(os.getenv('HEDGE_WINDOW', '200'))
+
+# Etapa -> tipo do modelo na tabela ai_models
+STAGE_MODEL_TYPES = {
+    'question': 'question',
+    'answer': 'answer',
+    'distractors': 'distractor',
+    'fused': 'answer'
+}
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('HEDGE_MAX_WORKERS', '8')),
+                               thread_name_prefix='hedge')
+
+class LatencyHistogram:
+    """Latências (segundos) das chamadas mais recentes de uma etapa."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    @property
+    def count(self) -> int:
+        return len(self.samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self.lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+
+class HedgeBudget:
+    """Limita a fração de chamadas hedged dentro da janela de chamadas recentes."""
+
+    def __init__(self, max_rate: float = HEDGE_MAX_RATE, window: int = HEDGE_WINDOW):
+        self.max_rate = max_rate
+        self.decisions = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def can_hedge(self) -> bool:
+        with self.lock:
+            hedged = sum(self.decisions)
+            return (hedged + 1) / (len(self.decisions) + 1) <= self.max_rate
+
+    def record(self, hedged: bool):
+        with self.lock:
+            self.decisions.append(1 if hedged else 0)
+
+    @property
+    def rate(self) -> float:
+        with self.lock:
+            return sum(self.decisions) / len(self.decisions) if self.decisions else 0.0
+
+_histograms: Dict[str, LatencyHistogram] = {}
+_budgets: Dict[str, HedgeBudget] = {}
+_registry_lock = threading.Lock()
+
+def histogram(stage: str) -> LatencyHistogram:
+    with _registry_lock:
+        return _histograms.setdefault(stage, LatencyHistogram())
+
+def budget(stage: str) -> HedgeBudget:
+    with _registry_lock:
+        return _budgets.setdefault(stage, HedgeBudget())
+
+def latency_stats() -> Dict[str, Dict[str, Any]]:
+    """Percentis de latência e taxa de hedging por etapa."""
+    with _registry_lock:
+        stages = set(_histograms) | set(_budgets)
+    return {stage: dict(histogram(stage).snapshot(), hedge_rate=budget(stage).rate) for stage in sorted(stages)}
+
+def hedge_delay(stage: str) -> Optional[float]:
+    """Tempo após o qual a chamada da etapa é hedged (None = sem hedging)."""
+    if stage not in HEDGE_STAGES:
+        return None
+    stage_histogram = histogram(stage)
+    if stage_histogram.count < HEDGE_MIN_SAMPLES:
+        return None
+    return stage_histogram.percentile(HEDGE_PERCENTILE)
+
+def fallback_model(stage: str) -> Optional[str]:
+    """
+    Modelo de fallback da etapa (HEDGE_FALLBACK_<ETAPA>, nome ou model_id),
+    desde que esteja cadastrado em ai_models com o tipo da etapa.
+    """
+    configured = os.getenv(f'HEDGE_FALLBACK_{stage.upper()}')
+    if not configured:
+        return None
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT model_id FROM ai_models
+            WHERE (model_id = ? OR name = ?) AND model_type = ?
+            LIMIT 1
+        ''', (configured, configured, STAGE_MODEL_TYPES.get(stage, stage)))
+        row = cursor.fetchone()
+    if not row:
+        logger.warning(f"[HEDGE] Modelo de fallback {configured} não encontrado em ai_models para a etapa {stage}")
+        return None
+    return row[0]
+
+def _timed(stage: str, call: Callable[[Deadline, Optional[str]], Any], deadline: Optional[Deadline],
+           model: Optional[str]) -> Any:
+    start = time.monotonic()
+    result = call(deadline, model)
+    histogram(stage).record(time.monotonic() - start)
+    return result
+
+def run_hedged(stage: str, call: Callable[[Deadline, Optional[str]], Any],
+               deadline: Optional[Deadline] = None, model: Optional[str] = None) -> Any:
+    """
+    Executa call(deadline, model) com a política de hedging da etapa.
+
+    Sem hedging ativo para a etapa, apenas chama e registra a latência.
+    Com hedging, cada tentativa recebe um deadline filho que aborta a chamada
+    em andamento quando a outra tentativa vence. Se o circuito do modelo
+    estiver aberto (ver circuit_breaker.py), usa o modelo de fallback da etapa.
+    """
+    if model and circuit_breaker.is_open(model):
+        alternative = fallback_model(stage)
+        if alternative and not circuit_breaker.is_open(alternative):
+            logger.info(f"[HEDGE] {stage}: circuito do modelo {model} aberto, usando {alternative}")
+            model = alternative
+    delay = hedge_delay(stage)
+    if delay is None:
+        budget(stage).record(False)
+        return _timed(stage, call, deadline, model)
+
+    parent = deadline or Deadline()
+    attempts = {}
+    primary = parent.child(abort_in_flight=True)
+    attempts[_executor.submit(_timed, stage, call, primary, model)] = primary
+
+    done, _ = wait(attempts, timeout=delay)
+    hedged = False
+    if not done and not parent.is_set() and budget(stage).can_hedge():
+        hedged = True
+        hedge_model = fallback_model(stage) or model
+        logger.info(f"[HEDGE] {stage}: sem resposta após {delay:.1f}s (p{HEDGE_PERCENTILE:.0f}), "
+                    f"disparando segunda chamada ({hedge_model})")
+        secondary = parent.child(abort_in_flight=True)
+        attempts[_executor.submit(_timed, stage, call, secondary, hedge_model)] = secondary
+    budget(stage).record(hedged)
+
+    pending = set(attempts)
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # Cancela a tentativa perdedora (fecha a conexão em andamento)
+                for other in pending:
+                    attempts[other].cancel()
+                if hedged:
+                    winner = 'hedge' if attempts[future] is not primary else 'primária'
+                    logger.info(f"[HEDGE] {stage}: chamada {winner} respondeu primeiro")
+                return future.result()
+            error = future.exception()
+    raise error
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Chaves de idempotência e coalescência (single-flight) de requisições caras.
+
+Cada requisição protegida tem uma chave e uma impressão digital (hash do corpo):
+- Com o cabeçalho Idempotency-Key, a chave é a informada pelo cliente e a
+  resposta fica guardada por IDEMPOTENCY_TTL: repetições devolvem a mesma
+  resposta sem refazer a geração; a mesma chave com outro corpo é recusada.
+- Sem o cabeçalho, a chave é derivada do próprio corpo (single-flight): uma
+  requisição idêntica que chega enquanto outra está em andamento aguarda e
+  recebe o mesmo resultado. A resposta fica guardada só por SINGLE_FLIGHT_TTL.
+
+A posse da execução é uma linha em request_keys com lease renovado
+periodicamente, então a coalescência vale entre workers do gunicorn; se o
+processo dono morrer, o lease vence e uma das requisições em espera assume.
+Respostas com erro 5xx não são guardadas, para que uma nova tentativa refaça
+o trabalho.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .deadline import GENERATION_DEADLINE
+from ..database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+STATUS_IN_PROGRESS = 'in_progress'
+STATUS_COMPLETED = 'completed'
+
+# Tempo (segundos) que a resposta de uma requisição com Idempotency-Key fica guardada
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', str(24 * 3600)))
+
+# Tempo (segundos) que a resposta de uma execução coalescida fica guardada (cliques repetidos)
+SINGLE_FLIGHT_TTL = int(os.getenv('SINGLE_FLIGHT_TTL', '10'))
+
+# Lease da execução em andamento; renovado a cada terço enquanto a execução continua
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '30'))
+
+# Tempo máximo que uma requisição idêntica aguarda a execução em andamento
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', str(GENERATION_DEADLINE)))
+
+# Intervalo entre as consultas de quem aguarda
+IDEMPOTENCY_POLL_INTERVAL = float(os.getenv('IDEMPOTENCY_POLL_INTERVAL', '0.5'))
+
+OWNER_PREFIX = f"{socket.gethostname()}-{os.getpid()}"
+
+class IdempotencyConflict(Exception):
+    """A mesma chave de idempotência foi usada com outro corpo de requisição."""
+
+class RequestInProgress(Exception):
+    """A execução idêntica em andamento não terminou dentro do tempo de espera."""
+
+def fingerprint(payload: Any) -> str:
+    """Hash SHA-256 do corpo da requisição em JSON canônico."""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def _acquire(key: str, request_fingerprint: str, owner: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Tenta assumir a execução da chave.
+
+    Returns:
+        ('owner', None), ('completed', linha) ou ('waiting', linha)
+    """
+    now = time.time()
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        # Respostas vencidas liberam as chaves
+        cursor.execute('''
+            DELETE FROM request_keys
+            WHERE status = ? AND expires_at < ?
+        ''', (STATUS_COMPLETED, now))
+        cursor.execute('''
+            INSERT OR IGNORE INTO request_keys (key, fingerprint, status, owner, lease_expires_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (key, request_fingerprint, STATUS_IN_PROGRESS, owner, now + IDEMPOTENCY_LEASE_SECONDS))
+        if cursor.rowcount == 1:
+            conn.commit()
+            return 'owner', None
+
+        # Dono anterior sem renovar o lease (processo interrompido): assume a execução
+        cursor.execute('''
+            UPDATE request_keys
+            SET owner = ?, lease_expires_at = ?
+            WHERE key = ? AND fingerprint = ? AND status = ? AND lease_expires_at < ?
+        ''', (owner, now + IDEMPOTENCY_LEASE_SECONDS, key, request_fingerprint, STATUS_IN_PROGRESS, now))
+        conn.commit()
+        if cursor.rowcount == 1:
+            logger.info(f"[IDEMPOTENCY] Lease vencido da chave {key}: execução assumida por {owner}")
+            return 'owner', None
+
+        cursor.execute('SELECT * FROM request_keys WHERE key = ?', (key,))
+        row = cursor.fetchone()
+
+    if row is None:
+        # Liberada entre as consultas (ex.: execução anterior falhou): tenta de novo
+        return _acquire(key, request_fingerprint, owner)
+    row = dict(row)
+    if row['fingerprint'] != request_fingerprint:
+        raise IdempotencyConflict(f"Chave {key} já usada com outro corpo de requisição")
+    return ('completed' if row['status'] == STATUS_COMPLETED else 'waiting'), row
+
+def _renew(key: str, owner: str) -> bool:
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE request_keys SET lease_expires_at = ?
+            WHERE key = ? AND owner = ? AND status = ?
+        ''', (time.time() + IDEMPOTENCY_LEASE_SECONDS, key, owner, STATUS_IN_PROGRESS))
+        conn.commit()
+        return cursor.rowcount == 1
+
+def _complete(key: str, owner: str, status_code: int, body: str, mimetype: str, ttl: int):
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE request_keys
+            SET status = ?, status_code = ?, response = ?, mimetype = ?, lease_expires_at = NULL,
+                expires_at = ?, completed_at = CURRENT_TIMESTAMP
+            WHERE key = ? AND owner = ?
+        ''', (STATUS_COMPLETED, status_code, body, mimetype, time.time() + ttl, key, owner))
+        conn.commit()
+
+def _release(key: str, owner: str):
+    """Libera a chave sem guardar resposta (a próxima requisição refaz a execução)."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM request_keys WHERE key = ? AND owner = ? AND status = ?',
+                       (key, owner, STATUS_IN_PROGRESS))
+        conn.commit()
+
+class _LeaseRenewer(threading.Thread):
+    """Renova o lease da chave enquanto a execução está em andamento."""
+
+    def __init__(self, key: str, owner: str):
+        super().__init__(daemon=True)
+        self.key = key
+        self.owner = owner
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.wait(max(1.0, IDEMPOTENCY_LEASE_SECONDS / 3)):
+            try:
+                if not _renew(self.key, self.owner):
+                    return
+            except Exception as e:
+                logger.error(f"[IDEMPOTENCY] Erro ao renovar lease da chave {self.key}: {str(e)}")
+
+    def stop(self):
+        self.finished.set()
+
+def _stored(row: Dict[str, Any]) -> Tuple[int, str, str]:
+    return row['status_code'], row['response'], row['mimetype'] or 'application/json'
+
+def run_once(key: str, request_fingerprint: str, compute: Callable[[], Tuple[int, str, str]],
+             ttl: int = IDEMPOTENCY_TTL, wait_timeout: float = IDEMPOTENCY_WAIT_SECONDS) -> Tuple[int, str, str, bool]:
+    """
+    Executa `compute` uma única vez por chave, entre requisições e processos.
+
+    Args:
+        compute: Função que gera a resposta: (status HTTP, corpo, mimetype)
+        ttl: Segundos que a resposta fica guardada para repetições
+
+    Returns:
+        (status HTTP, corpo, mimetype, reaproveitada) - reaproveitada=True quando a
+        resposta veio de outra execução (guardada ou em andamento)
+
+    Raises:
+        IdempotencyConflict: chave já usada com outro corpo
+        RequestInProgress: execução idêntica não terminou dentro de wait_timeout
+    """
+    owner = f"{OWNER_PREFIX}-{uuid.uuid4().hex[:8]}"
+    waited_since = time.monotonic()
+    while True:
+        state, row = _acquire(key, request_fingerprint, owner)
+        if state == 'completed':
+            logger.info(f"[IDEMPOTENCY] Resposta guardada reaproveitada para a chave {key}")
+            return (*_stored(row), True)
+        if state == 'owner':
+            break
+        if time.monotonic() - waited_since >= wait_timeout:
+            raise RequestInProgress(f"Requisição idêntica ainda em andamento (chave {key})")
+        time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+    if time.monotonic() - waited_since > IDEMPOTENCY_POLL_INTERVAL:
+        logger.info(f"[IDEMPOTENCY] Execução idêntica da chave {key} terminou sem resposta guardada; "
+                    f"executando novamente")
+    renewer = _LeaseRenewer(key, owner)
+    renewer.start()
+    try:
+        status_code, body, mimetype = compute()
+    except BaseException:
+        _release(key, owner)
+        raise
+    finally:
+        renewer.stop()
+
+    if status_code >= 500:
+        _release(key, owner)
+    else:
+        _complete(key, owner, status_code, body, mimetype, ttl)
+    return status_code, body, mimetype, False
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pipeline de ingestão de documentos em segundo plano, com checkpoints.
+
+Cada documento de um lote vira um job (INGEST_JOB_TYPE) executado pelos
+processos de worker.py, então o número de documentos processados ao mesmo
+tempo é limitado por JOB_WORKERS. Os estágios são:
+
+    hashed -> extracted -> segmented -> classified -> persisted -> summarized
+
+O último estágio concluído de cada documento fica em ingestion_documents e
+o de cada tópico em ingestion_topics. Se o worker morrer no meio do lote, o
+lease do job vence, outro worker retoma o job e pula o que já foi feito: o
+texto vem do cache de extração, os chunks de document_chunks, as fronteiras
+de topic_boundaries e os tópicos já gravados (ou resumidos) não são refeitos.
+
+Um documento cujo conteúdo (SHA-256) já foi processado, com outro nome ou com
+o mesmo, recebe uma cópia dos tópicos e resumos e termina logo após o estágio
+hashed (ver upload_store.py).
+"""
+
+import json
+import uuid
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import job_queue
+from .circuit_breaker import CircuitOpenError
+from ..database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+INGEST_JOB_TYPE = 'ingest'
+
+STAGE_QUEUED = 'queued'
+STAGE_HASHED = 'hashed'
+STAGE_EXTRACTED = 'extracted'
+STAGE_SEGMENTED = 'segmented'
+STAGE_CLASSIFIED = 'classified'
+STAGE_PERSISTED = 'persisted'
+STAGE_SUMMARIZED = 'summarized'
+
+STAGES = (STAGE_QUEUED, STAGE_HASHED, STAGE_EXTRACTED, STAGE_SEGMENTED,
+          STAGE_CLASSIFIED, STAGE_PERSISTED, STAGE_SUMMARIZED)
+
+# Tópicos gravados por transação no estágio persisted
+PERSIST_BATCH_SIZE = 50
+
+def create_batch(documents: List[Tuple[str, str]], summarize: bool = False,
+                 user_id: Optional[int] = None) -> str:
+    """
+    Registra um lote de documentos e enfileira um job de ingestão por documento.
+
+    Args:
+        documents: (título do documento, caminho do PDF) de cada documento
+
+    Returns:
+        ID do lote
+    """
+    batch_id = uuid.uuid4().hex
+    for document_title, pdf_path in documents:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO ingestion_documents (batch_id, document_title, pdf_path, summarize, created_by)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (batch_id, document_title, pdf_path, int(summarize), user_id))
+            ingestion_id = cursor.lastrowid
+            conn.commit()
+        job_id = job_queue.enqueue_job(INGEST_JOB_TYPE, {
+            'ingestion_id': ingestion_id,
+            'batch_id': batch_id,
+            'document_title': document_title
+        }, user_id=user_id)
+        _checkpoint(ingestion_id, job_id=job_id)
+    logger.info(f"[INGESTION] Lote {batch_id} criado com {len(documents)} documentos")
+    return batch_id
+
+def load_document(ingestion_id: int) -> Optional[Dict[str, Any]]:
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM ingestion_documents WHERE id = ?', (ingestion_id,))
+        row = cursor.fetchone()
+    return dict(row) if row else None
+
+def _effective_status(document: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """
+    Status e erro do documento. Enquanto ingest_document não gravou um status final,
+    vale o do job: jobs cancelados na fila ou que esgotaram as tentativas
+    (claim_next_job) terminam sem passar pelo handler.
+    """
+    status, error = document['status'], document['error']
+    if status not in job_queue.FINAL_STATUSES and document['job_status']:
+        status = document['job_status']
+        error = error or document['job_error']
+    return status, error
+
+def batch_status(batch_id: str, user_id: Optional[int], is_admin: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Estágio e progresso de cada documento do lote.
+    Lotes de outros usuários (exceto para administradores) retornam None, como os jobs.
+    """
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT d.*, j.status AS job_status, j.error AS job_error
+            FROM ingestion_documents d
+            LEFT JOIN generation_jobs j ON j.id = d.job_id
+            WHERE d.batch_id = ? AND (? OR d.created_by = ?)
+            ORDER BY d.id
+        ''', (batch_id, 1 if is_admin else 0, user_id))
+        documents = [dict(row) for row in cursor.fetchall()]
+    if not documents:
+        return None
+    for document in documents:
+        document['status'], document['error'] = _effective_status(document)
+
+    statuses = {document['status'] for document in documents}
+    if statuses & {job_queue.STATUS_QUEUED, job_queue.STATUS_RUNNING}:
+        status = job_queue.STATUS_RUNNING if job_queue.STATUS_RUNNING in statuses else job_queue.STATUS_QUEUED
+    elif statuses == {job_queue.STATUS_COMPLETED}:
+        status = job_queue.STATUS_COMPLETED
+    else:
+        status = job_queue.STATUS_FAILED if job_queue.STATUS_FAILED in statuses else job_queue.STATUS_CANCELLED
+
+    return {
+        'batch_id': batch_id,
+        'status': status,
+        'total': len(documents),
+        'completed': sum(1 for document in documents if document['status'] == job_queue.STATUS_COMPLETED),
+        'documents': [{
+            'document_title': document['document_title'],
+            'job_id': document['job_id'],
+            'status': document['status'],
+            'stage': document['stage'],
+            'document_sha256': document['document_sha256'],
+            'topics_total': document['topics_total'],
+            'topics_persisted': document['topics_persisted'],
+            'topics_summarized': document['topics_summarized'],
+            'summarize': bool(document['summarize']),
+            'error': document['error'],
+            'updated_at': document['updated_at']
+        } for document in documents]
+    }
+
+def _checkpoint(ingestion_id: int, **fields):
+    """Atualiza o documento (estágio, contadores, status) em ingestion_documents."""
+    assignments = ', '.join(f'{column} = ?' for column in fields)
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            UPDATE ingestion_documents SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+        ''', (*fields.values(), ingestion_id))
+        conn.commit()
+
+def _reached(document: Dict[str, Any], stage: str) -> bool:
+    return STAGES.index(document['stage']) >= STAGES.index(stage)
+
+def _count_topics(cursor, ingestion_id: int, stages: Tuple[str, ...]) -> int:
+    cursor.execute(f'''
+        SELECT COUNT(*) FROM ingestion_topics
+        WHERE ingestion_id = ? AND stage IN ({', '.join('?' * len(stages))})
+    ''', (ingestion_id, *stages))
+    return cursor.fetchone()[0]
+
+def _classify(document: Dict[str, Any], boundaries: List[Dict[str, Any]]):
+    """Cria os checkpoints dos tópicos com os domínios; repetições do mesmo marcador são ignoradas."""
+    from ..utils.domain_classifier import load_domain_classifier
+    from ..utils.pdf_utils import extract_pdf_document
+
+    seen = set()
+    topics = []
+    for boundary in boundaries:
+        if boundary['label'] in seen:
+            continue
+        seen.add(boundary['label'])
+        topics.append(boundary)
+
+    # Todos os tópicos do documento de uma vez (texto do cache de extração)
+    text = extract_pdf_document(document['pdf_path']).text
+    blocks = [{'title': boundary['title'], 'content': text[boundary['start_offset']:boundary['end_offset']]}
+              for boundary in topics]
+    classified = load_domain_classifier().classify_document(blocks, document['document_title'])
+    rows = [(document['id'], boundary['position'], boundary['label'],
+             json.dumps(domains, ensure_ascii=False), STAGE_CLASSIFIED)
+            for boundary, domains in zip(topics, classified)]
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT OR IGNORE INTO ingestion_topics (ingestion_id, position, topic, domains, stage)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+    return len(rows)
+
+def _persist(document: Dict[str, Any], stop_event: threading.Event) -> bool:
+    """
+    Grava o conteúdo dos tópicos em topic_summaries (como /api/process-documents).
+    Cada tópico e o seu checkpoint são gravados na mesma transação.
+
+    Returns:
+        False se a execução foi interrompida
+    """
+    from ..utils.domain_classifier import domain_keys
+    from ..utils.pdf_utils import iter_pdf_pages
+    from ..utils.topic_segmenter import segment_topics
+
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT position, topic, domains FROM ingestion_topics
+            WHERE ingestion_id = ? AND stage = ?
+        ''', (document['id'], STAGE_CLASSIFIED))
+        pending = {row['position']: dict(row) for row in cursor.fetchall()}
+    if not pending:
+        return True
+
+    # Segmentação de novo, em streaming (texto do cache): as posições são as mesmas de topic_boundaries
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        in_transaction = 0
+        for position, block in enumerate(segment_topics(iter_pdf_pages(document['pdf_path']))):
+            topic = pending.pop(position, None)
+            if topic is None:
+                continue
+            cursor.execute('SELECT id FROM topic_summaries WHERE document_title = ? AND topic = ?',
+                           (document['document_title'], topic['topic']))
+            existing = cursor.fetchone()
+            if existing:
+                summary_id = existing[0]
+            else:
+                cursor.execute('''
+                    INSERT INTO topic_summaries (
+                        document_title, topic, summary, key_points,
+                        practical_examples, pmbok_references, domains, domain_keys, created_at
+                    ) VALUES (?, ?, ?, '[]', '[]', '[]', ?, ?, CURRENT_TIMESTAMP)
+                ''', (document['document_title'], topic['topic'], block.content, topic['domains'],
+                      json.dumps(domain_keys(json.loads(topic['domains'])))))
+                summary_id = cursor.lastrowid
+            cursor.execute('''
+                UPDATE ingestion_topics SET stage = ?, summary_id = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE ingestion_id = ? AND position = ?
+            ''', (STAGE_PERSISTED, summary_id, document['id'], position))
+            in_transaction += 1
+            if in_transaction >= PERSIST_BATCH_SIZE or not pending:
+                conn.commit()
+                in_transaction = 0
+                _checkpoint(document['id'], topics_persisted=_count_topics(
+                    cursor, document['id'], (STAGE_PERSISTED, STAGE_SUMMARIZED)))
+                if stop_event.is_set():
+                    return False
+            if not pending:
+                break
+        conn.commit()
+    return True
+
+def _summarize(document: Dict[str, Any], stop_event: threading.Event) -> bool:
+    """
+    Gera os resumos dos tópicos gravados em paralelo (ver topic_summarizer),
+    marcando o checkpoint de cada tópico à medida que os lotes são gravados.
+    """
+    from .topic_summarizer import STATUS_FAILED, summarize_document
+
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT position, topic FROM ingestion_topics
+            WHERE ingestion_id = ? AND stage = ? ORDER BY position
+        ''', (document['id'], STAGE_PERSISTED))
+        pending = [dict(row) for row in cursor.fetchall()]
+    if not pending:
+        return True
+
+    def on_saved(results):
+        rows = [(STAGE_SUMMARIZED, result['summary_id'], document['id'], result['topic'])
+                for result in results if result['status'] != STATUS_FAILED]
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                UPDATE ingestion_topics SET stage = ?, summary_id = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE ingestion_id = ? AND topic = ?
+            ''', rows)
+            conn.commit()
+            summarized = _count_topics(cursor, document['id'], (STAGE_SUMMARIZED,))
+        _checkpoint(document['id'], topics_summarized=summarized)
+
+    result = summarize_document(document['document_title'], document['pdf_path'],
+                                topics=[topic['topic'] for topic in pending],
+                                stop_event=stop_event, on_saved=on_saved)
+    if result['cancelled']:
+        return False
+    if result['failed']:
+        raise ValueError(f"Falha ao gerar o resumo de {result['failed']} tópicos")
+    return True
+
+def _reuse_processed(document: Dict[str, Any]) -> Optional[Dict[str, int]]:
+    """
+    Se o conteúdo já foi processado (com outro nome ou com este), copia os tópicos e
+    resumos (ver upload_store) e retorna as contagens para pular os estágios restantes.
+    Retorna None se ainda falta algum tópico (ou resumo, com summarize); os estágios
+    normais aproveitam o que foi copiado.
+    """
+    from .topic_boundaries import load_boundaries
+    from .upload_store import copy_processed_topics
+    from ..utils.pdf_utils import SUMMARY_PROMPT_VERSION
+
+    boundaries = load_boundaries(document['document_sha256'])
+    if not boundaries:
+        return None
+    copy_processed_topics(document['document_sha256'], document['document_title'])
+
+    labels = {boundary['label'] for boundary in boundaries}
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT topic, source_sha256, prompt_version FROM topic_summaries WHERE document_title = ?
+        ''', (document['document_title'],))
+        stored = {row['topic']: row for row in cursor.fetchall() if row['topic'] in labels}
+    if len(stored) < len(labels):
+        return None
+    summarized = sum(1 for row in stored.values()
+                     if row['source_sha256'] and row['prompt_version'] == SUMMARY_PROMPT_VERSION)
+    if document['summarize'] and summarized < len(labels):
+        return None
+    return {'topics_total': len(labels), 'topics_persisted': len(labels), 'topics_summarized': summarized}
+
+def _finish(ingestion_id: int, status: str) -> str:
+    _checkpoint(ingestion_id, status=status)
+    return status
+
+def ingest_document(job: Dict[str, Any], worker_id: str, stop_event: threading.Event) -> str:
+    """
+    Executa os estágios que faltam do documento do job.
+
+    Returns:
+        Status final do job (completed ou cancelled)
+    """
+    from ..utils.extraction_cache import content_hash
+    from ..utils.pdf_utils import extract_pdf_document
+    from .document_chunks import document_chunks
+    from .topic_boundaries import document_boundaries
+
+    ingestion_id = job['params']['ingestion_id']
+    document = load_document(ingestion_id)
+    if document is None:
+        raise ValueError(f"Documento de ingestão {ingestion_id} não encontrado")
+    if document['stage'] != STAGE_QUEUED:
+        logger.info(f"[INGESTION] Retomando {document['document_title']} após o estágio {document['stage']}")
+    _checkpoint(ingestion_id, status=job_queue.STATUS_RUNNING, job_id=job['id'], error=None)
+
+    def advance(stage: str, **fields):
+        document.update(fields, stage=stage)
+        _checkpoint(ingestion_id, stage=stage, **fields)
+        job_queue.heartbeat(job['id'], worker_id, {'stage': stage, **fields})
+        logger.info(f"[INGESTION] {document['document_title']}: estágio {stage} concluído")
+
+    try:
+        if not _reached(document, STAGE_HASHED):
+            advance(STAGE_HASHED, document_sha256=content_hash(document['pdf_path']))
+
+        # Conteúdo já processado: nada a extrair, gravar ou resumir
+        final_stage = STAGE_SUMMARIZED if document['summarize'] else STAGE_PERSISTED
+        if not _reached(document, final_stage):
+            reused = _reuse_processed(document)
+            if reused:
+                logger.info(f"[INGESTION] {document['document_title']}: conteúdo já processado "
+                            f"({document['document_sha256'][:12]}), estágios restantes pulados")
+                advance(final_stage, **reused)
+                return _finish(ingestion_id, job_queue.STATUS_COMPLETED)
+
+        if not _reached(document, STAGE_EXTRACTED):
+            extract_pdf_document(document['pdf_path'])
+            # Chunks (só as posições no texto extraído) guardados por hash do conteúdo
+            _, chunks = document_chunks(document['pdf_path'])
+            logger.info(f"[INGESTION] {document['document_title']}: {len(chunks)} chunks")
+            advance(STAGE_EXTRACTED)
+
+        if stop_event.is_set():
+            return _finish(ingestion_id, job_queue.STATUS_CANCELLED)
+
+        # Fronteiras guardadas por hash: numa retomada, não há nova segmentação
+        _, boundaries = document_boundaries(document['pdf_path'])
+        if not _reached(document, STAGE_SEGMENTED):
+            advance(STAGE_SEGMENTED, topics_total=len(boundaries))
+
+        if not _reached(document, STAGE_CLASSIFIED):
+            advance(STAGE_CLASSIFIED, topics_total=_classify(document, boundaries))
+
+        if not _reached(document, STAGE_PERSISTED):
+            if not _persist(document, stop_event):
+                return _finish(ingestion_id, job_queue.STATUS_CANCELLED)
+            advance(STAGE_PERSISTED)
+
+        if document['summarize'] and not _reached(document, STAGE_SUMMARIZED):
+            if not _summarize(document, stop_event):
+                return _finish(ingestion_id, job_queue.STATUS_CANCELLED)
+            advance(STAGE_SUMMARIZED)
+
+        return _finish(ingestion_id, job_queue.STATUS_COMPLETED)
+
+    except CircuitOpenError:
+        # Modelo de resumos indisponível: o job volta para a fila e retoma do mesmo ponto
+        _checkpoint(ingestion_id, status=job_queue.STATUS_QUEUED)
+        raise
+    except Exception as e:
+        _checkpoint(ingestion_id, status=job_queue.STATUS_FAILED, error=str(e))
+        raise
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Fila persistente de jobs (SQLite) para tarefas longas de geração.
+
+As rotas web apenas enfileiram e consultam jobs; a execução acontece nos
+processos iniciados por worker.py.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+from typing import Dict, List, Optional, Any
+
+from ..database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+FINAL_STATUSES = (STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED)
+
+# Tempo (segundos) que um worker mantém a posse de um job sem renovar o lease.
+# Jobs com lease vencido são retomados por outro worker.
+LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '120'))
+
+# Número máximo de tentativas antes de marcar o job como falho
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+def _row_to_job(row) -> Dict[str, Any]:
+    """Converte uma linha da tabela generation_jobs em dicionário."""
+    return {
+        'id': row['id'],
+        'job_type': row['job_type'],
+        'status': row['status'],
+        'params': json.loads(row['params']) if row['params'] else {},
+        'progress': json.loads(row['progress']) if row['progress'] else {},
+        'results': json.loads(row['results']) if row['results'] else [],
+        'error': row['error'],
+        'attempts': row['attempts'],
+        'cancel_requested': bool(row['cancel_requested']),
+        'created_by': row['created_by'],
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at']
+    }
+
+def enqueue_job(job_type: str, params: Dict[str, Any], user_id: Optional[int] = None) -> str:
+    """Cria um novo job na fila e retorna seu ID."""
+    job_id = uuid.uuid4().hex
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO generation_jobs (id, job_type, status, params, created_by)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (job_id, job_type, STATUS_QUEUED, json.dumps(params, ensure_ascii=False), user_id))
+        conn.commit()
+    logger.info(f"[JOBS] Job {job_id} ({job_type}) enfileirado: {params}")
+    return job_id
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Retorna um job pelo ID."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM generation_jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        return _row_to_job(row) if row else None
+
+def can_access_job(job: Dict[str, Any], user_id: Optional[int], is_admin: bool = False) -> bool:
+    """Só quem criou o job (ou um administrador) pode consultá-lo ou cancelá-lo."""
+    return is_admin or (user_id is not None and job.get('created_by') == user_id)
+
+def get_user_job(job_id: str, user_id: Optional[int], is_admin: bool = False) -> Optional[Dict[str, Any]]:
+    """Retorna o job se o usuário puder acessá-lo (ver can_access_job); senão None."""
+    job = get_job(job_id)
+    if not job or not can_access_job(job, user_id, is_admin):
+        return None
+    return job
+
+def cancel_job(job_id: str, user_id: Optional[int], is_admin: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Solicita o cancelamento de um job do usuário (ou de qualquer job, para administradores).
+    Jobs ainda na fila são cancelados imediatamente; jobs em execução são
+    interrompidos pelo worker na próxima verificação.
+
+    Returns:
+        O job atualizado, ou None se não existir ou pertencer a outro usuário
+    """
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE generation_jobs
+            SET status = CASE WHEN status = ? THEN ? ELSE status END,
+                cancel_requested = 1,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status NOT IN (?, ?, ?) AND (? OR created_by = ?)
+        ''', (STATUS_QUEUED, STATUS_CANCELLED, job_id, *FINAL_STATUSES, 1 if is_admin else 0, user_id))
+        conn.commit()
+    job = get_user_job(job_id, user_id, is_admin)
+    if job:
+        logger.info(f"[JOBS] Cancelamento solicitado para o job {job_id}")
+    return job
+
+def claim_next_job(worker_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Reserva o próximo job disponível para o worker.
+
+    Considera jobs na fila e jobs em execução cujo lease expirou (worker
+    interrompido), permitindo retomar jobs pela metade após um restart.
+    """
+    now = time.time()
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        # Jobs cancelados cujo worker morreu antes de perceber o cancelamento
+        cursor.execute('''
+            UPDATE generation_jobs
+            SET status = ?, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE status = ? AND cancel_requested = 1 AND lease_expires_at < ?
+        ''', (STATUS_CANCELLED, STATUS_RUNNING, now))
+
+        # Um único UPDATE é atômico no SQLite, então dois workers nunca
+        # reservam o mesmo job.
+        cursor.execute('''
+            UPDATE generation_jobs
+            SET status = ?,
+                worker_id = ?,
+                lease_expires_at = ?,
+                attempts = attempts + 1,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM generation_jobs
+                WHERE cancel_requested = 0
+                  AND (status = ? OR (status = ? AND lease_expires_at < ?))
+                ORDER BY created_at
+                LIMIT 1
+            )
+        ''', (STATUS_RUNNING, worker_id, now + LEASE_SECONDS,
+              STATUS_QUEUED, STATUS_RUNNING, now))
+        conn.commit()
+
+        if cursor.rowcount == 0:
+            return None
+
+        cursor.execute('''
+            SELECT * FROM generation_jobs
+            WHERE worker_id = ? AND status = ?
+            ORDER BY updated_at DESC
+            LIMIT 1
+        ''', (worker_id, STATUS_RUNNING))
+        row = cursor.fetchone()
+
+    if not row:
+        return None
+
+    job = _row_to_job(row)
+    if job['attempts'] > MAX_ATTEMPTS:
+        logger.error(f"[JOBS] Job {job['id']} excedeu {MAX_ATTEMPTS} tentativas")
+        finish_job(job['id'], worker_id, STATUS_FAILED, error='Número máximo de tentativas excedido')
+        return None
+
+    if job['attempts'] > 1:
+        logger.info(f"[JOBS] Retomando job {job['id']} (tentativa {job['attempts']}, "
+                    f"{len(job['results'])} resultados já salvos)")
+    else:
+        logger.info(f"[JOBS] Job {job['id']} reservado pelo worker {worker_id}")
+    return job
+
+def heartbeat(job_id: str, worker_id: str, progress: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Renova o lease do job e opcionalmente atualiza o progresso.
+
+    Returns:
+        True se o worker ainda deve continuar executando o job
+        (não perdeu o lease e não houve pedido de cancelamento).
+    """
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        if progress is not None:
+            cursor.execute('''
+                UPDATE generation_jobs
+                SET lease_expires_at = ?, progress = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND worker_id = ? AND status = ?
+            ''', (time.time() + LEASE_SECONDS, json.dumps(progress, ensure_ascii=False),
+                  job_id, worker_id, STATUS_RUNNING))
+        else:
+            cursor.execute('''
+                UPDATE generation_jobs
+                SET lease_expires_at = ?
+                WHERE id = ? AND worker_id = ? AND status = ?
+            ''', (time.time() + LEASE_SECONDS, job_id, worker_id, STATUS_RUNNING))
+        conn.commit()
+        if cursor.rowcount == 0:
+            return False
+
+        cursor.execute('SELECT cancel_requested FROM generation_jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        return bool(row) and not row[0]
+
+def update_params(job_id: str, worker_id: str, params: Dict[str, Any]):
+    """Persiste parâmetros resolvidos pelo worker (ex.: resumo escolhido)."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE generation_jobs
+            SET params = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND worker_id = ?
+        ''', (json.dumps(params, ensure_ascii=False), job_id, worker_id))
+        conn.commit()
+
+def mark_params(cursor, job_id: str, worker_id: str, **values) -> bool:
+    """
+    Acrescenta valores aos parâmetros do job usando o cursor informado, sem
+    commit (ver append_result): a marca é gravada na mesma transação do trabalho
+    que ela registra.
+    """
+    cursor.execute('''
+        SELECT params FROM generation_jobs
+        WHERE id = ? AND worker_id = ? AND status = ?
+    ''', (job_id, worker_id, STATUS_RUNNING))
+    row = cursor.fetchone()
+    if not row:
+        logger.warning(f"[JOBS] Worker {worker_id} não possui mais o job {job_id}")
+        return False
+
+    params = json.loads(row[0]) if row[0] else {}
+    params.update(values)
+    cursor.execute('''
+        UPDATE generation_jobs
+        SET params = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (json.dumps(params, ensure_ascii=False), job_id))
+    return True
+
+def append_result(cursor, job_id: str, worker_id: str, result: Dict[str, Any],
+                  progress: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Acrescenta um resultado parcial ao job usando o cursor informado.
+    Não faz commit, para que o chamador possa gravar o resultado e o
+    registro associado (ex.: a questão) na mesma transação.
+    """
+    cursor.execute('''
+        SELECT results FROM generation_jobs
+        WHERE id = ? AND worker_id = ? AND status = ?
+    ''', (job_id, worker_id, STATUS_RUNNING))
+    row = cursor.fetchone()
+    if not row:
+        logger.warning(f"[JOBS] Worker {worker_id} não possui mais o job {job_id}")
+        return False
+
+    results = json.loads(row[0]) if row[0] else []
+    results.append(result)
+    cursor.execute('''
+        UPDATE generation_jobs
+        SET results = ?, progress = COALESCE(?, progress),
+            lease_expires_at = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (json.dumps(results, ensure_ascii=False),
+          json.dumps(progress, ensure_ascii=False) if progress is not None else None,
+          time.time() + LEASE_SECONDS, job_id))
+    return True
+
+def finish_job(job_id: str, worker_id: str, status: str, error: Optional[str] = None,
+               progress: Optional[Dict[str, Any]] = None):
+    """Marca o job como concluído, falho ou cancelado."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE generation_jobs
+            SET status = ?, error = ?, progress = COALESCE(?, progress),
+                lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND worker_id = ?
+        ''', (status, error,
+              json.dumps(progress, ensure_ascii=False) if progress is not None else None,
+              job_id, worker_id))
+        conn.commit()
+    logger.info(f"[JOBS] Job {job_id} finalizado com status {status}")
+
+def release_job(job_id: str, worker_id: str, progress: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Devolve o job à fila sem contar a tentativa (ex.: modelo indisponível).
+    Os resultados já salvos são mantidos e a execução é retomada depois.
+    """
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE generation_jobs
+            SET status = ?, worker_id = NULL, lease_expires_at = NULL,
+                attempts = MAX(attempts - 1, 0), progress = COALESCE(?, progress),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND worker_id = ? AND status = ? AND cancel_requested = 0
+        ''', (STATUS_QUEUED,
+              json.dumps(progress, ensure_ascii=False) if progress is not None else None,
+              job_id, worker_id, STATUS_RUNNING))
+        conn.commit()
+        released = cursor.rowcount == 1
+    if released:
+        logger.info(f"[JOBS] Job {job_id} devolvido à fila")
+    return released
+
+def list_jobs(status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """Lista os jobs mais recentes, opcionalmente filtrados por status."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        if status:
+            cursor.execute('''
+                SELECT * FROM generation_jobs WHERE status = ?
+                ORDER BY created_at DESC LIMIT ?
+            ''', (status, limit))
+        else:
+            cursor.execute('''
+                SELECT * FROM generation_jobs ORDER BY created_at DESC LIMIT ?
+            ''', (limit,))
+        return [_row_to_job(row) for row in cursor.fetchall()]
+
+def find_active_job(job_type: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Retorna um job do tipo ainda na fila ou em execução cujos parâmetros contenham `params`."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM generation_jobs
+            WHERE job_type = ? AND status IN (?, ?) AND cancel_requested = 0
+            ORDER BY created_at
+        ''', (job_type, STATUS_QUEUED, STATUS_RUNNING))
+        for row in cursor.fetchall():
+            job = _row_to_job(row)
+            if all(job['params'].get(key) == value for key, value in params.items()):
+                return job
+    return None
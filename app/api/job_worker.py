@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Execução dos jobs da fila persistente (ver job_queue.py).
+"""
+
+import os
+import socket
+import logging
+import threading
+import traceback
+from typing import Callable, Dict, Any, Optional
+
+from . import job_queue, question_inventory, batch_generation, circuit_breaker, ingestion, topic_summarizer
+from .circuit_breaker import CircuitOpenError
+from .deadline import Deadline
+from .question_service import (select_domain_summary, load_summary, insert_question, summary_prompt_context,
+                               save_topic_summary, SUMMARIZE_JOB_TYPE)
+from ..database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '2'))
+
+# Registro de handlers por tipo de job
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any], str, threading.Event], None]] = {}
+
+def job_handler(job_type: str):
+    """Registra a função responsável por executar um tipo de job."""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+class LeaseKeeper(threading.Thread):
+    """
+    Renova periodicamente o lease de um job em execução.
+    Sinaliza `stop_event` quando o job é cancelado ou o lease é perdido.
+    """
+
+    def __init__(self, job_id: str, worker_id: str, stop_event: threading.Event):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.stop_event = stop_event
+        self.finished = threading.Event()
+        self.interval = max(1.0, job_queue.LEASE_SECONDS / 3)
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            try:
+                if not job_queue.heartbeat(self.job_id, self.worker_id):
+                    logger.info(f"[JOB-WORKER] Job {self.job_id} cancelado ou lease perdido")
+                    self.stop_event.set()
+                    return
+            except Exception as e:
+                logger.error(f"[JOB-WORKER] Erro ao renovar lease do job {self.job_id}: {str(e)}")
+
+    def stop(self):
+        self.finished.set()
+
+@job_handler('generate')
+def run_generate_job(job: Dict[str, Any], worker_id: str, stop_event: threading.Event):
+    """Gera as questões de um job, gravando cada uma assim que fica pronta."""
+    from .openai_client import generate_questions, check_generation_available
+
+    job_id = job['id']
+    params = job['params']
+    domain = params['domain']
+    num_questions = int(params.get('num_questions', 5))
+    done = len(job['results'])
+
+    if done >= num_questions:
+        job_queue.finish_job(job_id, worker_id, job_queue.STATUS_COMPLETED)
+        return
+
+    # Com o modelo indisponível o job volta para a fila (ver process_job)
+    check_generation_available()
+
+    # O resumo escolhido é fixado no job para que uma retomada use o mesmo contexto
+    if params.get('summary_id'):
+        summary_data = load_summary(params['summary_id'])
+    else:
+        summary_data = select_domain_summary(domain)
+        if summary_data:
+            params['summary_id'] = summary_data['id']
+            params['used_summaries'] = summary_data['used_summaries']
+            job_queue.update_params(job_id, worker_id, params)
+
+    if not summary_data:
+        job_queue.finish_job(job_id, worker_id, job_queue.STATUS_FAILED,
+                             error='No summary found for domain')
+        return
+
+    summary_id = summary_data['id']
+    progress = {'completed': done, 'total': num_questions, 'stage': 'generating'}
+    job_queue.heartbeat(job_id, worker_id, progress)
+
+    def on_question(question):
+        nonlocal done
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            question['id'] = insert_question(cursor, question, domain, summary_id)
+            progress['completed'] = done + 1
+            if job_queue.append_result(cursor, job_id, worker_id, question, progress):
+                conn.commit()
+                done += 1
+                logger.info(f"[JOB-WORKER] Job {job_id}: questão {done}/{num_questions} salva")
+            else:
+                conn.rollback()
+                stop_event.set()
+
+    generate_questions(
+        topic=domain,
+        num_questions=num_questions - done,
+        api_key=os.getenv('OPENAI_API_KEY'),
+        summary=summary_prompt_context(summary_data),
+        on_question=on_question,
+        deadline=stop_event
+    )
+
+    current = job_queue.get_job(job_id)
+    if done < num_questions and not (current and current['cancel_requested']):
+        # Interrompido pelo circuito aberto: retoma as questões que faltam quando o modelo voltar
+        check_generation_available()
+    progress['stage'] = 'finished'
+    if current and current['cancel_requested']:
+        job_queue.finish_job(job_id, worker_id, job_queue.STATUS_CANCELLED, progress=progress)
+    elif done == 0:
+        job_queue.finish_job(job_id, worker_id, job_queue.STATUS_FAILED,
+                             error='Failed to generate questions', progress=progress)
+    else:
+        error = None
+        if done < num_questions:
+            error = f'Apenas {done} de {num_questions} questões foram geradas'
+        job_queue.finish_job(job_id, worker_id, job_queue.STATUS_COMPLETED,
+                             error=error, progress=progress)
+
+@job_handler(question_inventory.REFILL_JOB_TYPE)
+def run_refill_inventory_job(job: Dict[str, Any], worker_id: str, stop_event: threading.Event):
+    """Gera questões para o estoque do domínio até atingir INVENTORY_TARGET (no máximo um lote)."""
+    from .openai_client import generate_questions, check_generation_available
+
+    job_id = job['id']
+    domain = job['params']['domain']
+    missing = question_inventory.INVENTORY_TARGET - question_inventory.stock_level(domain)
+    num_questions = min(missing, question_inventory.INVENTORY_REFILL_BATCH)
+
+    if num_questions <= 0:
+        job_queue.finish_job(job_id, worker_id, job_queue.STATUS_COMPLETED)
+        return
+
+    check_generation_available()
+    summary_data = select_domain_summary(domain)
+    if not summary_data:
+        job_queue.finish_job(job_id, worker_id, job_queue.STATUS_FAILED,
+                             error='No summary found for domain')
+        return
+
+    added = 0
+    progress = {'completed': 0, 'total': num_questions, 'stage': 'generating'}
+    job_queue.heartbeat(job_id, worker_id, progress)
+
+    def on_question(question):
+        nonlocal added
+        # As questões já passaram pelos validadores em generate_questions
+        question_inventory.add_to_inventory(question, domain, summary_data['id'])
+        added += 1
+        progress['completed'] = added
+        if not job_queue.heartbeat(job_id, worker_id, progress):
+            stop_event.set()
+
+    generate_questions(
+        topic=domain,
+        num_questions=num_questions,
+        api_key=os.getenv('OPENAI_API_KEY'),
+        summary=summary_prompt_context(summary_data),
+        on_question=on_question,
+        deadline=stop_event
+    )
+
+    logger.info(f"[JOB-WORKER] Estoque de {domain}: {added} questões adicionadas")
+    if added < num_questions and not stop_event.is_set():
+        check_generation_available()
+    progress['stage'] = 'finished'
+    job_queue.finish_job(job_id, worker_id,
+                         job_queue.STATUS_COMPLETED if added else job_queue.STATUS_FAILED,
+                         error=None if added else 'Failed to generate questions', progress=progress)
+
+@job_handler(batch_generation.BATCH_JOB_TYPE)
+def run_batch_generate_job(job: Dict[str, Any], worker_id: str, stop_event: threading.Event):
+    """
+    Gera questões pelo Batch API: envia o batch (uma vez), acompanha o status
+    e salva os resultados quando o provedor termina.
+
+    Cada passo é gravado nos parâmetros do job antes do seguinte, para que a
+    retomada depois de uma queda não crie outro batch nem salve as questões de novo:
+    o arquivo enviado (input_file_id), o batch (batch_id, ou procurado pelo
+    metadata.job_id) e os resultados salvos (results_saved).
+    """
+    job_id = job['id']
+    params = job['params']
+    domain = params['domain']
+    api = batch_generation.BatchAPI()
+    try:
+        if not params.get('input_file_id'):
+            model = batch_generation.batch_model()
+            requests = batch_generation.build_batch_requests(domain, int(params.get('num_questions', 100)), model)
+            if not requests:
+                job_queue.finish_job(job_id, worker_id, job_queue.STATUS_FAILED,
+                                     error='No summary found for domain')
+                return
+            input_path = batch_generation.write_jsonl(
+                requests, os.path.join(batch_generation.BATCH_DIR, f'{job_id}_input.jsonl'))
+            params.update({'input_file_id': api.upload_file(input_path), 'model': model, 'requests': len(requests)})
+            job_queue.update_params(job_id, worker_id, params)
+
+        if not params.get('batch_id'):
+            # Queda entre create_batch e update_params: o batch já existe no provedor
+            batch = api.find_batch('job_id', job_id)
+            if batch:
+                logger.info(f"[JOB-WORKER] Job {job_id}: batch {batch['id']} já criado, retomando")
+            else:
+                batch = api.create_batch(params['input_file_id'], metadata={'job_id': job_id, 'domain': domain})
+                logger.info(f"[JOB-WORKER] Job {job_id}: batch {batch['id']} criado com "
+                            f"{params.get('requests')} requisições")
+            params['batch_id'] = batch['id']
+            job_queue.update_params(job_id, worker_id, params)
+
+        batch_id = params['batch_id']
+        progress = {'completed': 0, 'total': params.get('requests', 0), 'stage': 'batch'}
+        while True:
+            batch = api.retrieve_batch(batch_id)
+            counts = batch.get('request_counts') or {}
+            progress.update({'completed': counts.get('completed', 0), 'batch_status': batch['status']})
+            if batch['status'] in batch_generation.TERMINAL_STATUSES:
+                break
+            if not job_queue.heartbeat(job_id, worker_id, progress):
+                stop_event.set()
+            if stop_event.wait(batch_generation.BATCH_POLL_INTERVAL):
+                current = job_queue.get_job(job_id)
+                if current and current['cancel_requested']:
+                    api.cancel_batch(batch_id)
+                    job_queue.finish_job(job_id, worker_id, job_queue.STATUS_CANCELLED, progress=progress)
+                # Sem cancelamento o lease foi perdido: outro worker continua o mesmo batch
+                return
+
+        results = {'saved': 0, 'invalid': 0, 'errors': 0}
+        if params.get('results_saved'):
+            # Questões já salvas antes de uma queda: só falta concluir o job
+            results = dict(params['results_saved'])
+        elif batch.get('output_file_id'):
+            progress['stage'] = 'saving'
+            job_queue.heartbeat(job_id, worker_id, progress)
+            output_text = api.file_content(batch['output_file_id'])
+            # Cópia local dos resultados para auditoria ou reprocessamento
+            os.makedirs(batch_generation.BATCH_DIR, exist_ok=True)
+            with open(os.path.join(batch_generation.BATCH_DIR, f'{job_id}_output.jsonl'), 'w',
+                      encoding='utf-8') as output_file:
+                output_file.write(output_text)
+            results = batch_generation.save_batch_results(domain, output_text, job_id=job_id, worker_id=worker_id)
+            if results is None:
+                # Lease perdido: o worker que assumiu o job salva os resultados
+                return
+        if batch.get('error_file_id'):
+            error_lines = [line for line in api.file_content(batch['error_file_id']).splitlines() if line.strip()]
+            results['errors'] += len(error_lines)
+
+        progress.update(results, stage='finished')
+        if results['saved']:
+            error = None
+            if batch['status'] != 'completed':
+                error = f"Batch terminou com status {batch['status']}"
+            job_queue.finish_job(job_id, worker_id, job_queue.STATUS_COMPLETED, error=error, progress=progress)
+        else:
+            job_queue.finish_job(job_id, worker_id, job_queue.STATUS_FAILED,
+                                 error=f"Nenhuma questão salva (batch {batch['status']})", progress=progress)
+    finally:
+        api.close()
+
+@job_handler(SUMMARIZE_JOB_TYPE)
+def run_summarize_job(job: Dict[str, Any], worker_id: str, stop_event: threading.Event):
+    """
+    Gera e salva o resumo de um tópico (process_topic enfileira este job
+    quando o modelo de resumos está indisponível).
+    """
+    from ..utils.pdf_utils import SUMMARY_PROMPT_VERSION, generate_topic_summary, summary_model
+    from .topic_boundaries import topic_text
+
+    job_id = job['id']
+    params = job['params']
+    circuit_breaker.check([summary_model()])
+
+    progress = {'stage': 'extracting'}
+    job_queue.heartbeat(job_id, worker_id, progress)
+    text = topic_text(params['pdf_path'], params['topic'])
+
+    progress['stage'] = 'summarizing'
+    job_queue.heartbeat(job_id, worker_id, progress)
+    summary_data = generate_topic_summary(params['topic'], text)
+    if not summary_data:
+        job_queue.finish_job(job_id, worker_id, job_queue.STATUS_FAILED,
+                             error='Falha ao gerar resumo do tópico', progress=progress)
+        return
+
+    summary_id = save_topic_summary(params['document_title'], params['topic'], summary_data,
+                                    source_sha256=topic_summarizer.section_sha256(text),
+                                    prompt_version=SUMMARY_PROMPT_VERSION)
+    progress.update(stage='finished', summary_id=summary_id)
+    job_queue.finish_job(job_id, worker_id, job_queue.STATUS_COMPLETED, progress=progress)
+
+@job_handler(topic_summarizer.SUMMARIZE_DOCUMENT_JOB_TYPE)
+def run_summarize_document_job(job: Dict[str, Any], worker_id: str, stop_event: threading.Event):
+    """
+    Gera os resumos de todos os tópicos de um documento. Se o job for
+    interrompido (circuito aberto, lease perdido), a retomada pula os tópicos
+    já resumidos.
+    """
+    from ..utils.pdf_utils import summary_model
+
+    job_id = job['id']
+    params = job['params']
+    circuit_breaker.check([summary_model()])
+
+    progress = {'stage': 'summarizing', 'completed': 0}
+    job_queue.heartbeat(job_id, worker_id, progress)
+
+    def on_saved(results):
+        progress['completed'] += len(results)
+        if not job_queue.heartbeat(job_id, worker_id, progress):
+            stop_event.set()
+
+    result = topic_summarizer.summarize_document(
+        params['document_title'],
+        params['pdf_path'],
+        concurrency=int(params.get('concurrency') or topic_summarizer.SUMMARY_CONCURRENCY),
+        stop_event=stop_event,
+        on_saved=on_saved
+    )
+
+    progress.update(stage='finished', total=result['total'], summarized=result['summarized'],
+                    skipped=result['skipped'], failed=result['failed'])
+    if result['cancelled']:
+        job_queue.finish_job(job_id, worker_id, job_queue.STATUS_CANCELLED, progress=progress)
+    elif result['failed'] and result['failed'] == result['total']:
+        job_queue.finish_job(job_id, worker_id, job_queue.STATUS_FAILED,
+                             error='Falha ao gerar os resumos do documento', progress=progress)
+    else:
+        error = None
+        if result['failed']:
+            error = f"{result['failed']} de {result['total']} tópicos sem resumo"
+        job_queue.finish_job(job_id, worker_id, job_queue.STATUS_COMPLETED, error=error, progress=progress)
+
+@job_handler(ingestion.INGEST_JOB_TYPE)
+def run_ingest_job(job: Dict[str, Any], worker_id: str, stop_event: threading.Event):
+    """Executa (ou retoma a partir do último checkpoint) a ingestão de um documento."""
+    status = ingestion.ingest_document(job, worker_id, stop_event)
+    job_queue.finish_job(job['id'], worker_id, status,
+                         progress={'stage': ingestion.load_document(job['params']['ingestion_id'])['stage']})
+
+def process_job(job: Dict[str, Any], worker_id: str) -> Optional[float]:
+    """
+    Executa um job reservado, garantindo que ele termine em um estado final.
+
+    Se o modelo estiver indisponível (circuito aberto), o job volta para a fila
+    e o retorno é o tempo (segundos) que o worker deve esperar antes de reservar
+    outro job, para não acumular jobs presos em uma dependência fora do ar.
+    """
+    handler = JOB_HANDLERS.get(job['job_type'])
+    if not handler:
+        logger.error(f"[JOB-WORKER] Tipo de job desconhecido: {job['job_type']}")
+        job_queue.finish_job(job['id'], worker_id, job_queue.STATUS_FAILED,
+                             error=f"Tipo de job desconhecido: {job['job_type']}")
+        return
+
+    # Deadline no lugar de um threading.Event: quando o LeaseKeeper sinaliza o
+    # cancelamento, as chamadas ao modelo em andamento também são interrompidas
+    stop_event = Deadline(abort_in_flight=True)
+    keeper = LeaseKeeper(job['id'], worker_id, stop_event)
+    keeper.start()
+    try:
+        handler(job, worker_id, stop_event)
+    except CircuitOpenError as e:
+        logger.warning(f"[JOB-WORKER] Job {job['id']} adiado: {str(e)}")
+        job_queue.release_job(job['id'], worker_id)
+        return e.retry_after
+    except Exception as e:
+        logger.error(f"[JOB-WORKER] Erro ao executar job {job['id']}: {str(e)}")
+        logger.error(f"[JOB-WORKER] Stack trace: {traceback.format_exc()}")
+        job_queue.finish_job(job['id'], worker_id, job_queue.STATUS_FAILED, error=str(e))
+    finally:
+        keeper.stop()
+    return None
+
+def run_worker(worker_id: str = None, stop_event: threading.Event = None):
+    """Loop principal de um worker: reserva e executa jobs até ser interrompido."""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    stop_event = stop_event or threading.Event()
+    logger.info(f"[JOB-WORKER] Worker {worker_id} iniciado")
+
+    while not stop_event.is_set():
+        try:
+            job = job_queue.claim_next_job(worker_id)
+        except Exception as e:
+            logger.error(f"[JOB-WORKER] Erro ao buscar job: {str(e)}")
+            job = None
+
+        if not job:
+            stop_event.wait(POLL_INTERVAL)
+            continue
+
+        wait = process_job(job, worker_id)
+        if wait:
+            stop_event.wait(max(wait, POLL_INTERVAL))
+
+    logger.info(f"[JOB-WORKER] Worker {worker_id} finalizado")
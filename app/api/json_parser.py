@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Extração, reparo e validação do JSON retornado pelos modelos.
+
+As respostas dos modelos frequentemente trazem o JSON dentro de blocos de
+código, com texto antes/depois ou com vírgulas sobrando. Este módulo corrige
+esses defeitos cosméticos em vez de descartar a resposta; respostas truncadas
+pelo limite de tokens são rejeitadas, pois completá-las salvaria texto cortado.
+"""
+
+import re
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class JSONParseError(ValueError):
+    """Resposta do modelo sem JSON válido para a etapa."""
+
+    def __init__(self, message: str, errors: Optional[List[str]] = None):
+        super().__init__(message)
+        self.errors = errors or []
+
+# Esquemas esperados em cada etapa da geração
+STAGE_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    'question': {
+        'type': dict,
+        'fields': {'scenario': str, 'question': str}
+    },
+    'answer': {
+        'type': dict,
+        'fields': {
+            'correct_answer': str,
+            'justification': str,
+            'pmbok_references': [str],
+            'practical_examples': [str]
+        }
+    },
+    'distractors': {
+        'type': list,
+        'items': str
+    },
+    'summary': {
+        'type': dict,
+        # Itens podem ser textos ou objetos, conforme o prompt de resumo
+        'fields': {
+            'summary': str,
+            'key_points': list,
+            'practical_examples': list,
+            'pmbok_references': list,
+            'domains': list
+        }
+    },
+    'fused': {
+        'type': dict,
+        'fields': {
+            'scenario': str,
+            'question': str,
+            'correct_answer': str,
+            'justification': str,
+            'pmbok_references': [str],
+            'practical_examples': [str],
+            'distractors': [str]
+        }
+    }
+}
+
+_CLOSERS = {'{': '}', '[': ']'}
+_CODE_FENCE = re.compile(r'```[a-zA-Z]*')
+_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+def strip_code_fences(text: str) -> str:
+    """Remove marcações de bloco de código (```json ... ```)."""
+    return _CODE_FENCE.sub('', text)
+
+def _opener_for(expected: Optional[type]) -> str:
+    if expected is dict:
+        return '{'
+    if expected is list:
+        return '['
+    return '{['
+
+def extract_json(text: str, expected: Optional[type] = None) -> Optional[str]:
+    """
+    Extrai o primeiro valor JSON (objeto ou array) do texto em uma única passada,
+    respeitando chaves/colchetes dentro de strings.
+
+    Se o valor não for fechado (resposta truncada), retorna o trecho a partir
+    da abertura; repair_json o rejeita.
+    """
+    text = strip_code_fences(text)
+    openers = _opener_for(expected)
+
+    start = None
+    stack = []
+    in_string = False
+    escape = False
+    for index, char in enumerate(text):
+        if start is None:
+            if char in openers:
+                start = index
+                stack.append(_CLOSERS[char])
+            continue
+
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in '}]':
+            if stack and stack[-1] == char:
+                stack.pop()
+                if not stack:
+                    return text[start:index + 1]
+
+    return text[start:] if start is not None else None
+
+def repair_json(fragment: str) -> str:
+    """
+    Corrige defeitos comuns de JSON gerado por modelos:
+    aspas tipográficas ou simples, vírgulas antes de } ou ], literais Python
+    (True/False/None) e quebras de linha dentro de strings.
+
+    Raises:
+        JSONParseError: se o trecho estiver truncado (string, objeto ou array
+            não fechado) — completá-lo produziria campos com texto cortado
+    """
+    output = []
+    stack = []
+    quote = None
+    escape = False
+    index = 0
+    length = len(fragment)
+
+    while index < length:
+        char = fragment[index]
+
+        if quote:
+            if escape:
+                escape = False
+                if char == "'" and quote != '"':
+                    # \' não é um escape válido em JSON: basta o apóstrofo
+                    output.pop()
+                output.append(char)
+            elif char == '\\':
+                escape = True
+                output.append(char)
+            elif char == quote:
+                quote = None
+                output.append('"')
+            elif char == '"':
+                # Aspas duplas dentro de string delimitada por aspas simples/tipográficas
+                output.append('\\"')
+            elif char == '\n':
+                output.append('\\n')
+            elif char == '\r':
+                pass
+            elif char == '\t':
+                output.append('\\t')
+            else:
+                output.append(char)
+            index += 1
+            continue
+
+        if char in ('"', "'", '“'):
+            # String aberta com aspas tipográficas termina em ”
+            quote = '”' if char == '“' else char
+            output.append('"')
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+            output.append(char)
+        elif char in '}]':
+            if stack and stack[-1] == char:
+                stack.pop()
+            _strip_trailing(output, ',')
+            output.append(char)
+        elif char.isalpha():
+            end = index
+            while end < length and (fragment[end].isalnum() or fragment[end] == '_'):
+                end += 1
+            word = fragment[index:end]
+            output.append(_LITERALS.get(word, word))
+            index = end
+            continue
+        else:
+            output.append(char)
+        index += 1
+
+    if quote or stack:
+        raise JSONParseError("Resposta truncada: JSON não foi fechado")
+
+    return ''.join(output)
+
+def _strip_trailing(output: List[str], char: str):
+    """Remove o último caractere significativo de output se for `char`."""
+    index = len(output) - 1
+    while index >= 0 and not output[index].strip():
+        index -= 1
+    if index >= 0 and output[index].rstrip().endswith(char):
+        output[index] = output[index].rstrip()[:-1]
+
+def validate_schema(data: Any, schema: Dict[str, Any]) -> List[str]:
+    """Valida os dados contra o esquema da etapa. Retorna a lista de erros encontrados."""
+    errors = []
+    expected = schema['type']
+    if not isinstance(data, expected):
+        return [f"Tipo inválido: esperado {expected.__name__}, recebido {type(data).__name__}"]
+
+    if expected is list:
+        item_type = schema.get('items')
+        if item_type and not all(isinstance(item, item_type) for item in data):
+            errors.append(f"Itens inválidos: esperado {item_type.__name__}")
+        return errors
+
+    for field, field_type in schema.get('fields', {}).items():
+        if field not in data:
+            errors.append(f"Campo ausente: {field}")
+        elif isinstance(field_type, list):
+            if not isinstance(data[field], list):
+                errors.append(f"Tipo inválido para {field}: esperado list, recebido {type(data[field]).__name__}")
+            elif not all(isinstance(item, field_type[0]) for item in data[field]):
+                errors.append(f"Itens inválidos na lista {field}")
+        elif not isinstance(data[field], field_type):
+            errors.append(f"Tipo inválido para {field}: esperado {field_type.__name__}, recebido {type(data[field]).__name__}")
+    return errors
+
+def parse_json_response(text: str, stage: Optional[str] = None, expected: Optional[type] = None) -> Any:
+    """
+    Converte a resposta do modelo em JSON, extraindo e reparando quando necessário.
+
+    Args:
+        text: Conteúdo retornado pelo modelo
+        stage: Etapa (chave de STAGE_SCHEMAS) usada para validar o resultado
+        expected: Tipo esperado (dict ou list) quando não há esquema
+
+    Raises:
+        JSONParseError: se não for possível obter um JSON válido para a etapa
+    """
+    if not text or not text.strip():
+        raise JSONParseError("Resposta vazia")
+
+    schema = STAGE_SCHEMAS.get(stage) if stage else None
+    if schema:
+        expected = schema['type']
+
+    data = None
+    try:
+        data = json.loads(text.strip())
+    except json.JSONDecodeError:
+        fragment = extract_json(text, expected)
+        if fragment is None:
+            raise JSONParseError("Nenhum JSON encontrado na resposta")
+        try:
+            data = json.loads(fragment)
+        except json.JSONDecodeError:
+            repaired = repair_json(fragment)
+            try:
+                data = json.loads(repaired)
+            except json.JSONDecodeError as e:
+                raise JSONParseError(f"JSON inválido mesmo após reparo: {str(e)}")
+            logger.info(f"[JSON] Resposta reparada{f' ({stage})' if stage else ''}")
+
+    if expected and not isinstance(data, expected) and not schema:
+        raise JSONParseError(f"Tipo inválido: esperado {expected.__name__}, recebido {type(data).__name__}")
+
+    if schema:
+        errors = validate_schema(data, schema)
+        if errors:
+            raise JSONParseError(f"Resposta fora do formato esperado: {'; '.join(errors)}", errors)
+
+    return data
+
+class IncrementalJSONParser:
+    """
+    Acompanha os tokens de uma resposta em streaming e detecta cedo quando ela
+    não vai produzir o JSON esperado, permitindo abortar o stream.
+
+    Uso:
+        parser = IncrementalJSONParser(stage='answer')
+        for chunk in stream:
+            if parser.feed(chunk) == IncrementalJSONParser.INVALID:
+                break
+        data = parser.value()
+    """
+
+    PENDING = 'pending'
+    COMPLETE = 'complete'
+    INVALID = 'invalid'
+
+    def __init__(self, stage: Optional[str] = None, expected: Optional[type] = None, max_prefix: int = 300):
+        self.stage = stage
+        schema = STAGE_SCHEMAS.get(stage) if stage else None
+        self.expected = schema['type'] if schema else expected
+        self.max_prefix = max_prefix
+        self.buffer = []
+        self.status = self.PENDING
+        self.error = None
+        self._started = False
+        self._prefix = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+
+    def _fail(self, error: str) -> str:
+        self.status = self.INVALID
+        self.error = error
+        logger.warning(f"[JSON] Stream inválido{f' ({self.stage})' if self.stage else ''}: {error}")
+        return self.status
+
+    def feed(self, chunk: str) -> str:
+        """Processa um trecho da resposta e retorna o estado atual do parser."""
+        if not chunk or self.status != self.PENDING:
+            return self.status
+        self.buffer.append(chunk)
+
+        for char in chunk:
+            if not self._started:
+                if char in '{[':
+                    if self.expected and char != _opener_for(self.expected):
+                        return self._fail(f"Valor inicia com '{char}', esperado {self.expected.__name__}")
+                    self._started = True
+                    self._stack.append(_CLOSERS[char])
+                elif char != '`' and not char.isspace():
+                    self._prefix += 1
+                    if self._prefix > self.max_prefix:
+                        return self._fail("Texto demais antes do JSON")
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in _CLOSERS:
+                self._stack.append(_CLOSERS[char])
+            elif char in '}]':
+                if not self._stack or self._stack[-1] != char:
+                    return self._fail(f"Fechamento inesperado '{char}'")
+                self._stack.pop()
+                if not self._stack:
+                    self.status = self.COMPLETE
+                    return self.status
+
+        return self.status
+
+    def truncated(self) -> str:
+        """Marca a resposta como cortada pelo limite de tokens (finish_reason 'length')."""
+        if self.status == self.PENDING:
+            return self._fail("Resposta truncada pelo limite de tokens")
+        return self.status
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.buffer)
+
+    def value(self) -> Any:
+        """Retorna o JSON da resposta (reparando defeitos cosméticos). Levanta JSONParseError."""
+        if self.status == self.INVALID:
+            raise JSONParseError(self.error)
+        return parse_json_response(self.text, stage=self.stage, expected=self.expected)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Métricas das chamadas ao modelo, agregadas em memória por processo.
+
+Cada chamada (openai_client.py e pdf_utils.py) registra etapa, modelo, tokens
+de entrada e saída, latência, retentativas feitas pelo SDK, resultado da
+chamada e se o prompt aproveitou o cache do provedor. As etapas também
+registram o resultado da leitura da resposta (JSON inválido, reprovada nos
+validadores ou válida).
+
+Os agregados (contadores e histogramas de latência por etapa e modelo) são
+expostos em /api/metrics e podem ser gravados em JSON com dump_metrics(); com
+METRICS_DUMP_PATH definido, o arquivo é gravado ao encerrar o processo.
+"""
+
+import os
+import json
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Limites superiores (segundos) das faixas do histograma de latência
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, float('inf'))
+
+# Número de chamadas recentes mantidas com todos os campos
+METRICS_RECENT_CALLS = int(os.getenv('METRICS_RECENT_CALLS', '200'))
+
+# Arquivo JSON gravado ao encerrar o processo ("{pid}" é substituído pelo PID); vazio desativa
+METRICS_DUMP_PATH = os.getenv('METRICS_DUMP_PATH', '')
+
+# Resultados da chamada ao modelo
+OUTCOME_OK = 'ok'
+OUTCOME_INVALID_STREAM = 'invalid_stream'
+OUTCOME_RATE_LIMITED = 'rate_limited'
+OUTCOME_TIMEOUT = 'timeout'
+OUTCOME_CANCELLED = 'cancelled'
+OUTCOME_API_ERROR = 'api_error'
+OUTCOME_ERROR = 'error'
+OUTCOME_CIRCUIT_OPEN = 'circuit_open'
+
+# Resultados da leitura da resposta pela etapa
+RESULT_VALID = 'valid'
+RESULT_PARSE_ERROR = 'parse_error'
+RESULT_VALIDATION_ERROR = 'validation_error'
+
+class LatencyBuckets:
+    """Histograma de latência com faixas fixas (contagem por faixa, soma e máximo)."""
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Limite superior da faixa que contém o percentil p (aproximado)."""
+        count = sum(self.counts)
+        if not count:
+            return None
+        target = p / 100 * count
+        seen = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS, self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return self.max if bound == float('inf') else min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        count = sum(self.counts)
+        return {
+            'buckets': {('+inf' if bound == float('inf') else str(bound)): bucket_count
+                        for bound, bucket_count in zip(LATENCY_BUCKETS, self.counts)},
+            'avg': self.total / count if count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max if count else None
+        }
+
+class StageMetrics:
+    """Contadores e histograma de uma combinação etapa/modelo."""
+
+    def __init__(self):
+        self.calls = 0
+        self.outcomes: Dict[str, int] = {}
+        self.results: Dict[str, int] = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.cache_hits = 0
+        self.retries = 0
+        self.latency = LatencyBuckets()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'outcomes': dict(self.outcomes),
+            'results': dict(self.results),
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cached_prompt_tokens': self.cached_prompt_tokens,
+            'cache_hits': self.cache_hits,
+            'retries': self.retries,
+            'latency_seconds': self.latency.snapshot()
+        }
+
+_stages: Dict[tuple, StageMetrics] = {}
+_caches: Dict[str, Dict[str, int]] = {}
+_recent = deque(maxlen=METRICS_RECENT_CALLS)
+_lock = threading.Lock()
+_started_at = datetime.now().isoformat()
+
+# Requisições HTTP feitas pela chamada em andamento na thread (retentativas do SDK)
+_local = threading.local()
+
+def _stage(stage: str, model: Optional[str]) -> StageMetrics:
+    return _stages.setdefault((stage, model or 'desconhecido'), StageMetrics())
+
+def count_http_request(request):
+    """Event hook do httpx: conta as requisições da chamada em andamento na thread."""
+    _local.requests = getattr(_local, 'requests', 0) + 1
+
+def begin_call():
+    """Marca o início de uma chamada ao modelo na thread atual."""
+    _local.requests = 0
+
+def call_retries() -> int:
+    """Retentativas feitas pelo SDK desde begin_call() (requisições HTTP além da primeira)."""
+    return max(0, getattr(_local, 'requests', 0) - 1)
+
+def error_outcome(error: Exception) -> str:
+    """Classifica a exceção de uma chamada ao modelo."""
+    name = type(error).__name__
+    if name == 'DeadlineExceeded':
+        return OUTCOME_CANCELLED
+    if getattr(error, 'status_code', None) == 429:
+        return OUTCOME_RATE_LIMITED
+    if 'Timeout' in name:
+        return OUTCOME_TIMEOUT
+    if getattr(error, 'status_code', None):
+        return OUTCOME_API_ERROR
+    return OUTCOME_ERROR
+
+def cached_tokens(usage: Any) -> int:
+    """Tokens do prompt servidos pelo cache do provedor (0 se a API não informar)."""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    if isinstance(details, dict):
+        return details.get('cached_tokens') or 0
+    return getattr(details, 'cached_tokens', 0) or 0
+
+def record_call(stage: str, model: Optional[str], latency: float, prompt_tokens: int = 0,
+                completion_tokens: int = 0, outcome: str = OUTCOME_OK, retries: int = 0,
+                cached_prompt_tokens: int = 0, estimated: bool = False):
+    """
+    Registra uma chamada ao modelo.
+
+    Args:
+        estimated: Tokens estimados localmente (respostas em streaming não trazem usage)
+    """
+    call = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'stage': stage,
+        'model': model,
+        'latency': round(latency, 3),
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'estimated_tokens': estimated,
+        'retries': retries,
+        'outcome': outcome,
+        'cache_hit': cached_prompt_tokens > 0
+    }
+    with _lock:
+        metrics = _stage(stage, model)
+        metrics.calls += 1
+        metrics.outcomes[outcome] = metrics.outcomes.get(outcome, 0) + 1
+        metrics.prompt_tokens += prompt_tokens
+        metrics.completion_tokens += completion_tokens
+        metrics.cached_prompt_tokens += cached_prompt_tokens
+        metrics.cache_hits += cached_prompt_tokens > 0
+        metrics.retries += retries
+        metrics.latency.record(latency)
+        _recent.append(call)
+    logger.debug(f"[METRICS] {json.dumps(call, ensure_ascii=False)}")
+
+def record_rejected(stage: str, model: Optional[str]):
+    """Registra uma chamada recusada pelo circuit breaker (não entra no histograma de latência)."""
+    with _lock:
+        outcomes = _stage(stage, model).outcomes
+        outcomes[OUTCOME_CIRCUIT_OPEN] = outcomes.get(OUTCOME_CIRCUIT_OPEN, 0) + 1
+
+def record_result(stage: str, model: Optional[str], result: str):
+    """Registra o resultado da leitura da resposta da etapa (válida, JSON inválido ou reprovada)."""
+    with _lock:
+        results = _stage(stage, model).results
+        results[result] = results.get(result, 0) + 1
+
+def record_cache(name: str, hits: int = 0, misses: int = 0):
+    """Registra acertos e falhas de um cache da aplicação (ex.: estoque de questões)."""
+    with _lock:
+        cache = _caches.setdefault(name, {'hits': 0, 'misses': 0})
+        cache['hits'] += hits
+        cache['misses'] += misses
+
+def snapshot() -> Dict[str, Any]:
+    """Agregados por etapa e modelo, totais, caches e chamadas recentes."""
+    from .hedging import latency_stats
+    from .circuit_breaker import states as circuit_states
+    from .prompt_context import _cached_prompt_context
+
+    with _lock:
+        stages = {}
+        for (stage, model), metrics in sorted(_stages.items()):
+            stages.setdefault(stage, {})[model] = metrics.snapshot()
+        caches = {name: dict(cache) for name, cache in _caches.items()}
+        recent = list(_recent)
+        totals = {
+            'calls': sum(metrics.calls for metrics in _stages.values()),
+            'prompt_tokens': sum(metrics.prompt_tokens for metrics in _stages.values()),
+            'completion_tokens': sum(metrics.completion_tokens for metrics in _stages.values()),
+            'retries': sum(metrics.retries for metrics in _stages.values())
+        }
+
+    prompt_cache = _cached_prompt_context.cache_info()
+    caches['prompt_context'] = {'hits': prompt_cache.hits, 'misses': prompt_cache.misses,
+                                'size': prompt_cache.currsize}
+    return {
+        'pid': os.getpid(),
+        'started_at': _started_at,
+        'generated_at': datetime.now().isoformat(),
+        'totals': totals,
+        'stages': stages,
+        'caches': caches,
+        'hedging': latency_stats(),
+        'circuits': circuit_states(),
+        'recent_calls': recent
+    }
+
+def dump_metrics(path: Optional[str] = None) -> str:
+    """Grava o snapshot em JSON (padrão METRICS_DUMP_PATH) e retorna o caminho."""
+    path = (path or METRICS_DUMP_PATH).replace('{pid}', str(os.getpid()))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as dump_file:
+        json.dump(snapshot(), dump_file, ensure_ascii=False, indent=2)
+    logger.info(f"[METRICS] Métricas gravadas em {path}")
+    return path
+
+def reset():
+    """Zera os agregados (ex.: entre rodadas de um benchmark)."""
+    with _lock:
+        _stages.clear()
+        _caches.clear()
+        _recent.clear()
+
+def _dump_at_exit():
+    try:
+        dump_metrics()
+    except Exception as e:
+        logger.error(f"[METRICS] Erro ao gravar métricas: {str(e)}")
+
+if METRICS_DUMP_PATH:
+    atexit.register(_dump_at_exit)
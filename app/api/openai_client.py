@@ -19,6 +19,22 @@
 from sklearn.metrics.pairwise import cosine_similarity
 import csv
 from ..database.db_manager import DatabaseManager
+from .json_parser import IncrementalJSONParser, JSONParseError, STAGE_SCHEMAS, parse_json_response, validate_schema
+from .prompt_context import PromptContext, as_prompt_context, render_summary_context
+from .deadline import Deadline, DeadlineExceeded, REQUEST_TIMEOUT
+from .hedging import run_hedged
+from .circuit_breaker import CircuitOpenError
+from . import metrics, circuit_breaker, rate_limiter
+from .token_budget import (
+    INSTRUCTION_RESERVE_TOKENS,
+    context_budget,
+    estimate_messages_tokens,
+    estimate_tokens,
+    fit_max_tokens,
+    input_budget,
+    log_usage,
+    truncate_to_tokens
+)
 import random
 from app.models import Domain, AIModel
 from app import db
@@ -35,6 +51,21 @@
 # Criar uma única instância do DatabaseManager
 db_manager = DatabaseManager()
 
+# Engine de geração: 'pipeline' (pergunta, resposta e distratores em três
+# chamadas) ou 'fused' (tudo em uma única chamada estruturada)
+GENERATION_ENGINE = os.getenv('GENERATION_ENGINE', 'pipeline').lower()
+
+# Quando ativo, as respostas JSON são recebidas em streaming e a requisição é
+# abortada assim que o conteúdo deixa de ser um JSON válido para a etapa
+STREAM_JSON_RESPONSES = os.getenv('OPENAI_STREAM_JSON', 'false').lower() in ('1', 'true', 'yes')
+
+# Cenários pedidos por chamada na etapa de perguntas da engine pipeline (parâmetro
+# `n` da API); os candidatos válidos e distintos seguem para resposta e distratores
+QUESTION_CANDIDATES = max(1, int(os.getenv('QUESTION_CANDIDATES', '1')))
+
+# Similaridade (cosseno TF-IDF) a partir da qual dois cenários são considerados repetidos
+CANDIDATE_SIMILARITY_THRESHOLD = float(os.getenv('CANDIDATE_SIMILARITY_THRESHOLD', '0.8'))
+
 def get_training_file_path(filename):
     """Retorna o caminho do arquivo de treinamento"""
     return os.path.join('training_data', filename)
@@ -85,6 +116,12 @@ def get_openai_client():
     Cria e retorna uma instância do cliente OpenAI.
     """
     try:
+        # OPENAI_API_BASE=fake: cliente em processo para testes de carga e benchmarks
+        if os.getenv('OPENAI_API_BASE', '').startswith('fake'):
+            from .fake_openai_server import FakeOpenAIClient
+            logger.info("[OPENAI] Usando o cliente fake (OPENAI_API_BASE=fake)")
+            return FakeOpenAIClient()
+
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
             raise ValueError("API key não encontrada nas variáveis de ambiente")
@@ -94,7 +131,9 @@ def get_openai_client():
             api_key=api_key,
             base_url=os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1'),
             http_client=httpx.Client(
-                timeout=httpx.Timeout(30.0, read=30.0, write=30.0, connect=30.0)
+                timeout=httpx.Timeout(REQUEST_TIMEOUT, read=REQUEST_TIMEOUT, write=REQUEST_TIMEOUT, connect=REQUEST_TIMEOUT),
+                # Conta as requisições HTTP de cada chamada (retentativas do SDK) para as métricas
+                event_hooks={'request': [metrics.count_http_request]}
             )
         )
         logger.info("[OPENAI] Cliente inicializado com sucesso")
@@ -155,10 +194,12 @@ def generate_topic_summary(topic_text, client, api_key=None):
         
         # Inicializar cliente se não fornecido
         if not client:
-            client = OpenAI(api_key=api_key)
+            client = get_openai_client()
         
         # Limpar e preparar o texto
         cleaned_text = ' '.join(topic_text.split())  # Remove espaços extras
+        # Limitar o texto ao orçamento de entrada da etapa (desconta a reserva das instruções)
+        cleaned_text = truncate_to_tokens(cleaned_text, input_budget('summary', 'gpt-4') - INSTRUCTION_RESERVE_TOKENS)
         logger.info(f"[SUMMARY] Texto limpo: {cleaned_text[:200]}...")
         
         # Prompt para gerar o resumo
@@ -230,14 +271,15 @@ def generate_topic_summary(topic_text, client, api_key=None):
         
         logger.info("[SUMMARY] Enviando requisição para OpenAI")
         # Fazer a chamada à API
-        response = client.chat.completions.create(
+        response = create_chat_completion(
+            client,
+            'summary',
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "Você é um especialista em PMP e está analisando tópicos do PMBOK. Seu objetivo é fornecer análises detalhadas e práticas que ajudem na compreensão e aplicação dos conceitos."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.7,
-            max_tokens=2000  # Aumentando o limite de tokens
+            temperature=0.7
         )
         
         logger.info("[SUMMARY] Resposta recebida da OpenAI")
@@ -247,24 +289,17 @@ def generate_topic_summary(topic_text, client, api_key=None):
             content = response.choices[0].message.content
             logger.info(f"[SUMMARY] Conteúdo da resposta: {content[:200]}...")
             
-            result = json.loads(content)
+            # Extrair, reparar e validar (campos obrigatórios e listas) o JSON da resposta
+            result = parse_json_response(content, stage='summary')
             logger.info("[SUMMARY] JSON decodificado com sucesso")
             
-            # Validar campos obrigatórios
-            required_fields = ['summary', 'key_points', 'practical_examples', 'pmbok_references', 'domains']
-            for field in required_fields:
-                if field not in result:
-                    logger.error(f"[SUMMARY] Campo obrigatório ausente: {field}")
-                    return None
+            for field in STAGE_SCHEMAS['summary']['fields']:
                 if not result[field]:
                     logger.error(f"[SUMMARY] Campo {field} está vazio")
+                    metrics.record_result('summary', "gpt-4", metrics.RESULT_VALIDATION_ERROR)
                     return None
             
-            # Validar estrutura dos pontos-chave
-            if not isinstance(result['key_points'], list):
-                logger.error("[SUMMARY] Formato inválido para pontos-chave")
-                return None
-            
+            metrics.record_result('summary', "gpt-4", metrics.RESULT_VALID)
             logger.info("[SUMMARY] Resumo gerado com sucesso")
             logger.info(f"[SUMMARY] Número de pontos-chave: {len(result['key_points'])}")
             logger.info(f"[SUMMARY] Número de exemplos práticos: {len(result['practical_examples'])}")
@@ -273,9 +308,14 @@ def generate_topic_summary(topic_text, client, api_key=None):
             
             return result
             
-        except json.JSONDecodeError as e:
-            logger.error(f"[SUMMARY] Erro ao decodificar JSON da resposta: {str(e)}")
-            logger.error(f"[SUMMARY] Conteúdo da resposta: {content}")
+        except JSONParseError as e:
+            if e.errors:
+                logger.error(f"[SUMMARY] Resposta fora do formato esperado: {e.errors}")
+                metrics.record_result('summary', "gpt-4", metrics.RESULT_VALIDATION_ERROR)
+            else:
+                logger.error(f"[SUMMARY] Erro ao decodificar JSON da resposta: {str(e)}")
+                logger.error(f"[SUMMARY] Conteúdo da resposta: {content}")
+                metrics.record_result('summary', "gpt-4", metrics.RESULT_PARSE_ERROR)
             return None
             
         except Exception as e:
@@ -362,79 +402,206 @@ def normalize_model_response(question_data):
             }
     return None
 
-def generate_questions(topic, num_questions, api_key, summary=None):
-    logger.info(f"[GENERATE] Iniciando geração de {num_questions} questões sobre {topic}")
+def build_summary_context(summary) -> Tuple[str, Dict[str, Any]]:
+    """
+    Monta o contexto do resumo enviado nos prompts e os dados exibidos no frontend.
+    Mantida por compatibilidade; a geração usa PromptContext (ver prompt_context.py).
+    """
+    return render_summary_context(summary)
+
+def assemble_question(question_data: Dict[str, Any], answer_data: Dict[str, Any],
+                      distractors_data: Dict[str, Any], warnings: List[str],
+                      frontend_summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Combina os resultados das etapas na questão entregue ao frontend e salva no banco."""
+    question_data = {
+        'question': question_data.get('question', ''),
+        'correct_answer': answer_data.get('correct_answer', ''),
+        'explanation': answer_data.get('justification', ''),
+        'justification': answer_data.get('justification', ''),
+        'distractors': distractors_data.get('distractors', []),
+        'warnings': warnings,
+        'options': distractors_data.get('distractors', []) + [answer_data.get('correct_answer', '')],
+        'topic_summary': frontend_summary['summary'],
+        'topic_key_points': frontend_summary['key_points']
+    }
     
+    # Garantir que todos os campos sejam strings ou listas vazias
+    for key, value in question_data.items():
+        if value is None:
+            question_data[key] = [] if isinstance(question_data.get(key, []), list) else ''
+        elif isinstance(value, list):
+            question_data[key] = [str(item) for item in value]
+        else:
+            question_data[key] = str(value)
+    return question_data
+
+def load_default_models() -> Dict[str, str]:
+    """Modelos padrão por tipo (tabela ai_models); levanta ValueError se não houver nenhum."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT model_type, model_id 
+            FROM ai_models 
+            WHERE is_default = 1
+        """)
+        default_models = {row[0]: row[1] for row in cursor.fetchall()}
+    
+    if not default_models:
+        raise ValueError("Nenhum modelo padrão configurado")
+    return default_models
+
+def generation_stage_models(engine: Optional[str] = None,
+                            default_models: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Modelo usado em cada etapa da geração de questões pela engine (padrão GENERATION_ENGINE)."""
+    engine = engine or GENERATION_ENGINE
+    default_models = default_models if default_models is not None else load_default_models()
+    if engine == 'fused':
+        # Por padrão a engine fused usa o modelo de respostas, que avalia a alternativa correta
+        return {'fused': os.getenv('FUSED_MODEL_ID') or default_models.get('answer')}
+    return {
+        'question': os.getenv('QUESTION_MODEL_ID', 'gpt-3.5-turbo'),
+        'answer': default_models.get('answer'),
+        'distractors': default_models.get('distractor')
+    }
+
+def generation_retry_after(engine: Optional[str] = None) -> Optional[float]:
+    """
+    Segundos até a geração de questões voltar a ser tentada, se o circuito de
+    algum modelo das etapas estiver aberto (ver circuit_breaker.py); None se
+    a geração pode ser feita agora.
+    """
     try:
-        # Inicializar cliente OpenAI usando a função get_openai_client
-        client = get_openai_client()
-        logger.info("[GENERATE] Cliente OpenAI inicializado")
-        
-        # Buscar modelos padrão
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT model_type, model_id 
-                FROM ai_models 
-                WHERE is_default = 1
-            """)
-            default_models = {row[0]: row[1] for row in cursor.fetchall()}
-            logger.info(f"[GENERATE] Modelos padrão encontrados: {default_models}")
-            
-            if not default_models:
-                raise ValueError("Nenhum modelo padrão configurado")
-        
-        # Preparar o contexto do resumo e extrair informações para o frontend
-        summary_context = ""
-        frontend_summary = {
-            'summary': '',
-            'key_points': []
-        }
-        
-        if summary:
-            if isinstance(summary, dict):
-                # Contexto para geração
-                summary_context = f"""Contexto do tópico principal:
-{summary.get('summary', 'Sem resumo disponível')}
+        stage_models = generation_stage_models(engine)
+    except Exception as e:
+        # Sem modelos configurados a própria geração informa o erro
+        logger.warning(f"[GENERATE] Modelos da geração não encontrados: {str(e)}")
+        return None
+    return circuit_breaker.retry_after(stage_models.values())
 
-Pontos-chave do tópico principal:
-{chr(10).join([f"- {point['point']}: {point['explanation']}" for point in summary.get('key_points', [])]) if summary.get('key_points') else 'Sem pontos-chave disponíveis'}
+def check_generation_available(engine: Optional[str] = None):
+    """Levanta CircuitOpenError se algum modelo das etapas da geração estiver indisponível."""
+    try:
+        stage_models = generation_stage_models(engine)
+    except Exception as e:
+        logger.warning(f"[GENERATE] Modelos da geração não encontrados: {str(e)}")
+        return
+    circuit_breaker.check(stage_models.values())
+
+def iter_generate_questions(topic, num_questions, api_key, summary=None,
+                            should_cancel: Optional[Callable[[], bool]] = None,
+                            engine: Optional[str] = None,
+                            deadline: Optional[Deadline] = None,
+                            candidates: Optional[int] = None):
+    """
+    Gera questões completas uma a uma, emitindo eventos conforme cada etapa termina.
 
-Exemplos práticos:
-{chr(10).join([f"- {example['example']}: {example['context']}" for example in summary.get('practical_examples', [])]) if summary.get('practical_examples') else 'Sem exemplos disponíveis'}
+    Eventos emitidos (dicionários com a chave 'event'):
+        progress: {'index', 'total', 'stage'} - início de uma etapa (question, answer, distractors ou fused)
+        question: {'index', 'total', 'question'} - questão pronta, no mesmo formato de generate_questions
+        error: {'index', 'total', 'stage', 'message'} - falha em uma questão (a geração continua)
 
-Referências PMBOK:
-{chr(10).join([f"- {ref['section']}: {ref['description']}" for ref in summary.get('pmbok_references', [])]) if summary.get('pmbok_references') else 'Sem referências disponíveis'}"""
-                
-                # Dados para o frontend
-                frontend_summary = {
-                    'summary': summary.get('summary', ''),
-                    'key_points': [f"{point['point']}: {point['explanation']}" for point in summary.get('key_points', [])]
-                }
-            else:
-                # Se o resumo for uma string, usa diretamente
-                summary_context = f"""Contexto do tópico principal:
-{summary}"""
-                frontend_summary = {
-                    'summary': summary,
-                    'key_points': []
-                }
+    Args:
+        should_cancel: Função consultada entre as etapas; se retornar True a geração é interrompida
+        engine: 'pipeline' (três chamadas) ou 'fused' (uma chamada); padrão GENERATION_ENGINE
+        deadline: Prazo/cancelamento da requisição, verificado entre as etapas e repassado
+            às chamadas (timeout reduzido ao tempo restante, interrupção das chamadas em andamento)
+        candidates: Cenários pedidos por chamada na engine pipeline; padrão QUESTION_CANDIDATES
+    """
+    engine = engine or GENERATION_ENGINE
+    candidates = QUESTION_CANDIDATES if candidates is None else max(1, candidates)
+    logger.info(f"[GENERATE] Iniciando geração de {num_questions} questões sobre {topic} (engine: {engine})")
+    
+    # Inicializar cliente OpenAI usando a função get_openai_client
+    client = get_openai_client()
+    logger.info("[GENERATE] Cliente OpenAI inicializado")
+    
+    # Buscar modelos padrão
+    default_models = load_default_models()
+    logger.info(f"[GENERATE] Modelos padrão encontrados: {default_models}")
+    stage_models = generation_stage_models(engine, default_models)
+    fused_model = stage_models.get('fused')
+    
+    # Contexto do resumo renderizado uma única vez e compartilhado por todas as etapas,
+    # reduzido ao orçamento de tokens da etapa mais restrita
+    prompt_context = as_prompt_context(summary).fit(context_budget(stage_models))
+    frontend_summary = prompt_context.frontend
+    
+    def cancelled():
+        return bool(should_cancel and should_cancel()) or (deadline is not None and deadline.is_set())
+    
+    # Cenários gerados em lote ainda não usados e textos dos já usados (para descartar repetições)
+    question_pool = []
+    used_questions = []
+    
+    generated = 0
+    for i in range(num_questions):
+        if cancelled():
+            logger.info(f"[GENERATE] Geração cancelada após {generated} questões")
+            return
         
-        questions = []
-        for i in range(num_questions):
-            logger.info(f"[QUESTION_AI] Iniciando geração de pergunta {i+1} para tópico {topic}")
-            
-            try:
-                # Gerar questão usando o modelo de questões
-                question_data = generate_question(
+        logger.info(f"[QUESTION_AI] Iniciando geração de pergunta {i+1} para tópico {topic}")
+        stage = 'question'
+        
+        try:
+            if engine == 'fused':
+                stage = 'fused'
+                yield {'event': 'progress', 'index': i, 'total': num_questions, 'stage': stage}
+                
+                # Gerar questão, resposta e distratores em uma única chamada
+                fused_data = generate_fused_question(
                     topic=topic,
-                    summary=summary_context,
-                    client=client  # Passando o cliente como parâmetro
+                    summary=prompt_context,
+                    client=client,
+                    model=fused_model,
+                    deadline=deadline
                 )
                 
+                if not fused_data:
+                    logger.error("[FUSED_AI] Falha ao gerar questão")
+                    yield {'event': 'error', 'index': i, 'total': num_questions, 'stage': stage,
+                           'message': 'Falha ao gerar questão'}
+                    continue
+                
+                question_data = fused_data['question']
+                answer_data = fused_data['answer']
+                distractors_data = fused_data['distractors']
+                warnings = fused_data['warnings']
+            else:
+                yield {'event': 'progress', 'index': i, 'total': num_questions, 'stage': stage}
+                
+                if candidates > 1:
+                    # Vários cenários por chamada: o contexto do resumo é pago uma vez por lote
+                    if not question_pool:
+                        question_pool = generate_question_candidates(
+                            topic=topic,
+                            summary=prompt_context,
+                            n=min(candidates, num_questions - i),
+                            client=client,
+                            existing=used_questions,
+                            deadline=deadline
+                        )
+                    question_data = question_pool.pop(0) if question_pool else None
+                else:
+                    # Gerar questão usando o modelo de questões
+                    question_data = generate_question(
+                        topic=topic,
+                        summary=prompt_context,
+                        client=client,  # Passando o cliente como parâmetro
+                        deadline=deadline
+                    )
+                
                 if not question_data:
                     logger.error("[QUESTION_AI] Falha ao gerar questão")
+                    yield {'event': 'error', 'index': i, 'total': num_questions, 'stage': stage,
+                           'message': 'Falha ao gerar questão'}
                     continue
+                used_questions.append(question_text(question_data))
+                
+                if cancelled():
+                    logger.info(f"[GENERATE] Geração cancelada após {generated} questões")
+                    return
+                stage = 'answer'
+                yield {'event': 'progress', 'index': i, 'total': num_questions, 'stage': stage}
                 
                 # Gerar resposta usando o modelo de respostas
                 answer_data = generate_answer_with_ai(
@@ -444,14 +611,23 @@ def generate_questions(topic, num_questions, api_key, summary=None):
                     client=client,
                     api_key=api_key,
                     model=default_models['answer'],
-                    topic_summary=summary,
-                    related_summary=None
+                    topic_summary=prompt_context,
+                    related_summary=None,
+                    deadline=deadline
                 )
                 
                 if not answer_data:
                     logger.error("[ANSWER_AI] Falha ao gerar resposta")
+                    yield {'event': 'error', 'index': i, 'total': num_questions, 'stage': stage,
+                           'message': 'Falha ao gerar resposta'}
                     continue
                 
+                if cancelled():
+                    logger.info(f"[GENERATE] Geração cancelada após {generated} questões")
+                    return
+                stage = 'distractors'
+                yield {'event': 'progress', 'index': i, 'total': num_questions, 'stage': stage}
+                
                 # Gerar distratores usando o modelo de distratores
                 distractors_data, warnings = generate_distractors(
                     question_data=question_data,
@@ -461,44 +637,74 @@ def generate_questions(topic, num_questions, api_key, summary=None):
                     client=client,
                     api_key=api_key,
                     model=default_models['distractor'],
-                    topic_summary=summary,
-                    related_summary=None
+                    topic_summary=prompt_context,
+                    related_summary=None,
+                    deadline=deadline
                 )
                 
                 if not distractors_data:
                     logger.error("[DISTRACTORS] Falha ao gerar distratores")
+                    yield {'event': 'error', 'index': i, 'total': num_questions, 'stage': stage,
+                           'message': 'Falha ao gerar distratores'}
                     continue
-                
-                # Combinar todos os dados
-                question_data = {
-                    'question': question_data.get('question', ''),
-                    'correct_answer': answer_data.get('correct_answer', ''),
-                    'explanation': answer_data.get('justification', ''),
-                    'justification': answer_data.get('justification', ''),
-                    'distractors': distractors_data.get('distractors', []),
-                    'warnings': warnings,
-                    'options': distractors_data.get('distractors', []) + [answer_data.get('correct_answer', '')],
-                    'topic_summary': frontend_summary['summary'],
-                    'topic_key_points': frontend_summary['key_points']
-                }
-                
-                # Garantir que todos os campos sejam strings ou listas vazias
-                for key, value in question_data.items():
-                    if value is None:
-                        question_data[key] = [] if isinstance(question_data.get(key, []), list) else ''
-                    elif isinstance(value, list):
-                        question_data[key] = [str(item) for item in value]
-                    else:
-                        question_data[key] = str(value)
-                
-                questions.append(question_data)
-                logger.info(f"[QUESTION_AI] Questão {i+1} gerada com sucesso")
-                
-            except Exception as e:
-                logger.error(f"[QUESTION_AI] Erro ao gerar questão {i+1}: {str(e)}")
-                logger.error(f"[QUESTION_AI] Stack trace: {traceback.format_exc()}")
+            
+            # Combinar todos os dados
+            question_data = assemble_question(question_data, answer_data, distractors_data,
+                                              warnings, frontend_summary)
+            
+            generated += 1
+            logger.info(f"[QUESTION_AI] Questão {i+1} gerada com sucesso")
+            
+        except DeadlineExceeded as e:
+            # Prazo esgotado ou requisição abandonada: nenhuma nova chamada é feita
+            logger.info(f"[GENERATE] {str(e)} ({generated} questões geradas)")
+            yield {'event': 'error', 'index': i, 'total': num_questions, 'stage': stage,
+                   'message': str(e)}
+            return
+        except CircuitOpenError as e:
+            # Modelo indisponível: as próximas questões falhariam do mesmo jeito
+            logger.warning(f"[GENERATE] {str(e)} ({generated} questões geradas)")
+            yield {'event': 'error', 'index': i, 'total': num_questions, 'stage': stage,
+                   'message': str(e), 'retry_after': round(e.retry_after)}
+            return
+        except Exception as e:
+            logger.error(f"[QUESTION_AI] Erro ao gerar questão {i+1}: {str(e)}")
+            logger.error(f"[QUESTION_AI] Stack trace: {traceback.format_exc()}")
+            yield {'event': 'error', 'index': i, 'total': num_questions, 'stage': stage,
+                   'message': str(e)}
+            continue
+        
+        yield {'event': 'question', 'index': i, 'total': num_questions, 'question': question_data}
+
+def generate_questions(topic, num_questions, api_key, summary=None,
+                       on_question: Optional[Callable[[Dict[str, Any]], None]] = None,
+                       should_cancel: Optional[Callable[[], bool]] = None,
+                       engine: Optional[str] = None,
+                       deadline: Optional[Deadline] = None,
+                       candidates: Optional[int] = None):
+    """
+    Gera questões completas (pergunta, resposta e distratores) para um tópico.
+
+    Args:
+        on_question: Callback chamado com cada questão assim que ela fica pronta
+        should_cancel: Função consultada entre as questões; se retornar True a geração é interrompida
+        engine: 'pipeline' ou 'fused'; padrão GENERATION_ENGINE
+        deadline: Prazo/cancelamento da requisição (ver iter_generate_questions)
+        candidates: Cenários pedidos por chamada na engine pipeline; padrão QUESTION_CANDIDATES
+    """
+    try:
+        questions = []
+        for event in iter_generate_questions(topic, num_questions, api_key,
+                                             summary=summary, should_cancel=should_cancel,
+                                             engine=engine, deadline=deadline,
+                                             candidates=candidates):
+            if event['event'] != 'question':
                 continue
             
+            questions.append(event['question'])
+            if on_question:
+                on_question(event['question'])
+            
         if not questions:
             logger.error("[GENERATE] Nenhuma questão foi gerada com sucesso")
             return None
@@ -597,26 +803,201 @@ def process_openai_response(response_text):
         logger.error("Erro ao decodificar resposta da OpenAI")
         return None
 
-def generate_question(topic, summary, client=None):
-    """Gera uma questão sobre um tópico específico usando o contexto fornecido."""
+def create_chat_completion(client, stage: str, deadline: Optional[Deadline] = None, **kwargs):
+    """
+    Chama client.chat.completions.create aplicando o orçamento de tokens da etapa:
+    define max_tokens (STAGE_OUTPUT_BUDGETS, reduzido se o prompt não deixar espaço
+    na janela do modelo) e registra a estimativa local comparada ao response.usage.
+
+    Com um deadline, a chamada não é iniciada se o prazo já acabou e o timeout
+    da chamada é reduzido ao tempo restante.
+
+    Chamadas sem streaming são registradas nas métricas aqui; em streaming o
+    registro é feito por quem consome o stream (ver _request_json_choices).
+    O mesmo vale para o circuit breaker do modelo: com o circuito aberto a
+    chamada não é feita e CircuitOpenError é levantada.
+
+    Com LLM_REQUESTS_PER_MINUTE, a chamada espera a vez no limite de
+    requisições do modelo, compartilhado pelas threads do processo (ver rate_limiter.py).
+    """
+    model = kwargs.get('model')
     try:
-        logger.info(f"[QUESTION_AI] Iniciando geração de pergunta para tópico {topic}")
-        logger.info("[QUESTION_AI] Combinando contexto dos resumos")
-        
-        # Inicializar cliente se não fornecido
-        if client is None:
-            logger.info("[QUESTION_AI] Cliente não fornecido, inicializando novo cliente")
-            client = get_openai_client()
-        
-        # Construir o prompt com instruções mais claras sobre o formato JSON
-        prompt = f'''Gere um cenário e uma pergunta sobre {topic}.
+        circuit_breaker.before_call(model)
+    except CircuitOpenError:
+        metrics.record_rejected(stage, model)
+        raise
+    try:
+        rate_limiter.acquire(model, deadline, stage)
+        if deadline is not None:
+            kwargs['timeout'] = deadline.call_timeout(stage)
+    except Exception as e:
+        # Sondagem do circuito que não chegou a ser feita
+        circuit_breaker.record_error(model, e)
+        raise
+    estimated_prompt = estimate_messages_tokens(kwargs.get('messages', []))
+    kwargs['max_tokens'] = fit_max_tokens(stage, model, estimated_prompt, kwargs.get('max_tokens'))
+    start = time.monotonic()
+    metrics.begin_call()
+    try:
+        response = client.chat.completions.create(**kwargs)
+    except Exception as e:
+        metrics.record_call(stage, model, time.monotonic() - start, estimated_prompt,
+                            outcome=metrics.error_outcome(e), retries=metrics.call_retries(), estimated=True)
+        circuit_breaker.record_error(model, e)
+        raise
+    # Respostas em streaming não trazem usage; registra apenas a estimativa
+    usage = None if kwargs.get('stream') else getattr(response, 'usage', None)
+    log_usage(stage, model, estimated_prompt, kwargs['max_tokens'], usage)
+    if not kwargs.get('stream'):
+        metrics.record_call(stage, model, time.monotonic() - start,
+                            getattr(usage, 'prompt_tokens', None) or estimated_prompt,
+                            getattr(usage, 'completion_tokens', None) or 0,
+                            retries=metrics.call_retries(), cached_prompt_tokens=metrics.cached_tokens(usage),
+                            estimated=usage is None)
+        circuit_breaker.record_success(model)
+    return response
+
+def request_json_completion(client, stage: str, deadline: Optional[Deadline] = None, **kwargs) -> str:
+    """
+    Faz a chamada ao modelo para uma etapa que responde em JSON e retorna o texto da resposta.
+
+    Aplica a política de hedging da etapa (ver hedging.py): registra a latência
+    e, se a chamada demorar mais que o p95 observado, dispara uma segunda
+    chamada (opcionalmente para o modelo de fallback) e usa a primeira resposta.
+    """
+    def call(attempt_deadline, model):
+        return _request_json_completion(client, stage, deadline=attempt_deadline, **dict(kwargs, model=model))
+
+    return run_hedged(stage, call, deadline=deadline, model=kwargs.get('model'))
+
+def _request_json_completion(client, stage: str, deadline: Optional[Deadline] = None, **kwargs) -> str:
+    """
+    Faz uma única chamada ao modelo para uma etapa que responde em JSON.
+
+    Com OPENAI_STREAM_JSON ativo, acompanha os tokens com IncrementalJSONParser:
+    interrompe o stream quando o JSON da etapa termina ou quando a resposta
+    se mostra inválida (JSONParseError), sem esperar o fim da geração.
+
+    Com um deadline que aborta chamadas em andamento (abort_in_flight), a resposta
+    também é recebida em streaming e a conexão é fechada assim que o deadline é
+    cancelado, levantando DeadlineExceeded.
+    """
+    return _request_json_choices(client, stage, 1, deadline=deadline, **kwargs)[0]
+
+def request_json_candidates(client, stage: str, n: int, deadline: Optional[Deadline] = None,
+                            **kwargs) -> List[str]:
+    """
+    Pede `n` respostas JSON da etapa em uma única chamada (parâmetro `n` da API),
+    pagando os tokens do prompt uma só vez. Retorna os textos das respostas que
+    não foram descartadas como inválidas durante o streaming.
+    """
+    def call(attempt_deadline, model):
+        return _request_json_choices(client, stage, n, deadline=attempt_deadline, **dict(kwargs, model=model))
+
+    return run_hedged(stage, call, deadline=deadline, model=kwargs.get('model'))
+
+def _request_json_choices(client, stage: str, n: int, deadline: Optional[Deadline] = None, **kwargs) -> List[str]:
+    """Faz a chamada com `n` respostas (ver _request_json_completion) e retorna o texto de cada uma."""
+    if n > 1:
+        kwargs['n'] = n
+    abortable = deadline is not None and deadline.abort_in_flight
+    if not STREAM_JSON_RESPONSES and not abortable:
+        response = create_chat_completion(client, stage, deadline=deadline, **kwargs)
+        texts = []
+        for index, choice in enumerate(response.choices):
+            # Resposta cortada pelo max_tokens: o JSON estaria incompleto
+            if getattr(choice, 'finish_reason', None) == 'length':
+                error = "Resposta truncada pelo limite de tokens"
+                if n == 1:
+                    logger.error(f"[OPENAI] Etapa {stage}: {error}")
+                    raise JSONParseError(error)
+                logger.warning(f"[OPENAI] Resposta {index + 1}/{n} da etapa {stage} descartada: {error}")
+                continue
+            texts.append(choice.message.content or '')
+        return texts
+
+    parsers = [IncrementalJSONParser(stage=stage) for _ in range(n)]
+    start = time.monotonic()
+    stream = create_chat_completion(client, stage, deadline=deadline, stream=True, **kwargs)
+    retries = metrics.call_retries()
+    # Fecha a conexão para não continuar recebendo (e pagando) tokens
+    response = getattr(stream, 'response', None)
+    outcome = metrics.OUTCOME_OK
+    error = None
+    try:
+        if deadline is not None and response is not None:
+            with deadline.track(response):
+                _consume_stream(stream, parsers, deadline)
+        else:
+            _consume_stream(stream, parsers, deadline)
+    except Exception as e:
+        error = e
+        outcome = metrics.error_outcome(e)
+        if deadline is not None and deadline.is_set():
+            outcome = metrics.OUTCOME_CANCELLED
+            # A leitura falhou porque a conexão foi fechada pelo cancelamento
+            deadline.check(stage)
+        raise
+    finally:
+        if response is not None:
+            response.close()
+        if outcome == metrics.OUTCOME_OK:
+            if deadline is not None and deadline.is_set():
+                outcome = metrics.OUTCOME_CANCELLED
+            elif any(parser.status == IncrementalJSONParser.INVALID for parser in parsers):
+                outcome = metrics.OUTCOME_INVALID_STREAM
+        # Tokens estimados: o stream não traz usage
+        metrics.record_call(stage, kwargs.get('model'), time.monotonic() - start,
+                            estimate_messages_tokens(kwargs.get('messages', [])),
+                            sum(estimate_tokens(parser.text) for parser in parsers),
+                            outcome=outcome, retries=retries, estimated=True)
+        if outcome == metrics.OUTCOME_CANCELLED:
+            circuit_breaker.release_probe(kwargs.get('model'))
+        elif error is not None:
+            circuit_breaker.record_error(kwargs.get('model'), error)
+        else:
+            circuit_breaker.record_success(kwargs.get('model'))
+
+    if deadline is not None and deadline.is_set() and any(
+            parser.status == IncrementalJSONParser.PENDING for parser in parsers):
+        deadline.check(stage)
+
+    texts = []
+    for index, parser in enumerate(parsers):
+        if parser.status == IncrementalJSONParser.INVALID:
+            if n == 1:
+                logger.error(f"[OPENAI] Stream da etapa {stage} abortado: {parser.error}")
+                raise JSONParseError(parser.error)
+            logger.warning(f"[OPENAI] Resposta {index + 1}/{n} da etapa {stage} descartada: {parser.error}")
+            continue
+        texts.append(parser.text)
+    return texts
+
+def _consume_stream(stream, parsers: List[IncrementalJSONParser], deadline: Optional[Deadline] = None):
+    """
+    Alimenta os parsers (um por resposta pedida) com os trechos do stream até
+    todos os JSONs terminarem ou serem inválidos, ou o deadline disparar.
+    """
+    for chunk in stream:
+        if deadline is not None and deadline.is_set():
+            break
+        for choice in chunk.choices or []:
+            index = getattr(choice, 'index', 0) or 0
+            if index >= len(parsers):
+                continue
+            parsers[index].feed(choice.delta.content or '')
+            if getattr(choice, 'finish_reason', None) == 'length':
+                parsers[index].truncated()
+        if all(parser.status != IncrementalJSONParser.PENDING for parser in parsers):
+            break
+
+def question_prompt(topic) -> str:
+    """Instruções da etapa de perguntas (o contexto do resumo vai na mensagem de sistema)."""
+    return f'''Gere um cenário e uma pergunta sobre {topic}.
 
 O cenário deve ser realista e contextualizado com a prática de gerenciamento de projetos.
 A pergunta deve ser clara e objetiva, sem incluir as alternativas.
 
-Contexto do tópico principal:
-{summary}
-
 IMPORTANTE: Você DEVE retornar APENAS um objeto JSON válido com exatamente este formato:
 {{
     "scenario": "Descrição do cenário",
@@ -629,49 +1010,48 @@ def generate_question(topic, summary, client=None):
     "question": "Qual é o primeiro documento que você deve desenvolver para iniciar o projeto?"
 }}'''
 
+def generate_question(topic, summary, client=None, deadline: Optional[Deadline] = None):
+    """
+    Gera uma questão sobre um tópico específico usando o contexto fornecido.
+    `summary` pode ser um PromptContext, o dicionário do resumo ou o texto do resumo.
+    `deadline` limita o tempo da chamada e permite cancelá-la (levanta DeadlineExceeded).
+    """
+    try:
+        logger.info(f"[QUESTION_AI] Iniciando geração de pergunta para tópico {topic}")
+        logger.info("[QUESTION_AI] Combinando contexto dos resumos")
+        
+        # Inicializar cliente se não fornecido
+        if client is None:
+            logger.info("[QUESTION_AI] Cliente não fornecido, inicializando novo cliente")
+            client = get_openai_client()
+        
+        prompt_context = as_prompt_context(summary)
+        
+        # Construir o prompt com instruções mais claras sobre o formato JSON
+        # (o contexto do resumo vai na mensagem de sistema compartilhada)
+        prompt = question_prompt(topic)
+        model = os.getenv('QUESTION_MODEL_ID', 'gpt-3.5-turbo')
+
         logger.info("[QUESTION_AI] Enviando requisição para OpenAI")
-        response = client.chat.completions.create(
-            model=os.getenv('QUESTION_MODEL_ID', 'gpt-3.5-turbo'),
-            messages=[
-                {"role": "system", "content": "Você é um especialista em criar cenários e questões de gerenciamento de projetos. Sua resposta DEVE ser um objeto JSON válido."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
+        content = request_json_completion(
+            client,
+            'question',
+            deadline=deadline,
+            model=model,
+            messages=prompt_context.messages(prompt),
             temperature=0.7
-        )
-        
-        content = response.choices[0].message.content.strip()
+        ).strip()
         logger.info(f"[QUESTION_AI] Resposta recebida: {content[:100]}...")
         
-        # Tentar extrair JSON da resposta
+        # Extrair, reparar e validar (scenario, question) o JSON da resposta
         try:
-            # Primeiro, tenta decodificar diretamente
-            question_data = json.loads(content)
-        except json.JSONDecodeError:
-            # Se falhar, tenta encontrar um objeto JSON na resposta
-            import re
-            json_match = re.search(r'\{.*\}', content, re.DOTALL)
-            if json_match:
-                try:
-                    question_data = json.loads(json_match.group(0))
-                except json.JSONDecodeError as e:
-                    logger.error(f"[QUESTION_AI] Erro ao extrair JSON da resposta: {str(e)}")
-                    raise
-            else:
-                logger.error("[QUESTION_AI] Nenhum JSON encontrado na resposta")
-                raise ValueError("Resposta não contém JSON válido")
-        
-        # Validar estrutura do JSON
-        if not isinstance(question_data, dict):
-            logger.error(f"[QUESTION_AI] Resposta não é um dicionário: {type(question_data)}")
-            raise ValueError("Resposta não é um dicionário")
-            
-        required_fields = ['scenario', 'question']
-        missing_fields = [field for field in required_fields if field not in question_data]
-        if missing_fields:
-            logger.error(f"[QUESTION_AI] Campos obrigatórios ausentes: {missing_fields}")
-            raise ValueError(f"Campos obrigatórios ausentes: {missing_fields}")
+            question_data = parse_json_response(content, stage='question')
+        except JSONParseError as e:
+            logger.error(f"[QUESTION_AI] Resposta sem JSON válido: {str(e)}")
+            metrics.record_result('question', model, metrics.RESULT_PARSE_ERROR)
+            raise
             
+        metrics.record_result('question', model, metrics.RESULT_VALID)
         logger.info("[QUESTION_AI] Questão gerada com sucesso")
         return question_data
         
@@ -679,6 +1059,84 @@ def generate_question(topic, summary, client=None):
         logger.error(f"[QUESTION_AI] Erro ao gerar pergunta: {str(e)}")
         raise
 
+def question_text(question_data: Dict[str, str]) -> str:
+    """Texto (cenário + pergunta) usado na comparação entre candidatos."""
+    return f"{question_data.get('scenario', '')} {question_data.get('question', '')}".strip()
+
+def dedupe_question_candidates(candidates: List[Dict[str, str]], existing: Optional[List[str]] = None,
+                               threshold: float = CANDIDATE_SIMILARITY_THRESHOLD) -> List[Dict[str, str]]:
+    """
+    Remove candidatos quase repetidos: entre si e em relação aos textos já usados
+    (`existing`), pela similaridade de cosseno TF-IDF. Mantém o primeiro de cada grupo.
+    """
+    existing = [text for text in (existing or []) if text]
+    texts = [question_text(candidate) for candidate in candidates]
+    if not texts:
+        return []
+    normalized = [' '.join(text.lower().split()) for text in existing + texts]
+    try:
+        similarities = cosine_similarity(TfidfVectorizer().fit_transform(existing + texts))
+    except ValueError:
+        # Vocabulário vazio (textos sem palavras): compara apenas os textos normalizados
+        similarities = None
+
+    kept_rows = list(range(len(existing)))
+    unique = []
+    for i, candidate in enumerate(candidates):
+        row = len(existing) + i
+        if any(normalized[row] == normalized[other] or
+               (similarities is not None and similarities[row, other] >= threshold)
+               for other in kept_rows):
+            logger.info(f"[QUESTION_AI] Candidato {i+1} descartado por ser semelhante a outro cenário")
+            continue
+        kept_rows.append(row)
+        unique.append(candidate)
+    return unique
+
+def generate_question_candidates(topic, summary, n: int, client=None, existing: Optional[List[str]] = None,
+                                 deadline: Optional[Deadline] = None) -> List[Dict[str, str]]:
+    """
+    Gera até `n` cenários para o mesmo resumo em uma única chamada ao modelo.
+
+    Cada resposta é validada pelo esquema da etapa 'question' e os cenários quase
+    repetidos (entre si ou em relação a `existing`) são descartados.
+
+    Returns:
+        Lista de dicionários {'scenario', 'question'}, possivelmente com menos de `n` itens
+    """
+    if n <= 1:
+        question_data = generate_question(topic, summary, client=client, deadline=deadline)
+        return dedupe_question_candidates([question_data], existing)
+
+    logger.info(f"[QUESTION_AI] Gerando {n} candidatos de pergunta para tópico {topic}")
+    if client is None:
+        client = get_openai_client()
+
+    prompt_context = as_prompt_context(summary)
+    model = os.getenv('QUESTION_MODEL_ID', 'gpt-3.5-turbo')
+    contents = request_json_candidates(
+        client,
+        'question',
+        n,
+        deadline=deadline,
+        model=model,
+        messages=prompt_context.messages(question_prompt(topic)),
+        temperature=0.7
+    )
+
+    candidates = []
+    for index, content in enumerate(contents):
+        try:
+            candidates.append(parse_json_response(content.strip(), stage='question'))
+            metrics.record_result('question', model, metrics.RESULT_VALID)
+        except JSONParseError as e:
+            logger.warning(f"[QUESTION_AI] Candidato {index+1} sem JSON válido: {str(e)}")
+            metrics.record_result('question', model, metrics.RESULT_PARSE_ERROR)
+
+    unique = dedupe_question_candidates(candidates, existing)
+    logger.info(f"[QUESTION_AI] {len(unique)} de {n} candidatos aproveitados")
+    return unique
+
 def generate_answer_with_ai(
     question_data: Dict[str, str],
     topic: str,
@@ -686,8 +1144,9 @@ def generate_answer_with_ai(
     client: Any,
     api_key: str,
     model: str = None,
-    topic_summary: Dict[str, Any] = None,
-    related_summary: Dict[str, Any] = None
+    topic_summary: Union[PromptContext, Dict[str, Any], str] = None,
+    related_summary: Dict[str, Any] = None,
+    deadline: Optional[Deadline] = None
 ) -> Dict[str, Any]:
     """
     Gera a resposta correta com justificativa detalhada.
@@ -696,40 +1155,24 @@ def generate_answer_with_ai(
     logger.info(f"[ANSWER_AI] Iniciando geração de resposta para tópico {topic}")
     
     try:
-        # Preparar o contexto do resumo
-        summary_context = ""
-        if topic_summary:
-            if isinstance(topic_summary, dict):
-                summary_context = f"""Contexto do tópico principal:
-{topic_summary.get('summary', 'Sem resumo disponível')}
-
-Pontos-chave do tópico principal:
-{chr(10).join([f"- {point['point']}: {point['explanation']}" for point in topic_summary.get('key_points', [])]) if topic_summary.get('key_points') else 'Sem pontos-chave disponíveis'}
-
-Exemplos práticos:
-{chr(10).join([f"- {example['example']}: {example['context']}" for example in topic_summary.get('practical_examples', [])]) if topic_summary.get('practical_examples') else 'Sem exemplos disponíveis'}
-
-Referências PMBOK:
-{chr(10).join([f"- {ref['section']}: {ref['description']}" for ref in topic_summary.get('pmbok_references', [])]) if topic_summary.get('pmbok_references') else 'Sem referências disponíveis'}"""
-            else:
-                # Se o resumo for uma string, usa diretamente
-                summary_context = f"""Contexto do tópico principal:
-{topic_summary}"""
-
+        # Contexto do resumo (mensagem de sistema compartilhada entre as etapas)
+        prompt_context = as_prompt_context(topic_summary)
+        
+        # Tópico relacionado entra nas instruções, para não alterar o prefixo comum
+        related_context = ""
         if related_summary:
             if isinstance(related_summary, dict):
-                summary_context += f"\n\nTópico relacionado: {related_summary.get('topic', 'Sem tópico')}\n"
-                summary_context += f"Resumo: {related_summary.get('summary', 'Sem resumo')}\n"
-                summary_context += "Pontos-chave:\n"
-                summary_context += chr(10).join([f"- {point['point']}: {point['explanation']}" for point in related_summary.get('key_points', [])])
+                related_context += f"\n\nTópico relacionado: {related_summary.get('topic', 'Sem tópico')}\n"
+                related_context += f"Resumo: {related_summary.get('summary', 'Sem resumo')}\n"
+                related_context += "Pontos-chave:\n"
+                related_context += chr(10).join([f"- {point['point']}: {point['explanation']}" for point in related_summary.get('key_points', [])])
             else:
-                summary_context += f"\n\nTópico relacionado:\n{related_summary}"
+                related_context += f"\n\nTópico relacionado:\n{related_summary}"
         
         prompt = f"""Analise o seguinte cenário e pergunta sobre {topic}:
 
 {question_data['question']}
-
-{summary_context}
+{related_context}
 
 Gere uma resposta detalhada que inclua:
 1. A resposta correta
@@ -750,64 +1193,32 @@ def generate_answer_with_ai(
 O JSON DEVE ser válido e seguir exatamente o formato especificado."""
 
         logger.info("[ANSWER_AI] Enviando requisição para OpenAI")
-        response = client.chat.completions.create(
+        response_text = request_json_completion(
+            client,
+            'answer',
+            deadline=deadline,
             model=model,
-            messages=[
-                {"role": "system", "content": "Você é um especialista em gerenciamento de projetos com profundo conhecimento do PMBOK e certificação PMP. Sua resposta DEVE ser APENAS um objeto JSON válido."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1000
-        )
-
-        response_text = response.choices[0].message.content.strip()
+            messages=prompt_context.messages(prompt),
+            temperature=0.7
+        ).strip()
         logger.info(f"[ANSWER_AI] Resposta recebida: {response_text[:200]}...")
         
         try:
-            # Tentar extrair JSON da resposta
-            import re
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                answer_data = json.loads(json_str)
-            else:
-                logger.error(f"[ANSWER_AI] Nenhum JSON encontrado na resposta: {response_text}")
-                return None
-
+            # Extrair, reparar e validar a estrutura do JSON da resposta
+            answer_data = parse_json_response(response_text, stage='answer')
             logger.info("[ANSWER_AI] JSON decodificado com sucesso")
-        except json.JSONDecodeError as e:
+        except JSONParseError as e:
             logger.error(f"[ANSWER_AI] Erro ao decodificar JSON: {response_text}")
             logger.error(f"[ANSWER_AI] Erro específico: {str(e)}")
+            metrics.record_result('answer', model, metrics.RESULT_PARSE_ERROR)
             return None
 
-        if not isinstance(answer_data, dict):
-            logger.error(f"[ANSWER_AI] Formato inválido: {answer_data}")
-            return None
-
-        required_fields = {
-            "correct_answer": str,
-            "justification": str,
-            "pmbok_references": list,
-            "practical_examples": list
-        }
-
-        for field, expected_type in required_fields.items():
-            if field not in answer_data:
-                logger.error(f"[ANSWER_AI] Campo ausente: {field}")
-                return None
-            if not isinstance(answer_data[field], expected_type):
-                logger.error(f"[ANSWER_AI] Tipo inválido para {field}: esperado {expected_type}, recebido {type(answer_data[field])}")
-                return None
-
-        for field in ["pmbok_references", "practical_examples"]:
-            if not all(isinstance(item, str) for item in answer_data[field]):
-                logger.error(f"[ANSWER_AI] Itens inválidos na lista {field}")
-                return None
-
         # Validar usando a função validate_answer
         if not validate_answer(answer_data):
             logger.error("[ANSWER_AI] Falha na validação da resposta")
+            metrics.record_result('answer', model, metrics.RESULT_VALIDATION_ERROR)
             return None
+        metrics.record_result('answer', model, metrics.RESULT_VALID)
 
         answer_data["prompt"] = prompt
         answer_data["raw_response"] = response_text
@@ -815,10 +1226,61 @@ def generate_answer_with_ai(
         logger.info("[ANSWER_AI] Resposta gerada com sucesso")
         return answer_data
 
+    except (DeadlineExceeded, CircuitOpenError):
+        raise
     except Exception as e:
         logger.error(f"[ANSWER_AI] Erro ao gerar resposta: {str(e)}")
         return None
 
+def validate_answer_fields(answer_data: Any) -> bool:
+    """Verifica a estrutura (campos e tipos) da resposta gerada pela IA"""
+    errors = validate_schema(answer_data, STAGE_SCHEMAS['answer'])
+    for error in errors:
+        logger.error(f"[ANSWER_AI] {error}")
+    return not errors
+
+def distractor_length_range(correct_answer: str) -> Tuple[int, int, int, int]:
+    """
+    Calcula a faixa de tamanho (em palavras) recomendada para os distratores.
+
+    Returns:
+        Tupla (tamanho da resposta correta, diferença permitida, mínimo, máximo)
+    """
+    correct_answer_length = len(correct_answer.split())
+    allowed_difference = max(3, int(correct_answer_length * 0.3))
+    min_length = max(10, correct_answer_length - allowed_difference)
+    max_length = correct_answer_length + allowed_difference
+    return correct_answer_length, allowed_difference, min_length, max_length
+
+def validate_distractors(distractors: Any, correct_answer: str) -> Tuple[Optional[str], List[str]]:
+    """
+    Valida os distratores gerados pela IA.
+
+    Returns:
+        Tupla (mensagem de erro ou None, avisos sobre o tamanho dos distratores)
+    """
+    if not isinstance(distractors, list) or len(distractors) != 3:
+        logger.error(f"[DISTRACTORS] Formato inválido: {distractors}")
+        return "Erro ao gerar distratores: número incorreto de alternativas", []
+
+    if not all(isinstance(d, str) for d in distractors):
+        logger.error(f"[DISTRACTORS] Tipos inválidos: {distractors}")
+        return "Erro ao gerar distratores: formato inválido", []
+
+    all_options = distractors + [correct_answer]
+    if len(set(all_options)) != 4:
+        logger.error(f"[DISTRACTORS] Distratores duplicados ou iguais à resposta correta: {distractors}")
+        return "Erro ao gerar distratores: alternativas duplicadas", []
+
+    _, _, min_length, max_length = distractor_length_range(correct_answer)
+    warnings = []
+    for i, distractor in enumerate(distractors):
+        distractor_length = len(distractor.split())
+        if distractor_length < min_length or distractor_length > max_length:
+            warnings.append(f"Distrator {i+1} tem {distractor_length} palavras (recomendado: {min_length}-{max_length})")
+
+    return None, warnings
+
 def generate_distractors(
     question_data: Dict[str, str],
     answer_data: Dict[str, Any],
@@ -827,8 +1289,9 @@ def generate_distractors(
     client: Any,
     api_key: str,
     model: str = None,
-    topic_summary: Union[Dict[str, Any], str] = None,
-    related_summary: Dict[str, Any] = None
+    topic_summary: Union[PromptContext, Dict[str, Any], str] = None,
+    related_summary: Dict[str, Any] = None,
+    deadline: Optional[Deadline] = None
 ) -> Tuple[Dict[str, Any], List[str]]:
     """
     Gera distratores baseados na pergunta e resposta correta.
@@ -837,30 +1300,10 @@ def generate_distractors(
     logger.info(f"[DISTRACTORS] Iniciando geração de distratores para tópico {topic}")
     
     try:
-        # Combinar contexto dos resumos
-        logger.info("[DISTRACTORS] Combinando contexto dos resumos")
-        
-        # Tratar o resumo do tópico principal
-        if isinstance(topic_summary, dict):
-            logger.info("[DISTRACTORS] Processando resumo como dicionário")
-            summary_text = topic_summary.get('summary', 'Sem resumo disponível')
-            key_points = topic_summary.get('key_points', [])
-            key_points_text = chr(10).join([f"- {point['point']}: {point['explanation']}" for point in key_points]) if key_points else 'Sem pontos-chave disponíveis'
-        else:
-            logger.info("[DISTRACTORS] Processando resumo como string")
-            summary_text = topic_summary if topic_summary else 'Sem resumo disponível'
-            key_points_text = 'Sem pontos-chave disponíveis'
-            
-        combined_context = f"""Contexto do tópico principal:
-{summary_text}
+        # Contexto do resumo (mensagem de sistema compartilhada entre as etapas)
+        prompt_context = as_prompt_context(topic_summary)
 
-Pontos-chave do tópico principal:
-{key_points_text}"""
-
-        correct_answer_length = len(answer_data['correct_answer'].split())
-        allowed_difference = max(3, int(correct_answer_length * 0.3))
-        min_length = max(10, correct_answer_length - allowed_difference)
-        max_length = correct_answer_length + allowed_difference
+        correct_answer_length, allowed_difference, min_length, max_length = distractor_length_range(answer_data['correct_answer'])
 
         prompt = f"""Analise o seguinte cenário, pergunta e resposta correta sobre {topic}:
 
@@ -873,8 +1316,6 @@ def generate_distractors(
 Justificativa da Resposta:
 {answer_data['justification']}
 
-{combined_context}
-
 CRÍTICO: Você DEVE retornar APENAS um array JSON válido com exatamente 3 strings.
 NÃO inclua nenhum texto antes ou depois do JSON.
 NÃO inclua aspas ou formatação adicional.
@@ -896,54 +1337,31 @@ def generate_distractors(
 6. Ter entre {min_length} e {max_length} palavras (a resposta correta tem {correct_answer_length} palavras, permitindo uma diferença de {allowed_difference} palavras)"""
 
         logger.info("[DISTRACTORS] Enviando requisição para OpenAI")
-        response = client.chat.completions.create(
+        response_text = request_json_completion(
+            client,
+            'distractors',
+            deadline=deadline,
             model=model,
-            messages=[
-                {"role": "system", "content": "Você é um especialista em criar alternativas plausíveis para questões de gerenciamento de projetos. Sua resposta DEVE ser APENAS um array JSON válido."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-
-        response_text = response.choices[0].message.content.strip()
+            messages=prompt_context.messages(prompt),
+            temperature=0.7
+        ).strip()
         logger.info(f"[DISTRACTORS] Resposta recebida: {response_text[:200]}...")
         
         try:
-            # Tentar extrair JSON da resposta
-            import re
-            json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                distractors = json.loads(json_str)
-            else:
-                logger.error(f"[DISTRACTORS] Nenhum array JSON encontrado na resposta: {response_text}")
-                return None, ["Erro ao gerar distratores: formato inválido"]
-
+            # Extrair e reparar o array JSON da resposta
+            distractors = parse_json_response(response_text, stage='distractors')
             logger.info("[DISTRACTORS] JSON decodificado com sucesso")
-        except json.JSONDecodeError as e:
+        except JSONParseError as e:
             logger.error(f"[DISTRACTORS] Erro ao decodificar JSON: {response_text}")
             logger.error(f"[DISTRACTORS] Erro específico: {str(e)}")
+            metrics.record_result('distractors', model, metrics.RESULT_PARSE_ERROR)
             return None, ["Erro ao gerar distratores: formato inválido"]
 
-        if not isinstance(distractors, list) or len(distractors) != 3:
-            logger.error(f"[DISTRACTORS] Formato inválido: {distractors}")
-            return None, ["Erro ao gerar distratores: número incorreto de alternativas"]
-
-        if not all(isinstance(d, str) for d in distractors):
-            logger.error(f"[DISTRACTORS] Tipos inválidos: {distractors}")
-            return None, ["Erro ao gerar distratores: formato inválido"]
-
-        all_options = distractors + [answer_data['correct_answer']]
-        if len(set(all_options)) != 4:
-            logger.error(f"[DISTRACTORS] Distratores duplicados ou iguais à resposta correta: {distractors}")
-            return None, ["Erro ao gerar distratores: alternativas duplicadas"]
-
-        warnings = []
-        for i, distractor in enumerate(distractors):
-            distractor_length = len(distractor.split())
-            if distractor_length < min_length or distractor_length > max_length:
-                warnings.append(f"Distrator {i+1} tem {distractor_length} palavras (recomendado: {min_length}-{max_length})")
+        error, warnings = validate_distractors(distractors, answer_data['correct_answer'])
+        if error:
+            metrics.record_result('distractors', model, metrics.RESULT_VALIDATION_ERROR)
+            return None, [error]
+        metrics.record_result('distractors', model, metrics.RESULT_VALID)
 
         logger.info("[DISTRACTORS] Distratores gerados com sucesso")
         return {
@@ -953,10 +1371,143 @@ def generate_distractors(
             "warnings": warnings if warnings else []
         }, []
 
+    except (DeadlineExceeded, CircuitOpenError):
+        raise
     except Exception as e:
         logger.error(f"[DISTRACTORS] Erro ao gerar distratores: {str(e)}")
         return None, [f"Erro ao gerar distratores: {str(e)}"]
 
+def fused_prompt(topic) -> str:
+    """Instruções da engine fused (o contexto do resumo vai na mensagem de sistema)."""
+    return f'''Gere uma questão completa de múltipla escolha sobre {topic}.
+
+O cenário deve ser realista e contextualizado com a prática de gerenciamento de projetos.
+A pergunta deve ser clara e objetiva, sem incluir as alternativas.
+
+A resposta deve incluir:
+1. A resposta correta
+2. Uma justificativa completa explicando por que esta é a resposta correta
+3. Referências específicas ao PMBOK e boas práticas de gerenciamento de projetos
+4. Exemplos práticos que ajudem a entender o conceito
+5. Exatamente 3 alternativas incorretas (distratores) que sejam plausíveis, relacionadas
+   ao contexto, diferentes entre si e com tamanho semelhante ao da resposta correta
+   (diferença máxima de 30% no número de palavras, no mínimo 10 palavras)
+
+IMPORTANTE: Você DEVE retornar APENAS um objeto JSON válido com exatamente este formato:
+{{
+    "scenario": "Descrição do cenário",
+    "question": "Pergunta baseada no cenário",
+    "correct_answer": "Texto da resposta correta",
+    "justification": "Explicação detalhada de por que esta é a resposta correta",
+    "pmbok_references": ["Referência 1", "Referência 2"],
+    "practical_examples": ["Exemplo 1", "Exemplo 2"],
+    "distractors": ["Primeira alternativa incorreta", "Segunda alternativa incorreta", "Terceira alternativa incorreta"]
+}}
+
+NÃO inclua nenhum texto antes ou depois do JSON.'''
+
+def parse_fused_response(response_text: str, prompt: str, model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Extrai e valida a resposta da engine fused (também usada pelos resultados do Batch API).
+    Com `model` informado, o resultado é registrado nas métricas da etapa.
+
+    Returns:
+        Dicionário com 'question', 'answer', 'distractors' e 'warnings', ou None se inválida
+    """
+    def record(result):
+        if model:
+            metrics.record_result('fused', model, result)
+
+    try:
+        data = parse_json_response(response_text, stage='fused')
+    except JSONParseError as e:
+        logger.error(f"[FUSED_AI] Erro ao decodificar JSON: {response_text}")
+        logger.error(f"[FUSED_AI] Erro específico: {str(e)}")
+        record(metrics.RESULT_PARSE_ERROR)
+        return None
+    
+    missing_fields = [field for field in ['scenario', 'question'] if not data.get(field)]
+    if missing_fields:
+        logger.error(f"[FUSED_AI] Campos obrigatórios ausentes: {missing_fields}")
+        record(metrics.RESULT_VALIDATION_ERROR)
+        return None
+    question_data = {'scenario': data['scenario'], 'question': data['question']}
+    
+    # Mesmas validações das etapas de resposta e distratores do pipeline
+    answer_data = {field: data.get(field) for field in
+                   ['correct_answer', 'justification', 'pmbok_references', 'practical_examples']}
+    if not validate_answer_fields(answer_data) or not validate_answer(answer_data):
+        logger.error("[FUSED_AI] Falha na validação da resposta")
+        record(metrics.RESULT_VALIDATION_ERROR)
+        return None
+    
+    error, warnings = validate_distractors(data.get('distractors'), answer_data['correct_answer'])
+    if error:
+        logger.error(f"[FUSED_AI] {error}")
+        record(metrics.RESULT_VALIDATION_ERROR)
+        return None
+    record(metrics.RESULT_VALID)
+    
+    answer_data["prompt"] = prompt
+    answer_data["raw_response"] = response_text
+    
+    return {
+        'question': question_data,
+        'answer': answer_data,
+        'distractors': {
+            "distractors": data['distractors'],
+            "prompt": prompt,
+            "raw_response": response_text,
+            "warnings": warnings
+        },
+        'warnings': []
+    }
+
+def generate_fused_question(topic, summary, client=None, model=None,
+                            deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+    """
+    Gera cenário, pergunta, resposta, justificativa e distratores em uma única chamada.
+    Alternativa ao pipeline de três modelos (ver GENERATION_ENGINE).
+
+    Returns:
+        Dicionário com 'question', 'answer', 'distractors' e 'warnings' no mesmo
+        formato retornado pelas etapas do pipeline, ou None se a resposta for inválida.
+    """
+    logger.info(f"[FUSED_AI] Iniciando geração combinada para tópico {topic}")
+    
+    try:
+        if client is None:
+            logger.info("[FUSED_AI] Cliente não fornecido, inicializando novo cliente")
+            client = get_openai_client()
+        
+        prompt_context = as_prompt_context(summary)
+        
+        prompt = fused_prompt(topic)
+        model = model or os.getenv('FUSED_MODEL_ID', os.getenv('QUESTION_MODEL_ID', 'gpt-3.5-turbo'))
+
+        logger.info("[FUSED_AI] Enviando requisição para OpenAI")
+        response_text = request_json_completion(
+            client,
+            'fused',
+            deadline=deadline,
+            model=model,
+            messages=prompt_context.messages(prompt),
+            temperature=0.7
+        ).strip()
+        logger.info(f"[FUSED_AI] Resposta recebida: {response_text[:200]}...")
+        
+        fused_data = parse_fused_response(response_text, prompt, model=model)
+        if fused_data:
+            logger.info("[FUSED_AI] Questão gerada com sucesso")
+        return fused_data
+        
+    except (DeadlineExceeded, CircuitOpenError):
+        raise
+    except Exception as e:
+        logger.error(f"[FUSED_AI] Erro ao gerar questão: {str(e)}")
+        logger.error(f"[FUSED_AI] Stack trace: {traceback.format_exc()}")
+        return None
+
 def process_chunks_with_ai(chunks):
     """
     Processa chunks de texto usando a API do OpenAI.
@@ -969,7 +1520,7 @@ def process_chunks_with_ai(chunks):
             raise ValueError("API key não encontrada")
         
         # Inicializar cliente
-        client = OpenAI(api_key=api_key)
+        client = get_openai_client()
         
         processed_chunks = []
         
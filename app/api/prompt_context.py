@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Contexto de prompt pré-renderizado a partir de um resumo de tópico.
+
+O contexto (resumo, pontos-chave, exemplos práticos e referências PMBOK) é
+montado uma única vez por resumo e enviado como mensagem de sistema idêntica
+em todas as etapas da geração. Como o prefixo das mensagens é sempre o mesmo
+para um resumo, o cache de prompt do provedor pode ser reaproveitado entre
+pergunta, resposta, distratores e entre as questões do mesmo resumo.
+"""
+
+import os
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..database.db_manager import DatabaseManager
+from .token_budget import estimate_tokens, fit_summary_fields, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+# Versão do formato renderizado; contextos persistidos com outra versão são renderizados novamente
+PROMPT_CONTEXT_VERSION = 1
+
+PROMPT_CONTEXT_CACHE_SIZE = int(os.getenv('PROMPT_CONTEXT_CACHE_SIZE', '256'))
+
+# Instrução comum a todas as etapas. Deve permanecer idêntica entre as etapas
+# para que o prefixo das mensagens seja estável.
+SHARED_SYSTEM_PROMPT = (
+    "Você é um especialista em gerenciamento de projetos com profundo conhecimento do PMBOK "
+    "e da certificação PMP, responsável por elaborar questões de múltipla escolha para o exame. "
+    "Use o contexto abaixo como base. Sua resposta DEVE ser APENAS um JSON válido no formato pedido."
+)
+
+class PromptContext:
+    """Contexto renderizado de um resumo, pronto para ser usado nos prompts."""
+
+    def __init__(self, text: str, summary: str = '', key_points: Optional[List[str]] = None,
+                 summary_id: Optional[int] = None, updated_at: Optional[str] = None,
+                 fields: Optional[Dict[str, Any]] = None):
+        self.text = text
+        self.summary = summary
+        self.key_points = key_points or []
+        self.summary_id = summary_id
+        self.updated_at = updated_at
+        # Campos de origem (resumo, pontos-chave, exemplos, referências), usados para reduzir o contexto
+        self.fields = fields
+        self.system_prompt = f"{SHARED_SYSTEM_PROMPT}\n\n{text}" if text else SHARED_SYSTEM_PROMPT
+
+    def messages(self, instructions: str) -> List[Dict[str, str]]:
+        """Mensagens da chamada: prefixo estável (sistema + contexto) seguido das instruções da etapa."""
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": instructions}
+        ]
+
+    @property
+    def frontend(self) -> Dict[str, Any]:
+        """Resumo e pontos-chave exibidos junto com cada questão."""
+        return {'summary': self.summary, 'key_points': self.key_points}
+
+    def fit(self, max_tokens: int) -> 'PromptContext':
+        """
+        Retorna o contexto reduzido para caber em max_tokens (estimados).
+        Remove exemplos, depois referências e por fim trunca o resumo.
+        """
+        if estimate_tokens(self.text) <= max_tokens:
+            return self
+        if self.fields:
+            fields = fit_summary_fields(self.fields, max_tokens, lambda data: render_summary_context(data)[0])
+            text, _ = render_summary_context(fields)
+            return PromptContext(text, self.summary, self.key_points, summary_id=self.summary_id,
+                                 updated_at=self.updated_at, fields=fields)
+        return PromptContext(truncate_to_tokens(self.text, max_tokens), self.summary, self.key_points,
+                             summary_id=self.summary_id, updated_at=self.updated_at)
+
+    def to_json(self) -> str:
+        """Serializa o contexto para a coluna topic_summaries.prompt_context."""
+        return json.dumps({
+            'version': PROMPT_CONTEXT_VERSION,
+            'text': self.text,
+            'summary': self.summary,
+            'key_points': self.key_points
+        }, ensure_ascii=False)
+
+def _format_item(item: Any, title_key: str, detail_key: str) -> str:
+    """Formata um item do resumo ("título: detalhe"); aceita dicionário ou texto simples."""
+    if isinstance(item, dict):
+        title, detail = item.get(title_key, ''), item.get(detail_key, '')
+        return f"{title}: {detail}" if detail else str(title)
+    return str(item)
+
+def _bullets(items: Any, title_key: str, detail_key: str, empty: str) -> str:
+    lines = [f"- {_format_item(item, title_key, detail_key)}" for item in items or [] if item]
+    return chr(10).join(lines) if lines else empty
+
+def render_summary_context(summary) -> Tuple[str, Dict[str, Any]]:
+    """
+    Monta o contexto do resumo enviado nos prompts e os dados exibidos no frontend.
+
+    Returns:
+        Tupla (contexto para os prompts, {'summary', 'key_points'} para o frontend)
+    """
+    if not summary:
+        return "", {'summary': '', 'key_points': []}
+
+    if not isinstance(summary, dict):
+        # Se o resumo for uma string, usa diretamente
+        return f"""Contexto do tópico principal:
+{summary}""", {'summary': summary, 'key_points': []}
+
+    summary_context = f"""Contexto do tópico principal:
+{summary.get('summary', 'Sem resumo disponível')}
+
+Pontos-chave do tópico principal:
+{_bullets(summary.get('key_points'), 'point', 'explanation', 'Sem pontos-chave disponíveis')}
+
+Exemplos práticos:
+{_bullets(summary.get('practical_examples'), 'example', 'context', 'Sem exemplos disponíveis')}
+
+Referências PMBOK:
+{_bullets(summary.get('pmbok_references'), 'section', 'description', 'Sem referências disponíveis')}"""
+
+    frontend_summary = {
+        'summary': summary.get('summary', ''),
+        'key_points': [_format_item(point, 'point', 'explanation') for point in summary.get('key_points') or [] if point]
+    }
+    return summary_context, frontend_summary
+
+def build_prompt_context(summary: str, key_points: Any = None, practical_examples: Any = None,
+                         pmbok_references: Any = None, summary_id: Optional[int] = None,
+                         updated_at: Optional[str] = None) -> PromptContext:
+    """Renderiza o contexto de prompt a partir dos campos de um resumo."""
+    fields = {
+        'summary': summary,
+        'key_points': key_points,
+        'practical_examples': practical_examples,
+        'pmbok_references': pmbok_references
+    }
+    text, frontend = render_summary_context(fields)
+    return PromptContext(text, frontend['summary'], frontend['key_points'],
+                         summary_id=summary_id, updated_at=updated_at, fields=fields)
+
+def as_prompt_context(summary) -> PromptContext:
+    """Converte um resumo (PromptContext, dicionário ou texto) em PromptContext."""
+    if isinstance(summary, PromptContext):
+        return summary
+    text, frontend = render_summary_context(summary)
+    return PromptContext(text, frontend['summary'], frontend['key_points'],
+                         fields=summary if isinstance(summary, dict) else None)
+
+def _load_json(value: Optional[str]) -> Any:
+    try:
+        return json.loads(value) if value else []
+    except (TypeError, ValueError):
+        return []
+
+class _SummaryNotFound(LookupError):
+    """Resumo inexistente ou vazio; levantada para que lru_cache não guarde a falha."""
+
+@lru_cache(maxsize=PROMPT_CONTEXT_CACHE_SIZE)
+def _cached_prompt_context(summary_id: int, updated_at: Optional[str]) -> PromptContext:
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT summary, key_points, practical_examples, pmbok_references, prompt_context
+            FROM topic_summaries
+            WHERE id = ?
+        """, (summary_id,))
+        row = cursor.fetchone()
+
+    if not row or not row[0]:
+        raise _SummaryNotFound(summary_id)
+
+    if row[4]:
+        try:
+            stored = json.loads(row[4])
+            if stored.get('version') == PROMPT_CONTEXT_VERSION:
+                fields = {
+                    'summary': row[0],
+                    'key_points': _load_json(row[1]),
+                    'practical_examples': _load_json(row[2]),
+                    'pmbok_references': _load_json(row[3])
+                }
+                return PromptContext(stored['text'], stored.get('summary', ''), stored.get('key_points', []),
+                                     summary_id=summary_id, updated_at=updated_at, fields=fields)
+        except (TypeError, ValueError, KeyError):
+            logger.warning(f"[PROMPT-CONTEXT] Contexto persistido inválido para o resumo {summary_id}")
+
+    logger.info(f"[PROMPT-CONTEXT] Renderizando contexto do resumo {summary_id}")
+    return build_prompt_context(row[0], _load_json(row[1]), _load_json(row[2]), _load_json(row[3]),
+                                summary_id=summary_id, updated_at=updated_at)
+
+def get_prompt_context(summary_id: int, updated_at: Optional[str] = None) -> Optional[PromptContext]:
+    """
+    Retorna o contexto de prompt de um resumo, memoizado por (id, updated_at).
+    Uma atualização do resumo altera updated_at e invalida a entrada em cache.
+    Resumos não encontrados retornam None e não ficam em cache.
+    """
+    try:
+        return _cached_prompt_context(summary_id, updated_at)
+    except _SummaryNotFound:
+        logger.error(f"[PROMPT-CONTEXT] Resumo não encontrado para o ID: {summary_id}")
+        return None
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Estoque de questões pré-geradas por domínio.
+
+Os workers mantêm até INVENTORY_TARGET questões validadas e ainda não
+entregues (status 'inventory') para cada domínio. As rotas de geração
+entregam primeiro as questões do estoque e só geram ao vivo o que faltar.
+Quando o estoque de um domínio cai abaixo de INVENTORY_LOW_WATER, um job
+'refill_inventory' é enfileirado para repô-lo.
+"""
+
+import os
+import json
+import uuid
+import logging
+import threading
+import traceback
+from typing import Dict, List, Optional, Any
+
+from . import job_queue, metrics
+from .question_service import find_summary_ids_for_domain, get_used_summaries, insert_question
+from ..database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+STATUS_INVENTORY = 'inventory'
+STATUS_CLAIMED = 'claimed'
+
+REFILL_JOB_TYPE = 'refill_inventory'
+
+# Quantidade de questões mantidas em estoque por domínio (0 desativa o estoque)
+INVENTORY_TARGET = int(os.getenv('INVENTORY_TARGET', '10'))
+
+# Abaixo deste nível o estoque do domínio é reposto
+INVENTORY_LOW_WATER = int(os.getenv('INVENTORY_LOW_WATER', '3'))
+
+# Máximo de questões geradas por job de reposição
+INVENTORY_REFILL_BATCH = int(os.getenv('INVENTORY_REFILL_BATCH', '5'))
+
+# Intervalo (segundos) entre as verificações do estoque de todos os domínios
+INVENTORY_CHECK_INTERVAL = float(os.getenv('INVENTORY_CHECK_INTERVAL', '60'))
+
+def inventory_enabled() -> bool:
+    return INVENTORY_TARGET > 0
+
+def stock_level(domain: str) -> int:
+    """Número de questões disponíveis no estoque do domínio."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*) FROM question_inventory
+            WHERE domain = ? AND status = ?
+        ''', (domain, STATUS_INVENTORY))
+        return cursor.fetchone()[0]
+
+def stock_levels() -> Dict[str, int]:
+    """Número de questões disponíveis por domínio."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT domain, COUNT(*) FROM question_inventory
+            WHERE status = ?
+            GROUP BY domain
+        ''', (STATUS_INVENTORY,))
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+def insert_inventory_question(cursor, question: Dict[str, Any], domain: str, summary_id: int) -> int:
+    """Insere uma questão validada no estoque usando o cursor informado (sem commit)."""
+    cursor.execute('''
+        INSERT INTO question_inventory (domain, summary_id, question, status)
+        VALUES (?, ?, ?, ?)
+    ''', (domain, summary_id, json.dumps(question, ensure_ascii=False), STATUS_INVENTORY))
+    return cursor.lastrowid
+
+def add_to_inventory(question: Dict[str, Any], domain: str, summary_id: int) -> int:
+    """Guarda uma questão validada no estoque do domínio."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        inventory_id = insert_inventory_question(cursor, question, domain, summary_id)
+        conn.commit()
+        return inventory_id
+
+def claim_questions(domain: str, count: int, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Retira até `count` questões do estoque do domínio, salvando-as na tabela
+    questions como uma questão gerada ao vivo. Cada questão é entregue uma única vez.
+
+    Returns:
+        Lista de questões (com 'id' e 'summary_id'), mais antigas primeiro
+    """
+    if not inventory_enabled() or count <= 0:
+        return []
+
+    claim_token = uuid.uuid4().hex
+    claimed = []
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            # Um único UPDATE é atômico no SQLite, então duas requisições
+            # nunca recebem a mesma questão.
+            cursor.execute('''
+                UPDATE question_inventory
+                SET status = ?, claim_token = ?, claimed_by = ?, claimed_at = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM question_inventory
+                    WHERE domain = ? AND status = ?
+                    ORDER BY created_at, id
+                    LIMIT ?
+                )
+            ''', (STATUS_CLAIMED, claim_token, user_id, domain, STATUS_INVENTORY, count))
+            if cursor.rowcount == 0:
+                conn.commit()
+                metrics.record_cache('question_inventory', misses=count)
+                return []
+
+            cursor.execute('''
+                SELECT id, summary_id, question FROM question_inventory
+                WHERE claim_token = ?
+                ORDER BY created_at, id
+            ''', (claim_token,))
+            for row in cursor.fetchall():
+                question = json.loads(row['question'])
+                question['id'] = insert_question(cursor, question, domain, row['summary_id'])
+                question['summary_id'] = row['summary_id']
+                cursor.execute('UPDATE question_inventory SET question_id = ? WHERE id = ?',
+                               (question['id'], row['id']))
+                claimed.append(question)
+            conn.commit()
+    except Exception as e:
+        logger.error(f"[INVENTORY] Erro ao retirar questões do estoque de {domain}: {str(e)}")
+        logger.error(f"[INVENTORY] Stack trace: {traceback.format_exc()}")
+        return []
+
+    logger.info(f"[INVENTORY] {len(claimed)} questões entregues do estoque de {domain}")
+    metrics.record_cache('question_inventory', hits=len(claimed), misses=count - len(claimed))
+    request_refill(domain)
+    return claimed
+
+def claimed_summaries(questions: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Resumos usados pelas questões retiradas do estoque (formato de used_summaries)."""
+    summary_ids = []
+    for question in questions:
+        if question.get('summary_id') and question['summary_id'] not in summary_ids:
+            summary_ids.append(question['summary_id'])
+    return get_used_summaries(summary_ids)
+
+def request_refill(domain: str, force: bool = False) -> Optional[str]:
+    """
+    Enfileira a reposição do estoque do domínio se ele estiver abaixo do
+    nível mínimo e ainda não houver reposição pendente.
+
+    Returns:
+        ID do job enfileirado, ou None
+    """
+    if not inventory_enabled():
+        return None
+    try:
+        level = stock_level(domain)
+        if level >= INVENTORY_TARGET or (level >= INVENTORY_LOW_WATER and not force):
+            return None
+        if job_queue.find_active_job(REFILL_JOB_TYPE, {'domain': domain}):
+            return None
+        job_id = job_queue.enqueue_job(REFILL_JOB_TYPE, {'domain': domain})
+        logger.info(f"[INVENTORY] Estoque de {domain} com {level} questões: reposição enfileirada ({job_id})")
+        return job_id
+    except Exception as e:
+        logger.error(f"[INVENTORY] Erro ao solicitar reposição de {domain}: {str(e)}")
+        return None
+
+def check_inventory():
+    """Verifica o estoque de todos os domínios com resumos e enfileira as reposições necessárias."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT name FROM domains ORDER BY name')
+        domains = [row[0] for row in cursor.fetchall()]
+
+    levels = stock_levels()
+    for domain in domains:
+        if levels.get(domain, 0) >= INVENTORY_LOW_WATER:
+            continue
+        # Domínios sem resumos não têm como gerar questões
+        if not find_summary_ids_for_domain(domain):
+            continue
+        request_refill(domain)
+
+def run_inventory_filler(stop_event: threading.Event = None):
+    """Loop do serviço de reposição: verifica o estoque a cada INVENTORY_CHECK_INTERVAL segundos."""
+    stop_event = stop_event or threading.Event()
+    if not inventory_enabled():
+        logger.info("[INVENTORY] Estoque desativado (INVENTORY_TARGET=0)")
+        return
+
+    logger.info(f"[INVENTORY] Serviço de reposição iniciado (alvo: {INVENTORY_TARGET}, "
+                f"mínimo: {INVENTORY_LOW_WATER} questões por domínio)")
+    while not stop_event.is_set():
+        try:
+            check_inventory()
+        except Exception as e:
+            logger.error(f"[INVENTORY] Erro ao verificar estoque: {str(e)}")
+            logger.error(f"[INVENTORY] Stack trace: {traceback.format_exc()}")
+        stop_event.wait(INVENTORY_CHECK_INTERVAL)
+    logger.info("[INVENTORY] Serviço de reposição finalizado")
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Serviço de geração de questões por domínio - compartilhado entre rotas e workers
+"""
+
+import json
+import random
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+from . import job_queue
+from ..database.db_manager import DatabaseManager
+from .prompt_context import get_prompt_context, build_prompt_context
+from ..utils.domain_classifier import domain_key, domain_keys
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+SUMMARIZE_JOB_TYPE = 'summarize'
+
+def find_summary_ids_for_domain(domain: str) -> List[int]:
+    """
+    Retorna os IDs dos resumos (com conteúdo) associados a um domínio,
+    comparando só as chaves gravadas em domain_keys (ver domain_classifier.domain_key).
+    """
+    key = domain_key(domain)
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT ts.id FROM topic_summaries ts, json_each(ts.domain_keys) AS key
+            WHERE key.value = ? AND ts.summary IS NOT NULL AND ts.summary != ''
+            ORDER BY ts.id
+        """, (key,))
+        found_summary_ids = [row[0] for row in cursor.fetchall()]
+
+        if not found_summary_ids:
+            cursor.execute("SELECT COUNT(*) FROM topic_summaries WHERE domain_keys IS NULL")
+            missing = cursor.fetchone()[0]
+            if missing:
+                # setup_database preenche as chaves ao iniciar (backfill_domain_keys)
+                logger.warning(f"[GENERATE-QUESTIONS] {missing} resumos sem domain_keys; "
+                               f"serão preenchidas no próximo setup_database")
+
+    logger.info(f"[GENERATE-QUESTIONS] {len(found_summary_ids)} resumos para o domínio {key}")
+    return found_summary_ids
+
+def load_summary(summary_id: int) -> Optional[Dict[str, Any]]:
+    """Carrega um resumo no formato usado pela geração de questões."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT
+                summary,
+                key_points,
+                practical_examples,
+                pmbok_references,
+                domains,
+                document_title,
+                updated_at
+            FROM topic_summaries
+            WHERE id = ?
+        """, (summary_id,))
+
+        result = cursor.fetchone()
+        if not result or not result[0]:
+            logger.error(f"[GENERATE-QUESTIONS] Resumo não encontrado para o ID: {summary_id}")
+            return None
+
+        return {
+            'id': summary_id,
+            'summary': result[0],
+            'key_points': json.loads(result[1]) if result[1] else [],
+            'practical_examples': json.loads(result[2]) if result[2] else [],
+            'pmbok_references': json.loads(result[3]) if result[3] else [],
+            'domains': result[4],
+            'document_title': result[5],
+            'updated_at': result[6]
+        }
+
+def get_used_summaries(summary_ids: List[int]) -> List[Dict[str, str]]:
+    """Busca documento e resumo de cada ID para exibição."""
+    used_summaries = []
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        for summary_id in summary_ids:
+            cursor.execute("""
+                SELECT document_title, summary
+                FROM topic_summaries
+                WHERE id = ?
+            """, (summary_id,))
+            summary_result = cursor.fetchone()
+            if summary_result:
+                used_summaries.append({
+                    'document': summary_result[0],
+                    'summary': summary_result[1]
+                })
+    return used_summaries
+
+def select_domain_summary(domain: str) -> Optional[Dict[str, Any]]:
+    """
+    Escolhe aleatoriamente um dos resumos do domínio.
+
+    Returns:
+        Dicionário do resumo (ver load_summary) acrescido de 'used_summaries',
+        ou None se o domínio não tiver resumos.
+    """
+    found_summary_ids = find_summary_ids_for_domain(domain)
+    if not found_summary_ids:
+        logger.error(f"[GENERATE-QUESTIONS] No summary found for domain: {domain}")
+        return None
+
+    # Escolhe um resumo aleatoriamente
+    selected_id = random.choice(found_summary_ids)
+    logger.info(f"[GENERATE-QUESTIONS] Resumo selecionado aleatoriamente: ID {selected_id}")
+
+    summary_data = load_summary(selected_id)
+    if not summary_data:
+        return None
+
+    logger.info(f"[GENERATE-QUESTIONS] Processando resumo para domínio {domain}")
+    logger.info(f"[GENERATE-QUESTIONS] Primeiros 100 caracteres do resumo: {summary_data['summary'][:100]}")
+
+    summary_data['used_summaries'] = get_used_summaries(found_summary_ids)
+    return summary_data
+
+def summary_prompt_context(summary_data: Dict[str, Any]):
+    """
+    Contexto de prompt do resumo selecionado, memoizado por (id, updated_at).
+    Usa o texto do resumo se o contexto não puder ser carregado.
+    """
+    return get_prompt_context(summary_data['id'], summary_data.get('updated_at')) or summary_data['summary']
+
+def insert_question(cursor, question: Dict[str, Any], domain: str, summary_id: int) -> int:
+    """Insere uma questão gerada usando o cursor informado (sem commit)."""
+    metadata = json.dumps({
+        'summary_id': summary_id,
+        'generated_at': datetime.now().isoformat()
+    })
+    cursor.execute('''
+        INSERT INTO questions (
+            question, options, correct_answer, explanation,
+            topic, metadata, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (
+        question['question'],
+        json.dumps(question['options']),
+        question['correct_answer'],
+        question['explanation'],
+        domain,
+        metadata
+    ))
+    return cursor.lastrowid
+
+def save_generated_question(question: Dict[str, Any], domain: str, summary_id: int) -> Optional[int]:
+    """Salva uma questão gerada e retorna seu ID (None em caso de erro)."""
+    try:
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            question_id = insert_question(cursor, question, domain, summary_id)
+            conn.commit()
+            logger.info(f"[GENERATE-QUESTIONS] Questão salva com ID: {question_id}")
+            return question_id
+    except Exception as e:
+        logger.error(f"[GENERATE-QUESTIONS] Erro ao salvar questão: {str(e)}")
+        logger.error("[GENERATE-QUESTIONS] Stack trace:", exc_info=True)
+        return None
+
+def _upsert_topic_summary(cursor, document_title: str, topic: str, summary_data: Dict[str, Any],
+                          source_sha256: Optional[str] = None, prompt_version: Optional[int] = None) -> int:
+    """Grava (ou atualiza) um resumo usando o cursor recebido; o commit fica com quem chama."""
+    # Contexto de prompt renderizado uma vez, junto com o resumo
+    prompt_context = build_prompt_context(
+        summary_data['summary'],
+        summary_data['key_points'],
+        summary_data['practical_examples'],
+        summary_data['pmbok_references']
+    ).to_json()
+
+    # Verificar se já existe um resumo para este tópico
+    cursor.execute("""
+        SELECT id FROM topic_summaries 
+        WHERE document_title = ? AND topic = ?
+    """, (document_title, topic))
+
+    existing_summary = cursor.fetchone()
+
+    if existing_summary:
+        # Atualizar resumo existente
+        cursor.execute("""
+            UPDATE topic_summaries 
+            SET summary = ?, key_points = ?, practical_examples = ?,
+                pmbok_references = ?, domains = ?, domain_keys = ?, prompt_context = ?,
+                source_sha256 = ?, prompt_version = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (
+            summary_data['summary'],
+            json.dumps(summary_data['key_points']),
+            json.dumps(summary_data['practical_examples']),
+            json.dumps(summary_data['pmbok_references']),
+            json.dumps(summary_data['domains']),
+            json.dumps(domain_keys(summary_data['domains'])),
+            prompt_context,
+            source_sha256,
+            prompt_version,
+            existing_summary[0]
+        ))
+        summary_id = existing_summary[0]
+        logger.info(f"[PROCESS-TOPIC] Resumo atualizado com ID: {summary_id}")
+    else:
+        # Inserir novo resumo
+        cursor.execute("""
+            INSERT INTO topic_summaries 
+            (document_title, topic, summary, key_points, practical_examples,
+             pmbok_references, domains, domain_keys, prompt_context, source_sha256, prompt_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            document_title,
+            topic,
+            summary_data['summary'],
+            json.dumps(summary_data['key_points']),
+            json.dumps(summary_data['practical_examples']),
+            json.dumps(summary_data['pmbok_references']),
+            json.dumps(summary_data['domains']),
+            json.dumps(domain_keys(summary_data['domains'])),
+            prompt_context,
+            source_sha256,
+            prompt_version
+        ))
+        summary_id = cursor.lastrowid
+        logger.info(f"[PROCESS-TOPIC] Novo resumo salvo com ID: {summary_id}")
+    return summary_id
+
+def save_topic_summary(document_title: str, topic: str, summary_data: Dict[str, Any],
+                       source_sha256: Optional[str] = None, prompt_version: Optional[int] = None) -> int:
+    """Grava (ou atualiza) o resumo do tópico em topic_summaries e retorna seu ID."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        summary_id = _upsert_topic_summary(cursor, document_title, topic, summary_data,
+                                           source_sha256, prompt_version)
+        conn.commit()
+    return summary_id
+
+def save_topic_summaries(document_title: str, items: List[Dict[str, Any]]) -> List[int]:
+    """
+    Grava vários resumos do documento numa única transação.
+
+    Args:
+        items: dicts com 'topic', 'summary_data' e, opcionalmente, 'source_sha256' e 'prompt_version'
+
+    Returns:
+        IDs dos resumos, na ordem de items
+    """
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        summary_ids = [_upsert_topic_summary(cursor, document_title, item['topic'], item['summary_data'],
+                                             item.get('source_sha256'), item.get('prompt_version'))
+                       for item in items]
+        conn.commit()
+    return summary_ids
+
+def copy_topic_summaries(source_title: str, target_title: str) -> int:
+    """
+    Copia os tópicos (e resumos) de um documento para outro com o mesmo conteúdo,
+    sem sobrescrever os tópicos que o destino já tem.
+
+    Returns:
+        Número de tópicos copiados
+    """
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO topic_summaries (
+                document_title, topic, summary, key_points, practical_examples, pmbok_references,
+                domains, domain_keys, prompt_context, source_sha256, prompt_version, created_at
+            )
+            SELECT ?, topic, summary, key_points, practical_examples, pmbok_references,
+                   domains, domain_keys, prompt_context, source_sha256, prompt_version, CURRENT_TIMESTAMP
+            FROM topic_summaries AS source
+            WHERE source.document_title = ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM topic_summaries AS target
+                  WHERE target.document_title = ? AND target.topic = source.topic
+              )
+        ''', (target_title, source_title, target_title))
+        copied = cursor.rowcount
+        conn.commit()
+    if copied:
+        logger.info(f"[TOPIC-SUMMARY] {copied} tópicos de {source_title} copiados para {target_title}")
+    return copied
+
+def enqueue_topic_summary(document_title: str, topic: str, pdf_path: str,
+                          user_id: Optional[int] = None) -> str:
+    """
+    Enfileira a geração do resumo do tópico para os workers (ex.: modelo
+    indisponível), reaproveitando um job pendente do mesmo tópico.
+
+    Returns:
+        ID do job
+    """
+    params = {'document_title': document_title, 'topic': topic}
+    job = job_queue.find_active_job(SUMMARIZE_JOB_TYPE, params)
+    if job:
+        return job['id']
+    return job_queue.enqueue_job(SUMMARIZE_JOB_TYPE, dict(params, pdf_path=pdf_path), user_id=user_id)
+
+def serve_stored_questions(domain: str, count: int, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Questões já salvas do domínio que o usuário ainda não recebeu, usadas no
+    lugar da geração ao vivo enquanto o modelo está indisponível.
+
+    "Ainda não recebeu" exclui as questões entregues por este fallback e as
+    retiradas do estoque pelo usuário (as geradas ao vivo não são rastreadas
+    por usuário). Cada entrega é registrada em question_deliveries.
+
+    Returns:
+        Até `count` questões em ordem aleatória, no formato de generate_questions (com 'id')
+    """
+    if count <= 0:
+        return []
+
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, question, options, correct_answer, explanation, metadata
+            FROM questions
+            WHERE topic = ?
+              AND id NOT IN (SELECT question_id FROM question_deliveries WHERE user_id IS ?)
+              AND id NOT IN (
+                  SELECT question_id FROM question_inventory
+                  WHERE claimed_by IS ? AND question_id IS NOT NULL
+              )
+            ORDER BY RANDOM()
+            LIMIT ?
+        ''', (domain, user_id, user_id, count))
+        rows = cursor.fetchall()
+
+        questions = []
+        for row in rows:
+            try:
+                metadata = json.loads(row['metadata'] or '{}')
+            except (TypeError, ValueError):
+                metadata = {}
+            questions.append({
+                'id': row['id'],
+                'question': row['question'],
+                'options': json.loads(row['options'] or '[]'),
+                'correct_answer': row['correct_answer'],
+                'explanation': row['explanation'],
+                'justification': row['explanation'],
+                'summary_id': metadata.get('summary_id'),
+                'stored': True
+            })
+            cursor.execute('''
+                INSERT INTO question_deliveries (user_id, question_id) VALUES (?, ?)
+            ''', (user_id, row['id']))
+        conn.commit()
+
+    logger.info(f"[GENERATE-QUESTIONS] {len(questions)} questões salvas de {domain} entregues sem gerar")
+    return questions
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Limite de requisições por minuto às chamadas ao modelo, por model id.
+
+Um token bucket por modelo, compartilhado por todas as threads do processo:
+chamadas em paralelo (ex.: os resumos de summarize_document ou as etapas de
+generate_questions) esperam a vez em vez de estourar o limite do provedor e
+receber 429. Assim como as métricas e o circuit breaker, o estado é por
+processo; com vários workers, divida o limite da conta entre eles.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+from .deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Requisições por minuto por modelo em cada processo (0 desativa o limite)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv('LLM_REQUESTS_PER_MINUTE', '0'))
+
+# Requisições que podem sair de uma vez depois de um período ocioso
+LLM_RATE_LIMIT_BURST = int(os.getenv('LLM_RATE_LIMIT_BURST', '5'))
+
+class TokenBucket:
+    """Token bucket de um modelo."""
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Consome um token; retorna 0 ou os segundos até haver um token."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, deadline: Optional[Deadline] = None, stage: Optional[str] = None) -> float:
+        """
+        Espera um token, respeitando o deadline.
+
+        Returns:
+            Segundos esperados
+
+        Raises:
+            DeadlineExceeded: o prazo acaba antes de haver um token
+        """
+        waited_since = time.monotonic()
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return time.monotonic() - waited_since
+            if deadline is None:
+                time.sleep(wait)
+                continue
+            remaining = deadline.remaining()
+            if remaining is not None and remaining < wait:
+                raise DeadlineExceeded(f"Limite de requisições do modelo: sem vaga dentro do prazo da etapa {stage}")
+            if deadline.wait(wait):
+                deadline.check(stage)
+
+_buckets: Dict[str, TokenBucket] = {}
+_registry_lock = threading.Lock()
+
+def enabled() -> bool:
+    return LLM_REQUESTS_PER_MINUTE > 0
+
+def acquire(model: Optional[str], deadline: Optional[Deadline] = None, stage: Optional[str] = None) -> float:
+    """Espera a vez de uma chamada ao modelo (retorna na hora se o limite estiver desativado)."""
+    if not enabled():
+        return 0.0
+    with _registry_lock:
+        bucket = _buckets.setdefault(model or 'desconhecido',
+                                     TokenBucket(LLM_REQUESTS_PER_MINUTE, LLM_RATE_LIMIT_BURST))
+    waited = bucket.acquire(deadline, stage)
+    if waited >= 1:
+        logger.info(f"[RATE-LIMIT] Chamada da etapa {stage} ao modelo {model} aguardou {waited:.1f}s")
+    return waited
+
+def reset():
+    """Reinicia os buckets (ex.: entre rodadas de um benchmark)."""
+    with _registry_lock:
+        _buckets.clear()
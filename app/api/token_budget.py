@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Contabilidade de tokens das chamadas aos modelos.
+
+- Estimativa local de tokens (sem rede), compatível com a pré-tokenização
+  BPE dos modelos GPT (cl100k): o texto é quebrado nos mesmos tipos de
+  trechos (palavras, números, pontuação, espaços) e cada trecho é
+  convertido em uma estimativa de sub-tokens.
+- Orçamentos de entrada e saída por etapa (question, answer, distractors,
+  fused, summary), configuráveis por variáveis de ambiente.
+- Ajuste do contexto do resumo ao orçamento, removendo primeiro os
+  exemplos práticos, depois as referências e, por fim, truncando o resumo.
+"""
+
+import os
+import re
+import math
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Janela de contexto (tokens) por família de modelo; o prefixo mais longo vence
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-3.5-turbo-0613': 4096,
+    'gpt-4': 8192,
+    'gpt-4-32k': 32768,
+    'gpt-4-turbo': 128000,
+    'gpt-4-1106': 128000,
+    'gpt-4-0125': 128000,
+    'gpt-4o': 128000
+}
+DEFAULT_CONTEXT_WINDOW = int(os.getenv('TOKEN_DEFAULT_CONTEXT_WINDOW', '4096'))
+
+# Limite de tokens de saída (max_tokens) por etapa
+STAGE_OUTPUT_BUDGETS = {
+    'question': 500,
+    'answer': 1000,
+    'distractors': 500,
+    'fused': 1500,
+    'summary': 2000
+}
+
+# Limite de tokens de entrada (prompt completo) por etapa
+STAGE_INPUT_BUDGETS = {
+    'question': 3000,
+    'answer': 3500,
+    'distractors': 3500,
+    'fused': 3500,
+    'summary': 12000
+}
+
+# Tokens reservados para as instruções de cada etapa ao ajustar o contexto do resumo
+INSTRUCTION_RESERVE_TOKENS = int(os.getenv('TOKEN_INSTRUCTION_RESERVE', '800'))
+
+# Folga para diferenças entre a estimativa local e a contagem real
+SAFETY_MARGIN_TOKENS = int(os.getenv('TOKEN_SAFETY_MARGIN', '64'))
+
+MIN_OUTPUT_TOKENS = 100
+
+# Custo fixo de cada mensagem no formato de chat e da resposta
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+TRUNCATION_MARKER = ' [...]'
+
+# Mesma divisão em trechos usada pelo tokenizador cl100k (adaptada ao módulo re)
+_PRETOKEN = re.compile(
+    r"'(?:[sdmt]|ll|ve|re)|[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+",
+    re.IGNORECASE
+)
+
+def _budget_from_env(stage: str, kind: str, default: int) -> int:
+    return int(os.getenv(f'TOKEN_BUDGET_{stage.upper()}_{kind}', str(default)))
+
+def _piece_tokens(piece: str) -> int:
+    """Estimativa de sub-tokens BPE de um trecho pré-tokenizado."""
+    stripped = piece.strip()
+    if not stripped:
+        return 1
+    if stripped.isdigit():
+        return 1
+    if stripped[-1].isalpha():
+        # Palavras em inglês costumam virar 1 token a cada ~4 caracteres; caracteres
+        # fora do ASCII (acentos) ocupam mais bytes e geram mais sub-tokens.
+        non_ascii = sum(1 for char in stripped if ord(char) > 127)
+        return max(1, math.ceil(len(stripped) / 4) + math.ceil(non_ascii / 2))
+    return max(1, math.ceil(len(stripped.encode('utf-8')) / 2))
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estima o número de tokens de um texto."""
+    if not text:
+        return 0
+    return sum(_piece_tokens(piece) for piece in _PRETOKEN.findall(text))
+
+def token_spans(text: str, max_tokens: int) -> Iterator[Tuple[int, int, int]]:
+    """
+    Divide o texto em trechos consecutivos de até max_tokens (estimados), sem
+    cortar palavras, como (início, fim, tokens).
+    """
+    start = end = used = 0
+    for match in _PRETOKEN.finditer(text):
+        cost = _piece_tokens(match.group(0))
+        if used and used + cost > max_tokens:
+            yield start, end, used
+            start, used = end, 0
+        used += cost
+        end = match.end()
+    if used:
+        yield start, end, used
+
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    """Estima os tokens de entrada de uma chamada de chat."""
+    return sum(TOKENS_PER_MESSAGE + estimate_tokens(message.get('content')) for message in messages) + TOKENS_PER_REPLY
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Trunca o texto para caber em max_tokens (estimados), sem cortar palavras."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(0, max_tokens - estimate_tokens(TRUNCATION_MARKER))
+    used = 0
+    end = 0
+    for match in _PRETOKEN.finditer(text):
+        cost = _piece_tokens(match.group(0))
+        if used + cost > limit:
+            break
+        used += cost
+        end = match.end()
+    return text[:end].rstrip() + TRUNCATION_MARKER
+
+def model_context_window(model: Optional[str]) -> int:
+    """Janela de contexto do modelo (modelos fine-tuned usam a do modelo base)."""
+    if not model:
+        return DEFAULT_CONTEXT_WINDOW
+    name = model.split(':')[1] if model.startswith('ft:') else model
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if name.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+def output_budget(stage: str) -> int:
+    """max_tokens padrão da etapa."""
+    return _budget_from_env(stage, 'OUTPUT', STAGE_OUTPUT_BUDGETS.get(stage, 1000))
+
+def input_budget(stage: str, model: Optional[str] = None) -> int:
+    """Tokens de entrada disponíveis para a etapa, limitados pela janela do modelo."""
+    budget = _budget_from_env(stage, 'INPUT', STAGE_INPUT_BUDGETS.get(stage, 3000))
+    available = model_context_window(model) - output_budget(stage) - SAFETY_MARGIN_TOKENS
+    return max(0, min(budget, available))
+
+def context_budget(stage_models: Dict[str, Optional[str]]) -> int:
+    """
+    Tokens disponíveis para o contexto do resumo, compartilhado por todas as
+    etapas informadas ({etapa: modelo}). Usa o menor orçamento entre elas
+    para que o contexto (e o prefixo das mensagens) seja o mesmo em todas.
+    """
+    budgets = [input_budget(stage, model) for stage, model in stage_models.items()]
+    return max(0, min(budgets) - INSTRUCTION_RESERVE_TOKENS) if budgets else 0
+
+def fit_max_tokens(stage: str, model: Optional[str], prompt_tokens: int, requested: Optional[int] = None) -> int:
+    """
+    max_tokens da chamada: o orçamento da etapa (ou o valor pedido), reduzido
+    se o prompt estimado não deixar espaço suficiente na janela do modelo.
+    """
+    limit = requested or output_budget(stage)
+    room = model_context_window(model) - prompt_tokens - SAFETY_MARGIN_TOKENS
+    if room < limit:
+        logger.warning(f"[TOKENS] {stage}: prompt estimado em {prompt_tokens} tokens deixa apenas "
+                       f"{room} tokens de saída no modelo {model} (orçamento: {limit})")
+        limit = max(MIN_OUTPUT_TOKENS, room)
+    return limit
+
+def fit_summary_fields(fields: Dict[str, Any], max_tokens: int, render) -> Dict[str, Any]:
+    """
+    Reduz os campos do resumo até o contexto renderizado caber em max_tokens.
+    Ordem: remove exemplos práticos, depois referências PMBOK, depois trunca o resumo.
+
+    Args:
+        fields: {'summary', 'key_points', 'practical_examples', 'pmbok_references'}
+        render: função que renderiza os campos no texto do contexto
+    """
+    if estimate_tokens(render(fields)) <= max_tokens:
+        return fields
+
+    fitted = dict(fields)
+    for field in ('practical_examples', 'pmbok_references'):
+        if fitted.get(field):
+            fitted[field] = []
+            logger.info(f"[TOKENS] Contexto acima de {max_tokens} tokens: removendo {field}")
+            if estimate_tokens(render(fitted)) <= max_tokens:
+                return fitted
+
+    # O que sobra do orçamento depois da estrutura fixa vai para o texto do resumo
+    available = max_tokens - estimate_tokens(render(dict(fitted, summary='')))
+    fitted['summary'] = truncate_to_tokens(fitted.get('summary') or '', max(0, available))
+    logger.info(f"[TOKENS] Contexto acima de {max_tokens} tokens: resumo truncado")
+    return fitted
+
+def log_usage(stage: str, model: Optional[str], estimated_prompt: int, max_tokens: int, usage: Any = None):
+    """Registra a estimativa local comparada ao uso real informado pela API (response.usage)."""
+    if usage is None:
+        logger.info(f"[TOKENS] {stage} ({model}): prompt estimado {estimated_prompt}, max_tokens {max_tokens}")
+        return
+    prompt_tokens = getattr(usage, 'prompt_tokens', None)
+    completion_tokens = getattr(usage, 'completion_tokens', None)
+    error = ''
+    if prompt_tokens:
+        error = f" (erro da estimativa: {(estimated_prompt - prompt_tokens) / prompt_tokens:+.0%})"
+    logger.info(f"[TOKENS] {stage} ({model}): prompt estimado {estimated_prompt}, real {prompt_tokens}{error}; "
+                f"saída {completion_tokens}/{max_tokens}")
+    if completion_tokens is not None and completion_tokens >= max_tokens:
+        logger.warning(f"[TOKENS] {stage}: resposta atingiu max_tokens ({max_tokens}) e pode estar truncada")
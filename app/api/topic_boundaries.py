@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Fronteiras dos tópicos de cada PDF, guardadas em topic_boundaries.
+
+A segmentação (utils/topic_segmenter.py) é feita uma vez por conteúdo de
+arquivo (SHA-256) e guarda o número, o título e a posição de cada tópico no
+texto extraído. O resumo de um tópico recebe só esse trecho, em vez do
+documento inteiro.
+"""
+
+import re
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..database.db_manager import DatabaseManager
+from ..utils.extraction_cache import content_hash
+from ..utils.pdf_utils import extract_pdf_document, iter_pdf_pages
+from ..utils.topic_segmenter import SEGMENTER_VERSION, TopicBlock, segment_topics
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+def save_boundaries(document_sha256: str, blocks: List[TopicBlock]):
+    """Substitui as fronteiras guardadas do documento."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM topic_boundaries WHERE document_sha256 = ?', (document_sha256,))
+        cursor.executemany('''
+            INSERT INTO topic_boundaries (document_sha256, position, topic, label, title, start_offset,
+                                          end_offset, start_page, end_page, segmenter_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(document_sha256, position, block.number, block.label, block.title, block.start_offset,
+               block.end_offset, block.start_page, block.end_page, SEGMENTER_VERSION)
+              for position, block in enumerate(blocks)])
+        conn.commit()
+    logger.info(f"[TOPIC-BOUNDARIES] {len(blocks)} tópicos guardados para o documento {document_sha256[:12]}")
+
+def load_boundaries(document_sha256: str) -> Optional[List[Dict[str, Any]]]:
+    """Fronteiras guardadas do documento (None se ainda não foi segmentado com a versão atual)."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM topic_boundaries
+            WHERE document_sha256 = ? AND segmenter_version = ?
+            ORDER BY position
+        ''', (document_sha256, SEGMENTER_VERSION))
+        rows = cursor.fetchall()
+    return [dict(row) for row in rows] or None
+
+def iter_document_topics(pdf_path: str) -> Iterator[TopicBlock]:
+    """
+    Tópicos do PDF em streaming (ver topic_segmenter). Se o documento for lido
+    até o fim, as fronteiras são guardadas.
+    """
+    document_sha256 = content_hash(pdf_path)
+    blocks = []
+    for block in segment_topics(iter_pdf_pages(pdf_path)):
+        # Só a posição é guardada; o conteúdo não fica retido em memória
+        blocks.append(TopicBlock(block.number, block.label, block.title, '', block.start_page,
+                                 block.end_page, block.start_offset, block.end_offset))
+        yield block
+    save_boundaries(document_sha256, blocks)
+
+def document_boundaries(pdf_path: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Hash do PDF e as fronteiras dos tópicos, segmentando o documento se necessário."""
+    document_sha256 = content_hash(pdf_path)
+    boundaries = load_boundaries(document_sha256)
+    if boundaries is None:
+        for _ in iter_document_topics(pdf_path):
+            pass
+        boundaries = load_boundaries(document_sha256) or []
+    return document_sha256, boundaries
+
+def find_boundary(boundaries: List[Dict[str, Any]], topic: str) -> Optional[Dict[str, Any]]:
+    """
+    Fronteira do tópico pedido: pelo número ("1", "1.", "1)", "1.2-" -> tópico 1)
+    ou, sem número, pelo título.
+    """
+    match = re.match(r'^\s*(\d+)', topic)
+    if match:
+        return next((boundary for boundary in boundaries if boundary['topic'] == match.group(1)), None)
+
+    wanted = topic.strip().casefold()
+    titles = [(boundary, (boundary['title'] or '').casefold()) for boundary in boundaries]
+    return (next((boundary for boundary, title in titles if title == wanted), None)
+            or next((boundary for boundary, title in titles if wanted and wanted in title), None))
+
+def topic_text(pdf_path: str, topic: str) -> str:
+    """
+    Trecho do texto do PDF correspondente ao tópico (título e conteúdo).
+    Se o tópico não for encontrado, retorna o texto inteiro, como antes da segmentação.
+    """
+    document_sha256, boundaries = document_boundaries(pdf_path)
+    text = extract_pdf_document(pdf_path).text
+    boundary = find_boundary(boundaries, topic)
+    if boundary is None:
+        logger.warning(f"[TOPIC-BOUNDARIES] Tópico {topic!r} não encontrado entre os {len(boundaries)} "
+                       f"tópicos do documento {document_sha256[:12]}; usando o texto inteiro")
+        return text
+
+    section = text[boundary['start_offset']:boundary['end_offset']].strip()
+    logger.info(f"[TOPIC-BOUNDARIES] Tópico {topic!r}: {len(section)} de {len(text)} caracteres "
+                f"(páginas {boundary['start_page']}-{boundary['end_page']})")
+    return section
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Resumo de todos os tópicos de um documento de uma vez.
+
+Os tópicos vêm das fronteiras de topic_boundaries e cada resumo recebe só o
+trecho do seu tópico. Até `concurrency` chamadas ao modelo ficam em andamento
+ao mesmo tempo; o ritmo total é controlado pelo limite de requisições por
+modelo de create_chat_completion (ver rate_limiter.py), compartilhado com as
+demais chamadas do processo.
+
+Um tópico cujo trecho (SHA-256) e versão do prompt (SUMMARY_PROMPT_VERSION)
+não mudaram desde o último resumo é pulado, então rodar de novo depois de uma
+falha ou de um cancelamento só gera o que falta. Os resumos prontos são
+gravados em lotes com save_topic_summaries.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .circuit_breaker import CircuitOpenError
+from .question_service import save_topic_summaries
+from ..database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+SUMMARIZE_DOCUMENT_JOB_TYPE = 'summarize_document'
+
+STATUS_SUMMARIZED = 'summarized'
+STATUS_SKIPPED = 'skipped'
+STATUS_FAILED = 'failed'
+
+# Resumos gerados ao mesmo tempo por documento
+SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', '4'))
+
+# Resumos gravados por transação
+SUMMARY_SAVE_BATCH_SIZE = 10
+
+def section_sha256(section: str) -> str:
+    """Hash do trecho do tópico gravado em topic_summaries.source_sha256."""
+    return hashlib.sha256(section.encode('utf-8')).hexdigest()
+
+def _stored_versions(document_title: str) -> Dict[str, Dict[str, Any]]:
+    """Hash do trecho e versão do prompt do último resumo de cada tópico do documento."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, topic, source_sha256, prompt_version FROM topic_summaries
+            WHERE document_title = ?
+        ''', (document_title,))
+        return {row['topic']: dict(row) for row in cursor.fetchall()}
+
+def _summarize_topic(topic: str, text: str) -> Dict[str, Any]:
+    from ..utils.pdf_utils import generate_topic_summary
+    return generate_topic_summary(topic, text)
+
+def summarize_document(document_title: str, pdf_path: str, concurrency: int = SUMMARY_CONCURRENCY,
+                       topics: Optional[Iterable[str]] = None,
+                       stop_event: Optional[threading.Event] = None,
+                       on_saved: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> Dict[str, Any]:
+    """
+    Gera e grava os resumos dos tópicos do documento.
+
+    Args:
+        topics: marcadores dos tópicos a resumir (todos do documento se None)
+        stop_event: interrompe o envio de novos tópicos; os que já estão em andamento são gravados
+        on_saved: chamado com os resultados de cada lote gravado (e dos tópicos pulados)
+
+    Returns:
+        Contagens e o resultado de cada tópico ('topic', 'status', 'summary_id', 'error')
+
+    Raises:
+        CircuitOpenError: o modelo ficou indisponível; os resumos já prontos são gravados antes
+    """
+    from ..utils.pdf_utils import SUMMARY_PROMPT_VERSION, extract_pdf_document
+    from .topic_boundaries import document_boundaries
+
+    document_sha256, boundaries = document_boundaries(pdf_path)
+    text = extract_pdf_document(pdf_path).text
+    wanted = set(topics) if topics is not None else None
+    stored = _stored_versions(document_title)
+
+    # Um resumo por marcador, com o trecho da primeira ocorrência (como em find_boundary)
+    pending, results, seen = [], [], set()
+    for boundary in boundaries:
+        label = boundary['label']
+        if label in seen or (wanted is not None and label not in wanted):
+            continue
+        seen.add(label)
+        section = text[boundary['start_offset']:boundary['end_offset']].strip()
+        source_sha256 = section_sha256(section)
+        previous = stored.get(label)
+        if (previous and previous['source_sha256'] == source_sha256
+                and previous['prompt_version'] == SUMMARY_PROMPT_VERSION):
+            results.append({'topic': label, 'status': STATUS_SKIPPED, 'summary_id': previous['id'], 'error': None})
+        else:
+            pending.append((label, section, source_sha256))
+
+    logger.info(f"[SUMMARIZE-DOCUMENT] {document_title} ({document_sha256[:12]}): {len(pending)} tópicos a resumir, "
+                f"{len(results)} sem alteração, até {concurrency} ao mesmo tempo")
+    if results and on_saved:
+        on_saved(list(results))
+
+    ready: List[Dict[str, Any]] = []
+
+    def flush():
+        if not ready:
+            return
+        summary_ids = save_topic_summaries(document_title, ready)
+        saved = [{'topic': item['topic'], 'status': STATUS_SUMMARIZED, 'summary_id': summary_id, 'error': None}
+                 for item, summary_id in zip(ready, summary_ids)]
+        results.extend(saved)
+        ready.clear()
+        if on_saved:
+            on_saved(saved)
+
+    circuit_error: Optional[CircuitOpenError] = None
+    remaining = iter(pending)
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='summarize') as executor:
+        while True:
+            # Completa a janela; para de enviar com o circuito aberto ou pedido de parada
+            while (len(in_flight) < max(1, concurrency) and circuit_error is None
+                   and not (stop_event and stop_event.is_set())):
+                item = next(remaining, None)
+                if item is None:
+                    break
+                in_flight[executor.submit(_summarize_topic, item[0], item[1])] = item
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                label, _, source_sha256 = in_flight.pop(future)
+                try:
+                    ready.append({'topic': label, 'summary_data': future.result(),
+                                  'source_sha256': source_sha256, 'prompt_version': SUMMARY_PROMPT_VERSION})
+                except CircuitOpenError as e:
+                    circuit_error = e
+                except Exception as e:
+                    logger.error(f"[SUMMARIZE-DOCUMENT] Falha no resumo do tópico {label}: {str(e)}")
+                    results.append({'topic': label, 'status': STATUS_FAILED, 'summary_id': None, 'error': str(e)})
+            if len(ready) >= SUMMARY_SAVE_BATCH_SIZE:
+                flush()
+    flush()
+
+    if circuit_error is not None:
+        logger.warning(f"[SUMMARIZE-DOCUMENT] Modelo indisponível; {document_title} interrompido")
+        raise circuit_error
+
+    counts = {status: sum(1 for result in results if result['status'] == status)
+              for status in (STATUS_SUMMARIZED, STATUS_SKIPPED, STATUS_FAILED)}
+    cancelled = len(results) < len(seen)
+    logger.info(f"[SUMMARIZE-DOCUMENT] {document_title}: {counts[STATUS_SUMMARIZED]} resumidos, "
+                f"{counts[STATUS_SKIPPED]} pulados, {counts[STATUS_FAILED]} com falha"
+                + (" (interrompido)" if cancelled else ""))
+    return {
+        'document_title': document_title,
+        'document_sha256': document_sha256,
+        'total': len(seen),
+        **counts,
+        'cancelled': cancelled,
+        'topics': results
+    }
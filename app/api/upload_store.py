@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Armazenamento dos PDFs enviados, endereçado pelo conteúdo (SHA-256).
+
+Cada conteúdo é guardado uma única vez em UPLOAD_STORE_DIR
+(<sha256[:2]>/<sha256>.pdf, tabela upload_blobs) e cada nome de arquivo é um
+alias (tabela upload_aliases) com uma referência para o conteúdo. O arquivo
+em data/uploads/resumos/<nome> continua existindo, como um hard link para o
+conteúdo, então as rotas que abrem o PDF pelo nome não mudam. Quando o último
+alias de um conteúdo é removido, o conteúdo é apagado.
+
+O hash é calculado durante o upload, enquanto o arquivo é gravado, e fica no
+índice do cache de extração: extração, tópicos (topic_boundaries) e chunks já
+são guardados por hash, e um conteúdo já processado com outro nome tem os
+tópicos e resumos copiados (ver copy_processed_topics), sem nova chamada ao
+modelo.
+
+Os registros são feitos em transações BEGIN IMMEDIATE do SQLite e os arquivos
+são gravados em temporários e movidos com os.replace, então vários workers (ou
+nós que compartilham o volume de data/ e o banco) podem usar o mesmo
+armazenamento. UPLOAD_STORE_DIR deve ficar no mesmo sistema de arquivos de
+data/uploads/resumos; se o hard link não for possível, o alias é uma cópia.
+"""
+
+import os
+import re
+import uuid
+import shutil
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional
+
+from .question_service import copy_topic_summaries
+from ..database.db_manager import DatabaseManager
+from ..utils.extraction_cache import HASH_BLOCK_SIZE, content_hash, file_sha256, remember_hash
+
+logger = logging.getLogger(__name__)
+
+db_manager = DatabaseManager()
+
+# Diretório dos aliases (os nomes usados pelas rotas)
+UPLOADS_DIR = os.path.join('data', 'uploads', 'resumos')
+
+# Diretório do conteúdo dos uploads
+UPLOAD_STORE_DIR = os.getenv('UPLOAD_STORE_DIR', os.path.join('data', 'uploads', 'store'))
+
+PDF_SIGNATURE = b'%PDF-'
+
+# Caracteres de controle e separadores de caminho não são aceitos no nome do arquivo
+INVALID_FILENAME_PATTERN = re.compile(r'[\x00-\x1f\x7f/\\:*?"<>|]')
+
+class InvalidUpload(ValueError):
+    """Arquivo enviado com nome ou conteúdo inválido."""
+
+@dataclass
+class StoredUpload:
+    """Resultado do registro de um upload."""
+    filename: str
+    sha256: str
+    size: int
+    # O conteúdo já estava guardado (com este ou outro nome)
+    deduplicated: bool
+    # Nomes que apontam para o mesmo conteúdo, incluindo filename
+    aliases: List[str]
+
+def clean_filename(filename: str) -> str:
+    """Nome do arquivo sem diretórios; mantém acentos e espaços (o nome vira document_title)."""
+    name = os.path.basename((filename or '').replace('\\', '/')).strip()
+    if not name or name.startswith('.') or INVALID_FILENAME_PATTERN.search(name):
+        raise InvalidUpload(f"Nome de arquivo inválido: {filename!r}")
+    if not name.lower().endswith('.pdf'):
+        raise InvalidUpload('Apenas arquivos PDF são aceitos')
+    return name
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(UPLOAD_STORE_DIR, sha256[:2], f'{sha256}.pdf')
+
+def alias_path(filename: str) -> str:
+    return os.path.join(UPLOADS_DIR, filename)
+
+def _temp_path(directory: str) -> str:
+    return os.path.join(directory, f'.{uuid.uuid4().hex}.tmp')
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _link_alias(sha256: str, filename: str):
+    """Aponta data/uploads/resumos/<filename> para o conteúdo (hard link, ou cópia)."""
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    temp_path = _temp_path(UPLOADS_DIR)
+    try:
+        os.link(blob_path(sha256), temp_path)
+    except OSError as e:
+        logger.warning(f"[UPLOAD-STORE] Hard link indisponível ({str(e)}); {filename} será uma cópia")
+        shutil.copyfile(blob_path(sha256), temp_path)
+    os.replace(temp_path, alias_path(filename))
+    remember_hash(alias_path(filename), sha256)
+
+def _is_alias_of(sha256: str, filename: str) -> bool:
+    try:
+        return os.path.samefile(blob_path(sha256), alias_path(filename))
+    except OSError:
+        return False
+
+def _release(cursor, sha256: str):
+    """Retira uma referência do conteúdo; sem referências, o conteúdo é apagado."""
+    cursor.execute('''
+        UPDATE upload_blobs SET ref_count = ref_count - 1, updated_at = CURRENT_TIMESTAMP WHERE sha256 = ?
+    ''', (sha256,))
+    cursor.execute('SELECT ref_count FROM upload_blobs WHERE sha256 = ?', (sha256,))
+    row = cursor.fetchone()
+    if row is not None and row['ref_count'] <= 0:
+        cursor.execute('DELETE FROM upload_blobs WHERE sha256 = ?', (sha256,))
+        _remove(blob_path(sha256))
+        logger.info(f"[UPLOAD-STORE] Conteúdo {sha256[:12]} sem aliases removido")
+
+def _aliases(cursor, sha256: str) -> List[str]:
+    cursor.execute('SELECT filename FROM upload_aliases WHERE sha256 = ? ORDER BY created_at, filename', (sha256,))
+    return [row['filename'] for row in cursor.fetchall()]
+
+def _register(filename: str, sha256: str, size: int, source_path: str, move: bool,
+              user_id: Optional[int] = None) -> StoredUpload:
+    """
+    Registra filename como alias do conteúdo sha256, guardando source_path como
+    o conteúdo se ele ainda não existir (movido se move, senão com hard link).
+    """
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        # Trava de escrita desde o início: registros e remoções do mesmo conteúdo não se intercalam
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT sha256 FROM upload_aliases WHERE filename = ?', (filename,))
+        row = cursor.fetchone()
+        previous = row['sha256'] if row else None
+        cursor.execute('SELECT 1 FROM upload_blobs WHERE sha256 = ?', (sha256,))
+        deduplicated = cursor.fetchone() is not None and os.path.exists(blob_path(sha256))
+
+        if not deduplicated:
+            os.makedirs(os.path.dirname(blob_path(sha256)), exist_ok=True)
+            if move:
+                os.replace(source_path, blob_path(sha256))
+            else:
+                temp_path = _temp_path(os.path.dirname(blob_path(sha256)))
+                try:
+                    os.link(source_path, temp_path)
+                except OSError:
+                    shutil.copyfile(source_path, temp_path)
+                os.replace(temp_path, blob_path(sha256))
+        elif move:
+            _remove(source_path)
+
+        if previous != sha256:
+            cursor.execute('''
+                INSERT INTO upload_blobs (sha256, size, ref_count) VALUES (?, ?, 1)
+                ON CONFLICT(sha256) DO UPDATE SET ref_count = ref_count + 1, updated_at = CURRENT_TIMESTAMP
+            ''', (sha256, size))
+            cursor.execute('''
+                INSERT INTO upload_aliases (filename, sha256, created_by) VALUES (?, ?, ?)
+                ON CONFLICT(filename) DO UPDATE SET sha256 = excluded.sha256, updated_at = CURRENT_TIMESTAMP
+            ''', (filename, sha256, user_id))
+        if not _is_alias_of(sha256, filename):
+            _link_alias(sha256, filename)
+        if previous is not None and previous != sha256:
+            logger.info(f"[UPLOAD-STORE] {filename} substituído: {previous[:12]} -> {sha256[:12]}")
+            _release(cursor, previous)
+
+        aliases = _aliases(cursor, sha256)
+        conn.commit()
+
+    logger.info(f"[UPLOAD-STORE] {filename} -> {sha256[:12]} ({size} bytes, "
+                f"{'conteúdo já guardado' if deduplicated else 'conteúdo novo'}, {len(aliases)} aliases)")
+    return StoredUpload(filename=filename, sha256=sha256, size=size, deduplicated=deduplicated, aliases=aliases)
+
+def store_upload(stream: BinaryIO, filename: str, user_id: Optional[int] = None) -> StoredUpload:
+    """
+    Grava o arquivo enviado calculando o SHA-256 em blocos, durante a gravação.
+
+    Raises:
+        InvalidUpload: nome sem .pdf ou conteúdo que não é um PDF
+    """
+    filename = clean_filename(filename)
+    temp_dir = os.path.join(UPLOAD_STORE_DIR, 'tmp')
+    os.makedirs(temp_dir, exist_ok=True)
+    temp_path = _temp_path(temp_dir)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, 'wb') as temp_file:
+            for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+                if size == 0 and not block.startswith(PDF_SIGNATURE):
+                    raise InvalidUpload('O arquivo enviado não é um PDF')
+                digest.update(block)
+                temp_file.write(block)
+                size += len(block)
+        if size == 0:
+            raise InvalidUpload('Arquivo vazio')
+        return _register(filename, digest.hexdigest(), size, temp_path, move=True, user_id=user_id)
+    finally:
+        _remove(temp_path)
+
+def store_file(path: str, user_id: Optional[int] = None) -> StoredUpload:
+    """Registra um PDF que já está em data/uploads/resumos (ex.: enviado antes do armazenamento)."""
+    filename = clean_filename(os.path.basename(path))
+    return _register(filename, file_sha256(path), os.path.getsize(path), path, move=False, user_id=user_id)
+
+def adopt_uploads() -> List[StoredUpload]:
+    """Registra os PDFs de data/uploads/resumos que ainda não estão no armazenamento."""
+    if not os.path.isdir(UPLOADS_DIR):
+        return []
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT filename, sha256 FROM upload_aliases')
+        known = {row['filename']: row['sha256'] for row in cursor.fetchall()}
+    adopted = []
+    for filename in sorted(os.listdir(UPLOADS_DIR)):
+        path = alias_path(filename)
+        if not filename.lower().endswith('.pdf') or not os.path.isfile(path):
+            continue
+        if filename in known and _is_alias_of(known[filename], filename):
+            continue
+        try:
+            adopted.append(store_file(path))
+        except InvalidUpload as e:
+            logger.warning(f"[UPLOAD-STORE] {filename} ignorado: {str(e)}")
+    return adopted
+
+def remove_upload(filename: str) -> bool:
+    """
+    Remove o alias e o arquivo em data/uploads/resumos; o conteúdo só é apagado
+    quando não sobra nenhum alias.
+
+    Returns:
+        False se o nome não está no armazenamento
+    """
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT sha256 FROM upload_aliases WHERE filename = ?', (filename,))
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return False
+        cursor.execute('DELETE FROM upload_aliases WHERE filename = ?', (filename,))
+        _remove(alias_path(filename))
+        _release(cursor, row['sha256'])
+        conn.commit()
+    logger.info(f"[UPLOAD-STORE] Alias {filename} removido")
+    return True
+
+def find_processed_title(document_sha256: str, exclude_title: Optional[str] = None) -> Optional[str]:
+    """
+    Outro nome do mesmo conteúdo que já tem tópicos em topic_summaries (aliases
+    do armazenamento e documentos ingeridos), preferindo o que tem mais resumos.
+    """
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT candidates.title,
+                   (SELECT COUNT(*) FROM topic_summaries ts
+                    WHERE ts.document_title = candidates.title AND ts.source_sha256 IS NOT NULL) AS summarized,
+                   (SELECT COUNT(*) FROM topic_summaries ts
+                    WHERE ts.document_title = candidates.title) AS topics
+            FROM (
+                SELECT filename AS title FROM upload_aliases WHERE sha256 = ?
+                UNION
+                SELECT document_title AS title FROM ingestion_documents WHERE document_sha256 = ?
+            ) AS candidates
+            WHERE candidates.title != ?
+            ORDER BY summarized DESC, topics DESC
+        ''', (document_sha256, document_sha256, exclude_title or ''))
+        for row in cursor.fetchall():
+            if row['topics']:
+                return row['title']
+    return None
+
+def copy_processed_topics(document_sha256: str, document_title: str) -> Optional[str]:
+    """
+    Se o mesmo conteúdo já foi processado com outro nome, copia os tópicos e
+    resumos dele para document_title.
+
+    Returns:
+        Nome de onde os tópicos foram copiados (None se o conteúdo é inédito)
+    """
+    source_title = find_processed_title(document_sha256, document_title)
+    if source_title is None:
+        return None
+    copied = copy_topic_summaries(source_title, document_title)
+    if copied:
+        logger.info(f"[UPLOAD-STORE] {document_title} tem o mesmo conteúdo de {source_title} "
+                    f"({document_sha256[:12]}): {copied} tópicos reaproveitados")
+    return source_title
+
+def copy_processed_topics_for_path(pdf_path: str, document_title: str) -> Optional[str]:
+    """copy_processed_topics pelo caminho do PDF (hash do índice do cache de extração)."""
+    return copy_processed_topics(content_hash(pdf_path), document_title)
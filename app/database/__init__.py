@@ -24,7 +24,51 @@
     logger.error(f"Erro ao importar DatabaseManager: {e}")
     raise
 
-__all__ = ['DatabaseManager']
+__all__ = ['DatabaseManager', 'DEFAULT_DOMAINS']
+
+# Lista de domínios padrão do PMBOK (exatamente como usados na tabela topic_summaries)
+DEFAULT_DOMAINS = [
+    {
+        'name': 'Gestão da Integração',
+        'description': 'Processos e atividades necessários para identificar, definir, combinar, unificar e coordenar os vários processos e atividades do gerenciamento de projetos.'
+    },
+    {
+        'name': 'Gestão do Escopo',
+        'description': 'Processos necessários para garantir que o projeto inclua todo o trabalho necessário, e apenas ele, para completar o projeto com sucesso.'
+    },
+    {
+        'name': 'Gestão do Tempo',
+        'description': 'Processos necessários para gerenciar o término do projeto no prazo.'
+    },
+    {
+        'name': 'Gestão do Custo',
+        'description': 'Processos envolvidos em planejamento, estimativa, orçamentação, financiamento, gerenciamento e controle dos custos.'
+    },
+    {
+        'name': 'Gestão da Qualidade',
+        'description': 'Processos e atividades da organização executora que determinam as políticas de qualidade, os objetivos e as responsabilidades.'
+    },
+    {
+        'name': 'Gestão de Recursos',
+        'description': 'Processos que organizam, gerenciam e lideram a equipe do projeto.'
+    },
+    {
+        'name': 'Gestão das Comunicações',
+        'description': 'Processos necessários para garantir que as informações do projeto sejam geradas, coletadas, distribuídas, armazenadas, recuperadas e organizadas de maneira oportuna e apropriada.'
+    },
+    {
+        'name': 'Gestão dos Riscos',
+        'description': 'Processos de condução do planejamento do gerenciamento de riscos, identificação, análise, planejamento de respostas e monitoramento e controle dos riscos do projeto.'
+    },
+    {
+        'name': 'Gestão das Aquisições',
+        'description': 'Processos necessários para comprar ou adquirir produtos, serviços ou resultados necessários de fora da equipe do projeto.'
+    },
+    {
+        'name': 'Gestão de Stakeholders',
+        'description': 'Processos necessários para identificar as pessoas, grupos ou organizações que podem impactar ou ser impactados pelo projeto.'
+    }
+]
 
 def init_default_domains():
     """Inicializa os domínios padrão do PMBOK se não existirem"""
@@ -32,52 +76,8 @@ def init_default_domains():
         from app.models import Domain
         from app import db
     
-        # Lista de domínios padrão do PMBOK (exatamente como usados na tabela topic_summaries)
-        default_domains = [
-            {
-                'name': 'Gestão da Integração',
-                'description': 'Processos e atividades necessários para identificar, definir, combinar, unificar e coordenar os vários processos e atividades do gerenciamento de projetos.'
-            },
-            {
-                'name': 'Gestão do Escopo',
-                'description': 'Processos necessários para garantir que o projeto inclua todo o trabalho necessário, e apenas ele, para completar o projeto com sucesso.'
-            },
-            {
-                'name': 'Gestão do Tempo',
-                'description': 'Processos necessários para gerenciar o término do projeto no prazo.'
-            },
-            {
-                'name': 'Gestão do Custo',
-                'description': 'Processos envolvidos em planejamento, estimativa, orçamentação, financiamento, gerenciamento e controle dos custos.'
-            },
-            {
-                'name': 'Gestão da Qualidade',
-                'description': 'Processos e atividades da organização executora que determinam as políticas de qualidade, os objetivos e as responsabilidades.'
-            },
-            {
-                'name': 'Gestão de Recursos',
-                'description': 'Processos que organizam, gerenciam e lideram a equipe do projeto.'
-            },
-            {
-                'name': 'Gestão das Comunicações',
-                'description': 'Processos necessários para garantir que as informações do projeto sejam geradas, coletadas, distribuídas, armazenadas, recuperadas e organizadas de maneira oportuna e apropriada.'
-            },
-            {
-                'name': 'Gestão dos Riscos',
-                'description': 'Processos de condução do planejamento do gerenciamento de riscos, identificação, análise, planejamento de respostas e monitoramento e controle dos riscos do projeto.'
-            },
-            {
-                'name': 'Gestão das Aquisições',
-                'description': 'Processos necessários para comprar ou adquirir produtos, serviços ou resultados necessários de fora da equipe do projeto.'
-            },
-            {
-                'name': 'Gestão de Stakeholders',
-                'description': 'Processos necessários para identificar as pessoas, grupos ou organizações que podem impactar ou ser impactados pelo projeto.'
-            }
-        ]
-    
         # Verificar e adicionar domínios que não existem
-        for domain_data in default_domains:
+        for domain_data in DEFAULT_DOMAINS:
             domain = Domain.query.filter_by(name=domain_data['name']).first()
             if not domain:
                 domain = Domain(
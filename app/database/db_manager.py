@@ -124,7 +124,11 @@ def create_tables(self):
             'pmbok_references': 'TEXT NOT NULL DEFAULT "[]"',
             'domains': 'TEXT NOT NULL DEFAULT "[]"',
             'created_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
-            'updated_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
+            'updated_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
+            'prompt_context': 'TEXT',
+            'source_sha256': 'TEXT',
+            'prompt_version': 'INTEGER',
+            'domain_keys': 'TEXT'
         }
         
         # Adicionar colunas faltantes
@@ -204,7 +208,11 @@ def migrate_database(self):
                 'pmbok_references': 'TEXT NOT NULL',
                 'domains': 'TEXT NOT NULL',
                 'created_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
-                'updated_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
+                'updated_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
+                'prompt_context': 'TEXT',
+                'source_sha256': 'TEXT',
+                'prompt_version': 'INTEGER',
+                'domain_keys': 'TEXT'
             }
             
             # Adicionar colunas faltantes
@@ -614,6 +622,200 @@ def setup_database(self):
                     )
                 ''')
                 
+                # Create generation jobs table (fila usada por worker.py)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS generation_jobs (
+                        id TEXT PRIMARY KEY,
+                        job_type TEXT NOT NULL DEFAULT 'generate',
+                        status TEXT NOT NULL DEFAULT 'queued',
+                        params TEXT NOT NULL DEFAULT '{}',
+                        progress TEXT NOT NULL DEFAULT '{}',
+                        results TEXT NOT NULL DEFAULT '[]',
+                        error TEXT,
+                        attempts INTEGER DEFAULT 0,
+                        cancel_requested INTEGER DEFAULT 0,
+                        worker_id TEXT,
+                        lease_expires_at REAL,
+                        created_by INTEGER,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_generation_jobs_status
+                    ON generation_jobs (status, created_at)
+                ''')
+
+                # Create question inventory table (estoque de questões pré-geradas por domínio)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS question_inventory (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        domain TEXT NOT NULL,
+                        summary_id INTEGER,
+                        question TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'inventory',
+                        question_id INTEGER,
+                        claim_token TEXT,
+                        claimed_by INTEGER,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        claimed_at TIMESTAMP,
+                        FOREIGN KEY (summary_id) REFERENCES topic_summaries(id),
+                        FOREIGN KEY (question_id) REFERENCES questions(id)
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_question_inventory_domain
+                    ON question_inventory (domain, status, created_at)
+                ''')
+
+                # Create request keys table (idempotência e coalescência de requisições)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS request_keys (
+                        key TEXT PRIMARY KEY,
+                        fingerprint TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'in_progress',
+                        owner TEXT,
+                        lease_expires_at REAL,
+                        status_code INTEGER,
+                        response TEXT,
+                        mimetype TEXT,
+                        expires_at REAL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        completed_at TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_request_keys_expires
+                    ON request_keys (status, expires_at)
+                ''')
+
+                # Create question deliveries table (questões salvas entregues com o modelo indisponível)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS question_deliveries (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER,
+                        question_id INTEGER NOT NULL,
+                        delivered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (question_id) REFERENCES questions(id),
+                        FOREIGN KEY (user_id) REFERENCES user(id)
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_question_deliveries_user
+                    ON question_deliveries (user_id, question_id)
+                ''')
+
+                # Fronteiras dos tópicos de cada PDF (por hash do conteúdo), para
+                # enviar ao modelo só o trecho do tópico
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS topic_boundaries (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        document_sha256 TEXT NOT NULL,
+                        position INTEGER NOT NULL,
+                        topic TEXT NOT NULL,
+                        label TEXT,
+                        title TEXT,
+                        start_offset INTEGER NOT NULL,
+                        end_offset INTEGER NOT NULL,
+                        start_page INTEGER,
+                        end_page INTEGER,
+                        segmenter_version INTEGER NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE (document_sha256, position)
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_topic_boundaries_topic
+                    ON topic_boundaries (document_sha256, topic)
+                ''')
+
+                # Chunks de cada PDF (por hash do conteúdo): só as posições no texto
+                # do cache de extração, sem duplicar o texto (ver api/document_chunks.py)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS document_chunks (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        document_sha256 TEXT NOT NULL,
+                        chunk_index INTEGER NOT NULL,
+                        start_offset INTEGER NOT NULL,
+                        end_offset INTEGER NOT NULL,
+                        tokens INTEGER NOT NULL,
+                        max_tokens INTEGER NOT NULL,
+                        overlap_tokens INTEGER NOT NULL,
+                        chunker_version INTEGER NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE (document_sha256, chunk_index)
+                    )
+                ''')
+
+                # Checkpoints da ingestão de documentos (ver api/ingestion.py)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS ingestion_documents (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        batch_id TEXT NOT NULL,
+                        document_title TEXT NOT NULL,
+                        pdf_path TEXT NOT NULL,
+                        job_id TEXT,
+                        document_sha256 TEXT,
+                        stage TEXT NOT NULL DEFAULT 'queued',
+                        status TEXT NOT NULL DEFAULT 'queued',
+                        topics_total INTEGER NOT NULL DEFAULT 0,
+                        topics_persisted INTEGER NOT NULL DEFAULT 0,
+                        topics_summarized INTEGER NOT NULL DEFAULT 0,
+                        summarize INTEGER NOT NULL DEFAULT 0,
+                        error TEXT,
+                        created_by INTEGER,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (created_by) REFERENCES user(id)
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_ingestion_documents_batch
+                    ON ingestion_documents (batch_id)
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS ingestion_topics (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        ingestion_id INTEGER NOT NULL,
+                        position INTEGER NOT NULL,
+                        topic TEXT NOT NULL,
+                        domains TEXT NOT NULL DEFAULT '[]',
+                        stage TEXT NOT NULL,
+                        summary_id INTEGER,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE (ingestion_id, position),
+                        FOREIGN KEY (ingestion_id) REFERENCES ingestion_documents(id),
+                        FOREIGN KEY (summary_id) REFERENCES topic_summaries(id)
+                    )
+                ''')
+
+                # PDFs enviados, guardados uma vez por conteúdo (SHA-256); cada nome de
+                # arquivo em data/uploads/resumos é um alias (ver api/upload_store.py)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS upload_blobs (
+                        sha256 TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        ref_count INTEGER NOT NULL DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS upload_aliases (
+                        filename TEXT PRIMARY KEY,
+                        sha256 TEXT NOT NULL,
+                        created_by INTEGER,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (sha256) REFERENCES upload_blobs(sha256),
+                        FOREIGN KEY (created_by) REFERENCES user(id)
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_upload_aliases_sha256
+                    ON upload_aliases (sha256)
+                ''')
+
                 # Verificar se as tabelas foram criadas
                 cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
                 tables = cursor.fetchall()
@@ -638,7 +840,13 @@ def setup_database(self):
                     logger.info("[DB-SETUP] Coluna metadata já existe")
                 
                 conn.commit()
-                logger.info("[DB-SETUP] Setup do banco de dados concluído com sucesso")
+
+            # Resumos gravados sem domain_keys (versões antigas ou scripts de migração)
+            # não seriam encontrados pela busca por domínio
+            updated = self.backfill_domain_keys(only_missing=True)
+            if updated:
+                logger.info(f"[DB-SETUP] domain_keys calculadas para {updated} resumos")
+            logger.info("[DB-SETUP] Setup do banco de dados concluído com sucesso")
                 
         except Exception as e:
             logger.error(f"[DB-SETUP] Erro ao configurar banco de dados: {str(e)}")
@@ -906,6 +1114,12 @@ def save_topic_summary(self, document_title: str, topic: str, summary: str,
             logger.info(f"[SAVE-SUMMARY] pmbok_references: {pmbok_references}")
             logger.info(f"[SAVE-SUMMARY] domains: {domains}")
             
+            # Contexto de prompt renderizado uma vez, no momento em que o resumo é salvo
+            from ..api.prompt_context import build_prompt_context
+            from ..utils.domain_classifier import domain_keys
+            prompt_context = build_prompt_context(summary, key_points, practical_examples,
+                                                  pmbok_references).to_json()
+            
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
@@ -921,7 +1135,8 @@ def save_topic_summary(self, document_title: str, topic: str, summary: str,
                     cursor.execute("""
                         UPDATE topic_summaries 
                         SET summary = ?, key_points = ?, practical_examples = ?,
-                            pmbok_references = ?, domains = ?, updated_at = CURRENT_TIMESTAMP
+                            pmbok_references = ?, domains = ?, domain_keys = ?, prompt_context = ?,
+                            updated_at = CURRENT_TIMESTAMP
                         WHERE id = ?
                     """, (
                         summary,
@@ -929,6 +1144,8 @@ def save_topic_summary(self, document_title: str, topic: str, summary: str,
                         json.dumps(practical_examples),
                         json.dumps(pmbok_references),
                         json.dumps(domains or []),
+                        json.dumps(domain_keys(domains)),
+                        prompt_context,
                         existing[0]
                     ))
                     summary_id = existing[0]
@@ -938,8 +1155,8 @@ def save_topic_summary(self, document_title: str, topic: str, summary: str,
                     cursor.execute("""
                         INSERT INTO topic_summaries (
                             document_title, topic, summary, key_points,
-                            practical_examples, pmbok_references, domains
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                            practical_examples, pmbok_references, domains, domain_keys, prompt_context
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                     """, (
                         document_title,
                         topic,
@@ -947,7 +1164,9 @@ def save_topic_summary(self, document_title: str, topic: str, summary: str,
                         json.dumps(key_points),
                         json.dumps(practical_examples),
                         json.dumps(pmbok_references),
-                        json.dumps(domains or [])
+                        json.dumps(domains or []),
+                        json.dumps(domain_keys(domains)),
+                        prompt_context
                     ))
                     summary_id = cursor.lastrowid
                     logger.info(f"[SAVE-SUMMARY] Novo resumo salvo com ID: {summary_id}")
@@ -968,6 +1187,42 @@ def save_topic_summary(self, document_title: str, topic: str, summary: str,
             logger.error("[SAVE-SUMMARY] Stack trace:", exc_info=True)
             raise
 
+    def backfill_domain_keys(self, only_missing: bool = True) -> int:
+        """
+        Calcula domain_keys dos resumos gravados antes da coluna existir
+        (ver migrations/add_domain_keys.py).
+
+        Args:
+            only_missing: se False, recalcula as chaves de todos os resumos
+
+        Returns:
+            Número de resumos atualizados
+        """
+        from ..utils.domain_classifier import domain_keys
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, domains FROM topic_summaries
+                {'WHERE domain_keys IS NULL' if only_missing else ''}
+            """)
+            rows = cursor.fetchall()
+
+            updates = []
+            for summary_id, domains in rows:
+                try:
+                    parsed = json.loads(domains) if domains else []
+                except json.JSONDecodeError:
+                    parsed = [domains]
+                if not isinstance(parsed, list):
+                    parsed = [parsed]
+                updates.append((json.dumps(domain_keys(parsed)), summary_id))
+
+            cursor.executemany('UPDATE topic_summaries SET domain_keys = ? WHERE id = ?', updates)
+            conn.commit()
+        logger.info(f"[DOMAIN-KEYS] Chaves de domínio calculadas para {len(updates)} resumos")
+        return len(updates)
+
     def get_least_used_summaries_by_domain(self, domain: str, limit: int = 2) -> List[Dict]:
         """
         Busca os resumos menos utilizados para um determinado domínio.
@@ -6,12 +6,18 @@
 """
 
 import os
+import sys
 import sqlite3
 import json
 import logging
 from datetime import datetime
 from typing import List, Dict, Any
 
+# Executado como script (ver run_migration.py): adicionar diretório raiz ao PYTHONPATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.domain_classifier import domain_keys
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -185,6 +191,11 @@ def migrate_training_data(self):
                         ADD COLUMN domains TEXT
                     ''')
                     conn.commit()
+
+                if 'domain_keys' not in columns:
+                    logger.info("[MIGRATE] Adicionando coluna domain_keys à tabela topic_summaries")
+                    cursor.execute('ALTER TABLE topic_summaries ADD COLUMN domain_keys TEXT')
+                    conn.commit()
                 
                 for item in training_data:
                     try:
@@ -199,8 +210,8 @@ def migrate_training_data(self):
                             cursor.execute('''
                                 INSERT INTO topic_summaries (
                                     document_title, topic, summary, key_points,
-                                    practical_examples, pmbok_references, domains, created_at
-                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                                    practical_examples, pmbok_references, domains, domain_keys, created_at
+                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                             ''', (
                                 item.get('document_title', 'Unknown'),
                                 item.get('topic', ''),
@@ -209,6 +220,7 @@ def migrate_training_data(self):
                                 json.dumps(item.get('practical_examples', [])),
                                 json.dumps(item.get('pmbok_references', [])),
                                 json.dumps(domains),  # Usar o tema mapeado para domains
+                                json.dumps(domain_keys(domains)),
                                 datetime.now()
                             ))
                             logger.info(f"[MIGRATE] Dado de treinamento migrado: {item.get('topic', '')[:50]}...")
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app, send_from_directory, abort
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app, send_from_directory, abort, Response, stream_with_context
 from flask_login import login_required, current_user, login_user, logout_user
 from urllib.parse import urlparse
 from app import db
@@ -9,9 +9,11 @@
 from .forms import ChangePasswordForm
 import sys
 import os
+import math
+import queue
+import threading
 from dotenv import load_dotenv, set_key
 from pathlib import Path
-from datetime import datetime, timedelta
 import logging
 import PyPDF2
 import tempfile
@@ -23,9 +25,17 @@
 from flask_limiter.util import get_remote_address
 
 # Importar usando caminho relativo
-from app.api.openai_client import get_openai_client
+from app.api.openai_client import get_openai_client, generation_retry_after
+from app.api import (job_queue, question_inventory, metrics, idempotency, circuit_breaker, ingestion, topic_summarizer,
+                     upload_store, document_chunks)
+from app.api.circuit_breaker import CircuitOpenError
+from app.api.deadline import Deadline, GENERATION_DEADLINE
+from app.api.question_service import (select_domain_summary, save_generated_question, summary_prompt_context,
+                                      save_topic_summary, enqueue_topic_summary, serve_stored_questions)
 from .database.db_manager import DatabaseManager
-from app.utils.pdf_utils import extract_text_from_pdf, generate_topic_summary
+from app.utils.pdf_utils import SUMMARY_PROMPT_VERSION, generate_topic_summary, summary_model
+from app.api.topic_boundaries import iter_document_topics, topic_text
+from app.utils.domain_classifier import domain_keys, load_domain_classifier
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -49,6 +59,76 @@
     default_limits=["200 per day", "50 per hour"]
 )
 
+def idempotent(scope, key_fields=None, per_user=True):
+    """
+    Evita execuções duplicadas de uma rota cara (ver app/api/idempotency.py).
+
+    Com o cabeçalho Idempotency-Key a resposta é guardada por IDEMPOTENCY_TTL e
+    devolvida nas repetições. Sem ele, requisições idênticas simultâneas (mesmos
+    `key_fields` do corpo JSON, ou o corpo inteiro) aguardam a que já está em
+    andamento e recebem a mesma resposta.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            payload = request.get_json(silent=True) or {}
+            user_part = current_user.id if per_user and current_user.is_authenticated else 'all'
+            client_key = request.headers.get('Idempotency-Key')
+            if client_key:
+                request_fingerprint = idempotency.fingerprint(payload)
+                key = f"{scope}:{user_part}:key:{client_key}"
+                ttl = idempotency.IDEMPOTENCY_TTL
+            else:
+                if key_fields:
+                    payload = {field: payload.get(field) for field in key_fields}
+                request_fingerprint = idempotency.fingerprint(payload)
+                key = f"{scope}:{user_part}:{request_fingerprint}"
+                ttl = idempotency.SINGLE_FLIGHT_TTL
+            
+            def compute():
+                response = current_app.make_response(view(*args, **kwargs))
+                return response.status_code, response.get_data(as_text=True), response.mimetype
+            
+            try:
+                status_code, body, mimetype, replayed = idempotency.run_once(key, request_fingerprint, compute, ttl=ttl)
+            except idempotency.IdempotencyConflict as e:
+                logger.warning(f"[IDEMPOTENCY] {str(e)}")
+                return jsonify({'error': 'Idempotency-Key já usada com outra requisição'}), 422
+            except idempotency.RequestInProgress as e:
+                logger.warning(f"[IDEMPOTENCY] {str(e)}")
+                response = jsonify({'error': 'Requisição idêntica ainda em processamento'})
+                response.status_code = 409
+                response.headers['Retry-After'] = '5'
+                return response
+            
+            response = Response(body, status=status_code, mimetype=mimetype)
+            if replayed:
+                response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        return wrapper
+    return decorator
+
+# Limite de questões por requisição de geração (ao vivo, streaming ou job)
+MAX_QUESTIONS_PER_REQUEST = 20
+
+def parse_num_questions(data, tag, default=5, maximum=MAX_QUESTIONS_PER_REQUEST):
+    """
+    Lê e valida num_questions do corpo da requisição.
+
+    Returns:
+        (num_questions, None) ou (None, resposta de erro 400)
+    """
+    try:
+        num_questions = int(data.get('num_questions', default))
+    except (TypeError, ValueError):
+        logger.error(f"[{tag}] Invalid number format for num_questions")
+        return None, (jsonify({'error': 'Invalid number format'}), 400)
+    
+    if not (1 <= num_questions <= maximum):
+        logger.error(f"[{tag}] num_questions out of range: {num_questions}")
+        return None, (jsonify({'error': f'Number of questions must be between 1 and {maximum}'}), 400)
+    return num_questions, None
+
 def log_login_attempt(username, success, ip_address):
     """Registra tentativas de login"""
     status = "SUCESSO" if success else "FALHA"
@@ -144,7 +224,9 @@ def get_statistics():
 
 @main.route('/api/generate', methods=['POST'])
 @login_required
+@idempotent('generate')
 def generate():
+    """Enfileira a geração de questões do tópico (executada pelos workers, como /api/jobs/generate)"""
     logger.info("Received generate request")
     try:
         data = request.get_json()
@@ -167,63 +249,53 @@ def generate():
         topic = data['topic']
         logger.info(f"Topic received: {topic}")
 
-        try:
-            num_questions = int(data['num_questions'])
-        except ValueError:
-            logger.error("Invalid number format for num_questions")
-            return jsonify({'error': 'Invalid number format'}), 400
+        num_questions, error_response = parse_num_questions(data, 'GENERATE', maximum=10)
+        if error_response:
+            return error_response
 
-        # Validate ranges
-        if not (1 <= num_questions <= 10):
-            logger.error(f"num_questions out of range: {num_questions}")
-            return jsonify({'error': 'Number of questions must be between 1 and 10'}), 400
+        # O job gera as questões pelos resumos do domínio
+        if not Domain.query.filter_by(name=topic).first():
+            logger.error(f"Domain not found: {topic}")
+            return jsonify({'error': 'Domain not found'}), 404
 
-        logger.info(f"Generating {num_questions} questions for topic: {topic}")
+        job_id = job_queue.enqueue_job('generate', {
+            'domain': topic,
+            'num_questions': num_questions
+        }, user_id=current_user.id)
+        logger.info(f"Generation of {num_questions} questions for topic {topic} queued as job {job_id}")
         
-        try:
-            client = get_openai_client()
-            questions = generate_questions(
-                topic=topic,
-                num_questions=num_questions,
-                api_key=os.getenv('OPENAI_API_KEY')
-            )
-            
-            if not questions:
-                logger.error("No questions generated")
-                return jsonify({'error': 'Failed to generate questions'}), 500
+        # Update user statistics
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            # Check if stats exist for user
+            cursor.execute('''
+                SELECT id FROM user_statistics WHERE topic = ?
+            ''', (topic,))
+            stats = cursor.fetchone()
             
-            # Update user statistics
-            if current_user.is_authenticated:
-                with db_manager.get_connection() as conn:
-                    cursor = conn.cursor()
-                    # Check if stats exist for user
-                    cursor.execute('''
-                        SELECT id FROM user_statistics WHERE topic = ?
-                    ''', (topic,))
-                    stats = cursor.fetchone()
-                    
-                    if stats:
-                        # Update existing stats
-                        cursor.execute('''
-                            UPDATE user_statistics 
-                            SET questions_answered = questions_answered + ?,
-                                last_session = CURRENT_TIMESTAMP
-                            WHERE topic = ?
-                        ''', (num_questions, topic))
-                    else:
-                        # Create new stats
-                        cursor.execute('''
-                            INSERT INTO user_statistics (
-                                topic, questions_answered, correct_answers, last_session
-                            ) VALUES (?, ?, 0, CURRENT_TIMESTAMP)
-                        ''', (topic, num_questions))
-                    
-                    conn.commit()
+            if stats:
+                # Update existing stats
+                cursor.execute('''
+                    UPDATE user_statistics 
+                    SET questions_answered = questions_answered + ?,
+                        last_session = CURRENT_TIMESTAMP
+                    WHERE topic = ?
+                ''', (num_questions, topic))
+            else:
+                # Create new stats
+                cursor.execute('''
+                    INSERT INTO user_statistics (
+                        topic, questions_answered, correct_answers, last_session
+                    ) VALUES (?, ?, 0, CURRENT_TIMESTAMP)
+                ''', (topic, num_questions))
             
-            return jsonify({'questions': questions})
-        except Exception as e:
-            logger.error(f"Error generating questions: {str(e)}")
-            return jsonify({'error': str(e)}), 500
+            conn.commit()
+        
+        return jsonify({
+            'job_id': job_id,
+            'status': job_queue.STATUS_QUEUED,
+            'status_url': url_for('main.get_job_status', job_id=job_id)
+        }), 202
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -620,7 +692,6 @@ def process_documents():
         
         documents = data['documents']
         results = []
-        import re
         
         for doc_path in documents:
             try:
@@ -633,47 +704,28 @@ def process_documents():
                     results.append({'name': doc_path, 'status': 'Erro', 'message': 'Arquivo não encontrado'})
                     continue
                 
-                # Extrair texto do PDF
-                text = extract_text_from_pdf(full_path)
-                logger.info(f'[PROCESS-DOCS] Texto extraído do PDF ({doc_path}): {len(text)} caracteres')
+                # Mesmo conteúdo já processado com outro nome: aproveita os tópicos e resumos já gravados
+                upload_store.copy_processed_topics_for_path(full_path, doc_path)
                 
-                if not text.strip():
-                    logger.error(f'[PROCESS-DOCS] Texto extraído está vazio para o documento {doc_path}')
-                    results.append({'name': doc_path, 'status': 'Erro', 'message': 'Não foi possível extrair texto do documento'})
-                    continue
-                
-                # Separar texto original em blocos por tópico
+                # Separar texto original em blocos por tópico ("1.", "1)", "1.2-"), à medida que
+                # as páginas do PDF são extraídas; as fronteiras ficam em topic_boundaries
                 original_blocks = []
-                current_block = ''
-                current_topic = None
                 
                 logger.info(f'[PROCESS-DOCS] Iniciando extração de tópicos do documento {doc_path}')
                 
-                # Padrão para identificar tópicos (números seguidos de ponto ou parênteses)
-                topic_pattern = re.compile(r'^\s*(\d+[\.\)])\s*(.*?)$', re.MULTILINE)
-                
-                # Encontrar todos os tópicos no texto
-                matches = list(topic_pattern.finditer(text))
-                logger.info(f'[PROCESS-DOCS] Encontrados {len(matches)} tópicos no documento {doc_path}')
-                
-                for i, match in enumerate(matches):
-                    topic_number = match.group(1).strip()
-                    topic_title = match.group(2).strip()
-                    
-                    # Determinar o conteúdo do tópico
-                    start_pos = match.end()
-                    end_pos = matches[i + 1].start() if i + 1 < len(matches) else len(text)
-                    content = text[start_pos:end_pos].strip()
-                    
-                    logger.info(f'[PROCESS-DOCS] Tópico {topic_number} encontrado: {topic_title}')
-                    logger.info(f'[PROCESS-DOCS] Tamanho do conteúdo: {len(content)} caracteres')
+                for block in iter_document_topics(full_path):
+                    logger.info(f'[PROCESS-DOCS] Tópico {block.label} encontrado: {block.title} '
+                                f'(páginas {block.start_page}-{block.end_page})')
+                    logger.info(f'[PROCESS-DOCS] Tamanho do conteúdo: {len(block.content)} caracteres')
                     
                     original_blocks.append({
-                        'number': topic_number,
-                        'title': topic_title,
-                        'content': content
+                        'number': block.label,
+                        'title': block.title,
+                        'content': block.content
                     })
                 
+                logger.info(f'[PROCESS-DOCS] Encontrados {len(original_blocks)} tópicos no documento {doc_path}')
+                
                 # Salvar os tópicos no banco de dados
                 with db_manager.get_connection() as conn:
                     cursor = conn.cursor()
@@ -688,7 +740,10 @@ def process_documents():
                     columns = cursor.fetchall()
                     logger.info(f'[PROCESS-DOCS] Estrutura da tabela topic_summaries: {columns}')
                     
-                    for block in original_blocks:
+                    # Domínios de todos os tópicos do documento numa única passada
+                    classified = load_domain_classifier().classify_document(original_blocks, doc_path)
+                    
+                    for block, domains in zip(original_blocks, classified):
                         try:
                             # Verificar se o tópico já existe
                             cursor.execute('''
@@ -705,57 +760,11 @@ def process_documents():
                             logger.info(f'[PROCESS-DOCS] Inserindo tópico {block["number"]} para o documento {doc_path}')
                             logger.info(f'[PROCESS-DOCS] Dados do tópico: {block}')
                             
-                            # Extrair domínios do título do tópico
-                            domains = []
-                            if "Gerenciamento da Integração" in block['title'] or "Metodologias de Gerenciamento" in doc_path:
-                                domains.append("Gerenciamento da Integração")
-                            if "Gerenciamento do Escopo" in block['title']:
-                                domains.append("Gerenciamento do Escopo")
-                            if "Gerenciamento do Tempo" in block['title']:
-                                domains.append("Gerenciamento do Tempo")
-                            if "Gerenciamento do Custo" in block['title']:
-                                domains.append("Gerenciamento do Custo")
-                            if "Gerenciamento da Qualidade" in block['title']:
-                                domains.append("Gerenciamento da Qualidade")
-                            if "Gerenciamento dos Recursos" in block['title']:
-                                domains.append("Gerenciamento dos Recursos")
-                            if "Gerenciamento das Comunicações" in block['title']:
-                                domains.append("Gerenciamento das Comunicações")
-                            if "Gerenciamento dos Riscos" in block['title']:
-                                domains.append("Gerenciamento dos Riscos")
-                            if "Gerenciamento das Aquisições" in block['title']:
-                                domains.append("Gerenciamento das Aquisições")
-                            if "Gerenciamento das Partes Interessadas" in block['title']:
-                                domains.append("Gerenciamento das Partes Interessadas")
-
-                            # Se não encontrou domínios específicos, usar o domínio do documento
-                            if not domains:
-                                if "Metodologias de Gerenciamento" in doc_path:
-                                    domains.append("Gerenciamento da Integração")
-                                elif "Gerenciamento do Escopo" in doc_path:
-                                    domains.append("Gerenciamento do Escopo")
-                                elif "Gerenciamento do Tempo" in doc_path:
-                                    domains.append("Gerenciamento do Tempo")
-                                elif "Gerenciamento do Custo" in doc_path:
-                                    domains.append("Gerenciamento do Custo")
-                                elif "Gerenciamento da Qualidade" in doc_path:
-                                    domains.append("Gerenciamento da Qualidade")
-                                elif "Gerenciamento dos Recursos" in doc_path:
-                                    domains.append("Gerenciamento dos Recursos")
-                                elif "Gerenciamento das Comunicações" in doc_path:
-                                    domains.append("Gerenciamento das Comunicações")
-                                elif "Gerenciamento dos Riscos" in doc_path:
-                                    domains.append("Gerenciamento dos Riscos")
-                                elif "Gerenciamento das Aquisições" in doc_path:
-                                    domains.append("Gerenciamento das Aquisições")
-                                elif "Gerenciamento das Partes Interessadas" in doc_path:
-                                    domains.append("Gerenciamento das Partes Interessadas")
-
                             cursor.execute('''
                                 INSERT INTO topic_summaries (
                                     document_title, topic, summary, key_points,
-                                    practical_examples, pmbok_references, domains, created_at
-                                ) VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                                    practical_examples, pmbok_references, domains, domain_keys, created_at
+                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
                             ''', (
                                 doc_path,
                                 block['number'],
@@ -763,7 +772,8 @@ def process_documents():
                                 '[]',  # key_points vazio
                                 '[]',  # practical_examples vazio
                                 '[]',  # pmbok_references vazio
-                                json.dumps(domains)
+                                json.dumps(domains),
+                                json.dumps(domain_keys(domains))
                             ))
                             
                             # Verificar se o tópico foi inserido
@@ -814,26 +824,6 @@ def process_documents():
         current_app.logger.error(f'[PROCESS-DOCS] Stack trace: {traceback.format_exc()}')
         return jsonify({'error': str(e)}), 500
 
-def split_text_into_chunks(text, chunk_size=1000):
-    words = text.split()
-    chunks = []
-    current_chunk = []
-    current_size = 0
-    
-    for word in words:
-        if current_size + len(word) > chunk_size:
-            chunks.append(' '.join(current_chunk))
-            current_chunk = [word]
-            current_size = len(word)
-        else:
-            current_chunk.append(word)
-            current_size += len(word) + 1
-            
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
-        
-    return chunks
-
 def process_chunks_with_ai(chunks):
     client = get_openai_client()
     processed_chunks = []
@@ -864,7 +854,29 @@ def process_chunks_with_ai(chunks):
 @main.route('/api/document-chunks/<document_title>')
 @login_required
 def get_document_chunks(document_title):
+    """
+    Chunks do documento: para PDFs enviados, os de document_chunks (divididos uma vez
+    por conteúdo, ver app/api/document_chunks.py); senão, os salvos em text_chunks.
+    """
     try:
+        try:
+            pdf_path = upload_store.alias_path(upload_store.clean_filename(document_title))
+        except upload_store.InvalidUpload:
+            pdf_path = None
+        if pdf_path and os.path.exists(pdf_path):
+            document_sha256, chunks = document_chunks.document_chunks(pdf_path)
+            return jsonify({
+                'document_sha256': document_sha256,
+                'chunks': [{
+                    'content': chunk['text'],
+                    'chunk_index': chunk['chunk_index'],
+                    'start_offset': chunk['start_offset'],
+                    'end_offset': chunk['end_offset'],
+                    'tokens': chunk['tokens'],
+                    'document_title': document_title
+                } for chunk in chunks]
+            })
+        
         with db_manager.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
@@ -887,6 +899,38 @@ def get_document_chunks(document_title):
         logger.error(f"Error getting document chunks: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@main.route('/api/upload-document', methods=['POST'])
+@login_required
+def upload_document():
+    """Recebe um PDF e o guarda uma vez por conteúdo, com o nome como alias (ver app/api/upload_store.py)"""
+    try:
+        uploaded = request.files.get('document')
+        if uploaded is None or not uploaded.filename:
+            logger.error('[UPLOAD] Nenhum arquivo enviado')
+            return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+        
+        stored = upload_store.store_upload(uploaded.stream, uploaded.filename, user_id=current_user.id)
+        # Mesmo conteúdo já processado com outro nome: os tópicos e resumos são aproveitados
+        processed_as = upload_store.copy_processed_topics(stored.sha256, stored.filename)
+        
+        return jsonify({
+            'success': True,
+            'filename': stored.filename,
+            'sha256': stored.sha256,
+            'size': stored.size,
+            'deduplicated': stored.deduplicated,
+            'aliases': stored.aliases,
+            'processed_as': processed_as
+        }), 200 if stored.deduplicated else 201
+        
+    except upload_store.InvalidUpload as e:
+        logger.warning(f'[UPLOAD] Arquivo recusado: {str(e)}')
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f'[UPLOAD] Erro ao salvar arquivo: {str(e)}')
+        logger.error(traceback.format_exc())
+        return jsonify({'error': f'Erro ao salvar arquivo: {str(e)}'}), 500
+
 @main.route('/api/list-documents', methods=['GET'])
 def list_documents():
     try:
@@ -969,7 +1013,9 @@ def delete_document():
         logger.warning(f'[DELETE] Arquivo não encontrado: {file_path}')
         return jsonify({'error': 'Arquivo não encontrado.'}), 404
     try:
-        os.remove(file_path)
+        # O conteúdo guardado só é apagado quando não sobra nenhum nome apontando para ele
+        if not upload_store.remove_upload(filename):
+            os.remove(file_path)
         logger.info(f'[DELETE] Arquivo removido: {file_path}')
         # Remover chunks do banco de dados
         # Usa o nome do arquivo com extensão para buscar no banco
@@ -992,6 +1038,101 @@ def db_viewer():
     users = User.query.limit(10).all()
     return render_template('db_viewer.html', chunks=chunks, questions=questions, users=users)
 
+@main.route('/api/ingest-documents', methods=['POST'])
+@login_required
+@idempotent('ingest-documents')
+def ingest_documents():
+    """Enfileira a ingestão dos documentos (um job por documento, executado pelos workers)"""
+    try:
+        data = request.get_json()
+        if not data or not data.get('documents'):
+            logger.error('[INGESTION] Dados inválidos recebidos na ingestão')
+            return jsonify({'error': 'Dados inválidos'}), 400
+        
+        uploads_dir = os.path.join('data', 'uploads', 'resumos')
+        documents, missing = [], []
+        for doc_path in data['documents']:
+            full_path = os.path.join(uploads_dir, doc_path)
+            if os.path.exists(full_path):
+                documents.append((doc_path, full_path))
+            else:
+                missing.append(doc_path)
+        if not documents:
+            return jsonify({'error': 'Arquivo não encontrado', 'missing': missing}), 404
+        
+        batch_id = ingestion.create_batch(documents, summarize=bool(data.get('summarize')),
+                                          user_id=current_user.id)
+        return jsonify({
+            'batch_id': batch_id,
+            'status': job_queue.STATUS_QUEUED,
+            'status_url': url_for('main.get_ingestion_status', batch_id=batch_id),
+            'missing': missing
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"[INGESTION] Erro ao enfileirar ingestão: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/ingest-documents/<batch_id>', methods=['GET'])
+@login_required
+def get_ingestion_status(batch_id):
+    """Retorna o estágio e o progresso de cada documento do lote"""
+    try:
+        # Lotes de outros usuários respondem 404, como os jobs
+        status = ingestion.batch_status(batch_id, current_user.id, current_user.is_admin)
+        if not status:
+            return jsonify({'error': 'Batch not found'}), 404
+        return jsonify(status)
+    except Exception as e:
+        logger.error(f"[INGESTION] Erro ao buscar lote {batch_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/summarize-document', methods=['POST'])
+@login_required
+@idempotent('summarize-document')
+def summarize_document():
+    """Enfileira os resumos de todos os tópicos do documento (gerados em paralelo pelos workers)"""
+    try:
+        data = request.get_json()
+        if not data or not data.get('document'):
+            logger.error('[SUMMARIZE-DOCUMENT] Dados inválidos recebidos')
+            return jsonify({'error': 'Dados inválidos'}), 400
+        
+        doc_path = data['document']
+        pdf_path = os.path.join('data', 'uploads', 'resumos', doc_path)
+        if not os.path.exists(pdf_path):
+            logger.error(f'[SUMMARIZE-DOCUMENT] Arquivo não encontrado: {pdf_path}')
+            return jsonify({'error': 'Arquivo não encontrado'}), 404
+        
+        try:
+            concurrency = int(data.get('concurrency') or topic_summarizer.SUMMARY_CONCURRENCY)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid number format'}), 400
+        if not (1 <= concurrency <= 16):
+            return jsonify({'error': 'Concurrency must be between 1 and 16'}), 400
+        
+        # Reaproveita um job ainda pendente do mesmo documento
+        params = {'document_title': doc_path}
+        job = job_queue.find_active_job(topic_summarizer.SUMMARIZE_DOCUMENT_JOB_TYPE, params)
+        if job:
+            job_id = job['id']
+        else:
+            job_id = job_queue.enqueue_job(topic_summarizer.SUMMARIZE_DOCUMENT_JOB_TYPE,
+                                           dict(params, pdf_path=pdf_path, concurrency=concurrency),
+                                           user_id=current_user.id)
+        
+        return jsonify({
+            'job_id': job_id,
+            'status': job_queue.STATUS_QUEUED,
+            'status_url': url_for('main.get_job_status', job_id=job_id)
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"[SUMMARIZE-DOCUMENT] Erro ao enfileirar resumos: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
 @main.route('/api/extract-topics', methods=['POST'])
 @login_required
 def extract_topics():
@@ -1004,24 +1145,9 @@ def extract_topics():
         full_path = os.path.join(uploads_dir, doc_path)
         if not os.path.exists(full_path):
             return jsonify({'error': 'Arquivo não encontrado'}), 404
-        text = extract_text_from_pdf(full_path)
-        import re
-        original_blocks = []
-        current_block = ''
-        current_topic = None
-        for line in text.splitlines():
-            match = re.match(r'^(\d+)(?:\.\d+)*-\s*(.*)', line.strip())
-            if match:
-                main_topic = match.group(1)
-                if current_topic is not None and main_topic != current_topic:
-                    original_blocks.append({'topic': current_topic, 'text': current_block.strip()})
-                    current_block = ''
-                current_topic = main_topic
-                current_block += ('' if current_block == '' else '\n') + match.group(2)
-            else:
-                current_block += '\n' + line
-        if current_block and current_topic is not None:
-            original_blocks.append({'topic': current_topic, 'text': current_block.strip()})
+        # Tópicos agrupados pelo número principal, página a página
+        original_blocks = [{'topic': block.number, 'text': f"{block.title}\n{block.content}".strip()}
+                           for block in iter_document_topics(full_path)]
         # Filtrar apenas tópicos com texto não vazio
         original_blocks = [b for b in original_blocks if b['text'].strip()]
         # Remover quebras de linha para exibição em parágrafo
@@ -1031,7 +1157,23 @@ def extract_topics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def queued_topic_summary(document_title, topic, pdf_path, retry_after):
+    """Enfileira o resumo do tópico (modelo indisponível) e responde 202 com o job."""
+    user_id = current_user.id if current_user.is_authenticated else None
+    job_id = enqueue_topic_summary(document_title, topic, pdf_path, user_id=user_id)
+    logger.warning(f"[PROCESS-TOPIC] Modelo de resumos indisponível: resumo enfileirado no job {job_id}")
+    response = jsonify({
+        'status': job_queue.STATUS_QUEUED,
+        'job_id': job_id,
+        'status_url': url_for('main.get_job_status', job_id=job_id),
+        'retry_after': math.ceil(retry_after)
+    })
+    response.status_code = 202
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
 @main.route('/process_topic', methods=['POST'])
+@idempotent('process_topic', key_fields=('topic', 'document_title'), per_user=False)
 def process_topic():
     try:
         data = request.get_json()
@@ -1053,8 +1195,14 @@ def process_topic():
         pdf_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'resumos', document_title)
         logger.info(f"[PROCESS-TOPIC] Caminho do arquivo: {pdf_path}")
         
+        # Modelo de resumos indisponível: o resumo é gerado por um worker quando ele voltar
+        retry_after = circuit_breaker.retry_after([summary_model()])
+        if retry_after:
+            return queued_topic_summary(document_title, topic, pdf_path, retry_after)
+        
         try:
-            text = extract_text_from_pdf(pdf_path)
+            # Só o trecho do tópico vai para o modelo (ver topic_boundaries.py)
+            text = topic_text(pdf_path, topic)
             logger.info(f"[PROCESS-TOPIC] Texto extraído com sucesso: {len(text)} caracteres")
         except Exception as e:
             logger.error(f"[PROCESS-TOPIC] Erro ao extrair texto do PDF: {str(e)}")
@@ -1071,54 +1219,10 @@ def process_topic():
             
             # Salvar no banco de dados
             try:
-                conn = db_manager.get_connection()
-                cursor = conn.cursor()
-                
-                # Verificar se já existe um resumo para este tópico
-                cursor.execute("""
-                    SELECT id FROM topic_summaries 
-                    WHERE document_title = ? AND topic = ?
-                """, (document_title, topic))
-                
-                existing_summary = cursor.fetchone()
-                
-                if existing_summary:
-                    # Atualizar resumo existente
-                    cursor.execute("""
-                        UPDATE topic_summaries 
-                        SET summary = ?, key_points = ?, practical_examples = ?,
-                            pmbok_references = ?, domains = ?
-                        WHERE id = ?
-                    """, (
-                        summary_data['summary'],
-                        json.dumps(summary_data['key_points']),
-                        json.dumps(summary_data['practical_examples']),
-                        json.dumps(summary_data['pmbok_references']),
-                        json.dumps(summary_data['domains']),
-                        existing_summary[0]
-                    ))
-                    summary_id = existing_summary[0]
-                    logger.info(f"[PROCESS-TOPIC] Resumo atualizado com ID: {summary_id}")
-                else:
-                    # Inserir novo resumo
-                    cursor.execute("""
-                        INSERT INTO topic_summaries 
-                        (document_title, topic, summary, key_points, practical_examples,
-                         pmbok_references, domains)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        document_title,
-                        topic,
-                        summary_data['summary'],
-                        json.dumps(summary_data['key_points']),
-                        json.dumps(summary_data['practical_examples']),
-                        json.dumps(summary_data['pmbok_references']),
-                        json.dumps(summary_data['domains'])
-                    ))
-                    summary_id = cursor.lastrowid
-                    logger.info(f"[PROCESS-TOPIC] Novo resumo salvo com ID: {summary_id}")
-                    
-                conn.commit()
+                # Hash do trecho e versão do prompt: summarize_document pula o tópico se não mudarem
+                summary_id = save_topic_summary(document_title, topic, summary_data,
+                                                source_sha256=topic_summarizer.section_sha256(text),
+                                                prompt_version=SUMMARY_PROMPT_VERSION)
                 return jsonify({
                     'success': True,
                     'summary_id': summary_id,
@@ -1131,6 +1235,8 @@ def process_topic():
                 logger.error(f"[PROCESS-TOPIC] Stack trace: {traceback.format_exc()}")
                 return jsonify({'error': f'Erro ao salvar no banco de dados: {str(e)}'}), 500
                 
+        except CircuitOpenError as e:
+            return queued_topic_summary(document_title, topic, pdf_path, e.retry_after)
         except Exception as e:
             logger.error(f"[PROCESS-TOPIC] Erro ao gerar resumo: {str(e)}")
             logger.error(f"[PROCESS-TOPIC] Tipo do erro: {type(e)}")
@@ -1297,23 +1403,52 @@ def get_domains():
         logger.error(f"Erro ao buscar domínios: {str(e)}")
         return jsonify({'error': 'Erro ao buscar domínios'}), 500
 
+def stored_questions_response(domain, questions, num_questions, retry_after):
+    """
+    Resposta da geração com o modelo indisponível (circuito aberto): completa as
+    questões já obtidas com questões salvas do domínio que o usuário ainda não
+    recebeu, marcando a resposta como degradada.
+    """
+    questions = list(questions) + serve_stored_questions(domain, num_questions - len(questions),
+                                                         user_id=current_user.id)
+    if not questions:
+        response = jsonify({'error': 'Modelo indisponível e nenhuma questão salva disponível para o domínio',
+                            'retry_after': math.ceil(retry_after)})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response
+    return jsonify({
+        'questions': questions,
+        'used_summaries': question_inventory.claimed_summaries(questions),
+        'degraded': True,
+        'retry_after': math.ceil(retry_after)
+    })
+
 @main.route('/api/generate-questions', methods=['POST'])
 @login_required
+@idempotent('generate-questions')
 def generate_questions_endpoint():
+    # Prazo da requisição: a geração para antes do timeout do gunicorn e devolve o que já ficou pronto
+    deadline = Deadline(GENERATION_DEADLINE)
     try:
         # Log do token CSRF
         csrf_token = request.headers.get('X-CSRFToken')
         logger.info(f"[GENERATE-QUESTIONS] CSRF Token recebido: {csrf_token}")
         
-        data = request.get_json()
+        data = request.get_json() or {}
         domain = data.get('domain')
-        num_questions = data.get('num_questions', 5)
         
-        logger.info(f"[GENERATE-QUESTIONS] Received request with domain: {domain}, num_questions: {num_questions}")
+        logger.info(f"[GENERATE-QUESTIONS] Received request with domain: {domain}, "
+                    f"num_questions: {data.get('num_questions')}")
         
         if not domain:
             logger.error("[GENERATE-QUESTIONS] Missing required field: domain")
             return jsonify({'error': 'Domain is required'}), 400
+        
+        # Validado antes de enfileirar ou reservar questões do estoque
+        num_questions, error_response = parse_num_questions(data, 'GENERATE-QUESTIONS')
+        if error_response:
+            return error_response
             
         # Buscar o domínio no banco de dados
         domain_obj = Domain.query.filter_by(name=domain).first()
@@ -1326,201 +1461,348 @@ def generate_questions_endpoint():
         if not default_models:
             logger.error("[GENERATE-QUESTIONS] No default models found")
             return jsonify({'error': 'No default models configured'}), 400
-            
-        # Mapear modelos por tipo
-        model_map = {model.model_type: model.model_id for model in default_models}
+        
+        # Requisição assíncrona: apenas enfileira o job e retorna
+        if data.get('async'):
+            job_id = job_queue.enqueue_job('generate', {
+                'domain': domain,
+                'num_questions': num_questions
+            }, user_id=current_user.id)
+            return jsonify({
+                'job_id': job_id,
+                'status': job_queue.STATUS_QUEUED,
+                'status_url': url_for('main.get_job_status', job_id=job_id)
+            }), 202
+        
+        # Entregar primeiro as questões do estoque pré-gerado do domínio
+        inventory_questions = question_inventory.claim_questions(domain, num_questions, user_id=current_user.id)
+        if len(inventory_questions) >= num_questions:
+            logger.info(f"[GENERATE-QUESTIONS] {len(inventory_questions)} questões entregues do estoque")
+            return jsonify({
+                'questions': inventory_questions,
+                'used_summaries': question_inventory.claimed_summaries(inventory_questions)
+            })
+        
+        # Modelo indisponível: responde na hora com questões já salvas em vez de esperar a geração falhar
+        retry_after = generation_retry_after()
+        if retry_after:
+            logger.warning(f"[GENERATE-QUESTIONS] Geração indisponível por {retry_after:.0f}s: usando questões salvas")
+            return stored_questions_response(domain, inventory_questions, num_questions, retry_after)
         
         # Buscar resumos relacionados ao domínio
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            def normalize_unicode(text):
-                """Normaliza texto para lidar com caracteres Unicode escapados"""
-                import unicodedata
-                logger.info(f"[GENERATE-QUESTIONS] Normalizando texto: {text}")
-                logger.info(f"[GENERATE-QUESTIONS] Tipo do texto: {type(text)}")
-                logger.info(f"[GENERATE-QUESTIONS] Bytes do texto: {text.encode('utf-8')}")
-                
-                # Primeiro tenta decodificar se for bytes
-                if isinstance(text, bytes):
-                    text = text.decode('utf-8')
-                    logger.info(f"[GENERATE-QUESTIONS] Texto decodificado de bytes: {text}")
-                
-                # Remove escapes Unicode
-                text = text.encode('utf-8').decode('unicode-escape')
-                logger.info(f"[GENERATE-QUESTIONS] Texto após remover escapes: {text}")
-                
-                # Normaliza para forma composta
-                text = unicodedata.normalize('NFC', text)
-                logger.info(f"[GENERATE-QUESTIONS] Texto após normalização NFC: {text}")
-                
-                # Tenta corrigir caracteres especiais
-                text = text.replace('Ã£', 'ã').replace('Ã§', 'ç').replace('Ãµ', 'õ')
-                logger.info(f"[GENERATE-QUESTIONS] Texto após correção de caracteres: {text}")
-                
-                normalized = text.lower().strip()
-                logger.info(f"[GENERATE-QUESTIONS] Texto final normalizado: {normalized}")
-                return normalized
-
-            # Primeiro, vamos verificar o conteúdo da tabela
-            cursor.execute("SELECT id, document_title, domains, summary FROM topic_summaries")
-            all_summaries = cursor.fetchall()
-            logger.info(f"[GENERATE-QUESTIONS] Total de registros na tabela: {len(all_summaries)}")
-            
-            # Lista para armazenar os IDs dos resumos encontrados
-            found_summary_ids = []
+        summary_data = select_domain_summary(domain)
+        if not summary_data:
+            if inventory_questions:
+                return jsonify({
+                    'questions': inventory_questions,
+                    'used_summaries': question_inventory.claimed_summaries(inventory_questions)
+                })
+            return jsonify({'error': 'No summary found for domain'}), 404
+        selected_id = summary_data['id']
+        
+        # Gerar ao vivo apenas o que o estoque não cobriu
+        from app.api.openai_client import generate_questions
+        questions = generate_questions(
+            topic=domain,
+            num_questions=num_questions - len(inventory_questions),
+            api_key=os.getenv('OPENAI_API_KEY'),
+            summary=summary_prompt_context(summary_data),  # Passa o contexto do resumo encontrado
+            deadline=deadline
+        )
+        # O circuito pode ter aberto durante a geração: completa com questões salvas
+        retry_after = generation_retry_after()
+        if not questions and not inventory_questions:
+            if retry_after:
+                return stored_questions_response(domain, [], num_questions, retry_after)
+            logger.error("[GENERATE-QUESTIONS] No questions generated")
+            return jsonify({'error': 'Failed to generate questions'}), 500
+        
+        # Salvar as questões no banco de dados
+        saved_questions = list(inventory_questions)
+        for question in questions or []:
+            question_id = save_generated_question(question, domain, selected_id)
+            if question_id is None:
+                continue
             
-            # Normalizar o domínio buscado
-            normalized_domain = normalize_unicode(domain)
-            logger.info(f"[GENERATE-QUESTIONS] Domínio buscado normalizado: {normalized_domain}")
+            # Adicionar ID à questão
+            question['id'] = question_id
+            saved_questions.append(question)
+        
+        if retry_after and len(saved_questions) < num_questions:
+            return stored_questions_response(domain, saved_questions, num_questions, retry_after)
+        
+        # Adiciona os resumos usados à resposta
+        return jsonify({
+            'questions': saved_questions,
+            'used_summaries': summary_data['used_summaries']
+        })
             
-            for summary in all_summaries:
-                try:
-                    domains_json = json.loads(summary[2])
-                    logger.info(f"[GENERATE-QUESTIONS] Processando documento: {summary[1]}")
-                    logger.info(f"[GENERATE-QUESTIONS] Domínios originais: {domains_json}")
-                    
-                    # Verifica se o domínio está presente e se tem resumo
-                    if isinstance(domains_json, list) and summary[3]:
-                        for domain_item in domains_json:
-                            if isinstance(domain_item, dict):
-                                domain_name = domain_item.get('name', '')
-                            else:
-                                domain_name = domain_item
-                            
-                            normalized_item = normalize_unicode(domain_name)
-                            logger.info(f"[GENERATE-QUESTIONS] Comparando:")
-                            logger.info(f"  - Domínio buscado: {normalized_domain}")
-                            logger.info(f"  - Domínio do item: {normalized_item}")
-                            
-                            if normalized_item == normalized_domain:
-                                found_summary_ids.append(summary[0])
-                                logger.info(f"[GENERATE-QUESTIONS] Domínio encontrado em resumo ID: {summary[0]}")
-                                break
-                except Exception as e:
-                    logger.error(f"[GENERATE-QUESTIONS] Erro ao processar domínios: {e}")
-                    logger.error(f"[GENERATE-QUESTIONS] Stack trace: {traceback.format_exc()}")
-
-            if found_summary_ids:
-                # Escolhe um resumo aleatoriamente
-                import random
-                selected_id = random.choice(found_summary_ids)
-                logger.info(f"[GENERATE-QUESTIONS] Resumo selecionado aleatoriamente: ID {selected_id}")
-                
-                # Busca o resumo completo
-                cursor.execute("""
-                    SELECT 
-                        summary,
-                        key_points,
-                        practical_examples,
-                        pmbok_references,
-                        domains,
-                        document_title
-                    FROM topic_summaries 
-                    WHERE id = ?
-                """, (selected_id,))
-                
-                result = cursor.fetchone()
-                if result and result[0]:
-                    summary_data = {
-                        'summary': result[0],
-                        'key_points': json.loads(result[1]) if result[1] else [],
-                        'practical_examples': json.loads(result[2]) if result[2] else [],
-                        'pmbok_references': json.loads(result[3]) if result[3] else [],
-                        'domains': result[4]
-                    }
-                    logger.info(f"[GENERATE-QUESTIONS] Processando resumo para domínio {domain}")
-                    logger.info(f"[GENERATE-QUESTIONS] Primeiros 100 caracteres do resumo: {result[0][:100]}")
-                    
-                    # Busca todos os resumos usados para exibição
-                    used_summaries = []
-                    for summary_id in found_summary_ids:
-                        cursor.execute("""
-                            SELECT document_title, summary 
-                            FROM topic_summaries 
-                            WHERE id = ?
-                        """, (summary_id,))
-                        summary_result = cursor.fetchone()
-                        if summary_result:
-                            used_summaries.append({
-                                'document': summary_result[0],
-                                'summary': summary_result[1]
-                            })
-                    
-                    from app.api.openai_client import generate_questions
-                    questions = generate_questions(
-                        topic=domain,
-                        num_questions=num_questions,
-                        api_key=os.getenv('OPENAI_API_KEY'),
-                        summary=result[0]  # Passa o resumo encontrado
-                    )
-                    if not questions:
-                        logger.error("[GENERATE-QUESTIONS] No questions generated")
-                        return jsonify({'error': 'Failed to generate questions'}), 500
-                    
-                    # Salvar as questões no banco de dados
-                    saved_questions = []
-                    for question in questions:
-                        try:
-                            # Preparar dados da questão
-                            question_data = {
-                                'question': question['question'],
-                                'options': question['options'],
-                                'correct_answer': question['correct_answer'],
-                                'explanation': question['explanation'],
-                                'topic': domain,
-                                'metadata': json.dumps({
-                                    'summary_id': selected_id,
-                                    'generated_at': datetime.now().isoformat()
-                                })
-                            }
-                            
-                            # Salvar no banco
-                            with db_manager.get_connection() as conn:
-                                cursor = conn.cursor()
-                                cursor.execute('''
-                                    INSERT INTO questions (
-                                        question, options, correct_answer, explanation, 
-                                        topic, metadata, created_at
-                                    ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                                ''', (
-                                    question_data['question'],
-                                    json.dumps(question_data['options']),
-                                    question_data['correct_answer'],
-                                    question_data['explanation'],
-                                    question_data['topic'],
-                                    question_data['metadata']
-                                ))
-                                question_id = cursor.lastrowid
-                                conn.commit()
-                                
-                                # Adicionar ID à questão
-                                question['id'] = question_id
-                                saved_questions.append(question)
-                                logger.info(f"[GENERATE-QUESTIONS] Questão salva com ID: {question_id}")
-                                
-                        except Exception as e:
-                            logger.error(f"[GENERATE-QUESTIONS] Erro ao salvar questão: {str(e)}")
-                            logger.error("[GENERATE-QUESTIONS] Stack trace:", exc_info=True)
-                            continue
-                    
-                    # Adiciona os resumos usados à resposta
-                    return jsonify({
-                        'questions': saved_questions,
-                        'used_summaries': used_summaries
-                    })
-                else:
-                    logger.error(f"[GENERATE-QUESTIONS] Resumo não encontrado para o ID: {selected_id}")
-                    return jsonify({'error': 'No summary found for domain'}), 404
-            else:
-                logger.error(f"[GENERATE-QUESTIONS] No summary found for domain: {domain}")
+    except Exception as e:
+        logger.error(f"[GENERATE-QUESTIONS] Error: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+# Intervalo (segundos) dos comentários SSE enviados enquanto a geração espera o modelo;
+# é a escrita que revela que o cliente desconectou
+SSE_KEEPALIVE_SECONDS = float(os.getenv('SSE_KEEPALIVE_SECONDS', '5'))
+
+def sse_event(event, data):
+    """Formata uma mensagem no protocolo Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@main.route('/api/generate-questions/stream', methods=['POST'])
+@login_required
+def generate_questions_stream():
+    """
+    Gera questões e envia cada uma via Server-Sent Events assim que fica pronta.
+
+    Eventos: progress (etapa em andamento), question (questão salva, no mesmo
+    formato de /api/generate-questions), error (falha em uma questão) e done.
+    Questões do estoque pré-gerado do domínio são enviadas primeiro; apenas o
+    restante é gerado ao vivo. Com o modelo indisponível (circuito aberto), o
+    restante vem de questões já salvas do domínio e o done traz degraded=true.
+    """
+    try:
+        data = request.get_json() or {}
+        domain = data.get('domain')
+        
+        if not domain:
+            logger.error("[GENERATE-STREAM] Missing required field: domain")
+            return jsonify({'error': 'Domain is required'}), 400
+        
+        num_questions, error_response = parse_num_questions(data, 'GENERATE-STREAM')
+        if error_response:
+            return error_response
+        
+        if not Domain.query.filter_by(name=domain).first():
+            logger.error(f"[GENERATE-STREAM] Domain not found: {domain}")
+            return jsonify({'error': 'Domain not found'}), 404
+        
+        # Entregar primeiro as questões do estoque pré-gerado do domínio
+        inventory_questions = question_inventory.claim_questions(domain, num_questions, user_id=current_user.id)
+        remaining = num_questions - len(inventory_questions)
+        
+        # Modelo indisponível: o restante vem de questões já salvas, sem geração ao vivo
+        retry_after = generation_retry_after() if remaining > 0 else None
+        if retry_after:
+            logger.warning(f"[GENERATE-STREAM] Geração indisponível por {retry_after:.0f}s: usando questões salvas")
+            inventory_questions += serve_stored_questions(domain, remaining, user_id=current_user.id)
+            remaining = 0
+            if not inventory_questions:
+                response = jsonify({'error': 'Modelo indisponível e nenhuma questão salva disponível para o domínio',
+                                    'retry_after': math.ceil(retry_after)})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(math.ceil(retry_after))
+                return response
+        
+        summary_data = None
+        if remaining > 0:
+            summary_data = select_domain_summary(domain)
+            if not summary_data and not inventory_questions:
                 return jsonify({'error': 'No summary found for domain'}), 404
+        
+        if summary_data:
+            selected_id = summary_data['id']
+            used_summaries = summary_data['used_summaries']
+        else:
+            used_summaries = question_inventory.claimed_summaries(inventory_questions)
+        
+    except Exception as e:
+        logger.error(f"[GENERATE-STREAM] Error: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+    
+    from app.api.openai_client import iter_generate_questions
+    
+    # Cancelado quando o cliente desconecta: fecha também a chamada ao modelo em andamento
+    deadline = Deadline(abort_in_flight=True)
+    
+    def produce_live_events(events):
+        """Executa a geração ao vivo em outra thread, entregando os eventos pela fila."""
+        try:
+            for event in iter_generate_questions(
+                topic=domain,
+                num_questions=remaining,
+                api_key=os.getenv('OPENAI_API_KEY'),
+                summary=summary_prompt_context(summary_data),
+                deadline=deadline
+            ):
+                events.put(event)
+        except Exception as e:
+            events.put(e)
+        finally:
+            events.put(None)
+    
+    def live_events():
+        """
+        Eventos da geração ao vivo do que o estoque não cobriu, com índices após os do estoque.
+        
+        Enquanto a thread produtora espera o modelo, envia um comentário SSE a cada
+        SSE_KEEPALIVE_SECONDS: se o cliente desconectou, a escrita falha, o gerador é
+        fechado (GeneratorExit) e event_stream cancela a chamada em andamento.
+        """
+        if not summary_data:
+            return
+        events = queue.Queue()
+        threading.Thread(target=produce_live_events, args=(events,), daemon=True).start()
+        while True:
+            try:
+                event = events.get(timeout=SSE_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield None
+                continue
+            if event is None:
+                return
+            if isinstance(event, Exception):
+                raise event
+            if 'index' in event:
+                event['index'] += len(inventory_questions)
+                event['total'] = num_questions
+            yield event
+    
+    def event_stream():
+        saved = 0
+        try:
+            for index, question in enumerate(inventory_questions):
+                saved += 1
+                yield sse_event('question', {'index': index, 'total': num_questions, 'question': question})
             
+            for event in live_events():
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                if event['event'] == 'question':
+                    question = event['question']
+                    question_id = save_generated_question(question, domain, selected_id)
+                    if question_id is None:
+                        yield sse_event('error', {'index': event['index'], 'total': num_questions,
+                                                  'stage': 'save', 'message': 'Erro ao salvar questão'})
+                        continue
+                    question['id'] = question_id
+                    saved += 1
+                    logger.info(f"[GENERATE-STREAM] Questão {saved}/{num_questions} enviada")
+                yield sse_event(event['event'], {k: v for k, v in event.items() if k != 'event'})
+            
+            # O circuito abriu durante a geração: completa com questões já salvas
+            if saved < num_questions and summary_data and generation_retry_after():
+                for question in serve_stored_questions(domain, num_questions - saved, user_id=current_user.id):
+                    yield sse_event('question', {'index': saved, 'total': num_questions, 'question': question})
+                    saved += 1
+        except GeneratorExit:
+            # Cliente desconectou: a thread produtora para e a chamada em andamento é fechada
+            logger.info(f"[GENERATE-STREAM] Cliente desconectado após {saved}/{num_questions} questões")
+            deadline.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"[GENERATE-STREAM] Error: {str(e)}")
+            logger.error(traceback.format_exc())
+            yield sse_event('error', {'message': str(e)})
+        
+        yield sse_event('done', {
+            'generated': saved,
+            'total': num_questions,
+            'used_summaries': used_summaries,
+            'degraded': bool(retry_after or (summary_data and generation_retry_after()))
+        })
+    
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Evita que proxies (nginx) acumulem a resposta antes de enviá-la
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@main.route('/api/jobs/generate', methods=['POST'])
+@login_required
+@idempotent('jobs-generate')
+def create_generation_job():
+    """Enfileira a geração de questões para ser executada pelos workers"""
+    try:
+        data = request.get_json() or {}
+        domain = data.get('domain')
+        
+        if not domain:
+            logger.error("[JOBS] Missing required field: domain")
+            return jsonify({'error': 'Domain is required'}), 400
+        
+        num_questions, error_response = parse_num_questions(data, 'JOBS')
+        if error_response:
+            return error_response
+        
+        if not Domain.query.filter_by(name=domain).first():
+            logger.error(f"[JOBS] Domain not found: {domain}")
+            return jsonify({'error': 'Domain not found'}), 404
+        
+        job_id = job_queue.enqueue_job('generate', {
+            'domain': domain,
+            'num_questions': num_questions
+        }, user_id=current_user.id)
+        
+        return jsonify({
+            'job_id': job_id,
+            'status': job_queue.STATUS_QUEUED,
+            'status_url': url_for('main.get_job_status', job_id=job_id)
+        }), 202
+        
     except Exception as e:
-        logger.error(f"[GENERATE-QUESTIONS] Error: {str(e)}")
+        logger.error(f"[JOBS] Erro ao enfileirar job: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@main.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job_status(job_id):
+    """Retorna status, progresso e resultados parciais de um job"""
+    try:
+        # Jobs de outros usuários respondem 404, sem revelar que existem
+        job = job_queue.get_user_job(job_id, current_user.id, current_user.is_admin)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+    except Exception as e:
+        logger.error(f"[JOBS] Erro ao buscar job {job_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    """Solicita o cancelamento de um job"""
+    try:
+        job = job_queue.cancel_job(job_id, current_user.id, current_user.is_admin)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+    except Exception as e:
+        logger.error(f"[JOBS] Erro ao cancelar job {job_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/inventory', methods=['GET'])
+@login_required
+def get_inventory_status():
+    """Retorna o estoque de questões pré-geradas por domínio"""
+    try:
+        return jsonify({
+            'target': question_inventory.INVENTORY_TARGET,
+            'low_water': question_inventory.INVENTORY_LOW_WATER,
+            'stock': question_inventory.stock_levels()
+        })
+    except Exception as e:
+        logger.error(f"[INVENTORY] Erro ao consultar estoque: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/metrics', methods=['GET'])
+@login_required
+def get_generation_metrics():
+    """Retorna as métricas das chamadas ao modelo neste processo (etapa, modelo, tokens e latência)"""
+    try:
+        return jsonify(metrics.snapshot())
+    except Exception as e:
+        logger.error(f"[METRICS] Erro ao consultar métricas: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @main.route('/api/database-status')
 @login_required
 def api_database_status():
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Divisão do texto dos documentos em chunks por tokens, respeitando sentenças.
+
+O texto é quebrado em sentenças (regras para o português: abreviações,
+iniciais, numeração de tópicos e parágrafos) e as sentenças são agrupadas
+até CHUNK_MAX_TOKENS tokens estimados (ver api/token_budget.py). Cada chunk
+repete as últimas sentenças do anterior, até CHUNK_OVERLAP_TOKENS tokens,
+para que uma ideia dividida entre dois chunks apareça inteira em um deles.
+Uma sentença maior que o limite é dividida entre palavras.
+
+O texto pode chegar em pedaços (ex.: as páginas de iter_pdf_pages) e os
+chunks são entregues à medida que ficam prontos. Cada chunk traz a posição
+(offsets) no texto completo do documento, o mesmo de extract_text_from_pdf,
+então basta guardar as posições (ver api/document_chunks.py) em vez de
+duplicar o texto.
+"""
+
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from ..api.token_budget import estimate_tokens, token_spans
+
+# Versão das regras de divisão; chunks guardados com outra versão são recalculados
+CHUNKER_VERSION = 1
+
+# Tamanho máximo de cada chunk e sobreposição com o chunk anterior, em tokens estimados
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '300'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '40'))
+
+# Fim de sentença (pontuação, aspas ou parênteses de fechamento e espaço) ou parágrafo (linha em branco)
+SENTENCE_BOUNDARY = re.compile(r'(?P<end>[.!?…]+["\'”»)\]]*)\s|\n[ \t]*\n')
+
+# Abreviações comuns nos documentos, sem o ponto e em minúsculas
+ABBREVIATIONS = frozenset({
+    'sr', 'sra', 'srs', 'dr', 'dra', 'prof', 'profa', 'eng', 'exmo', 'ilmo', 'etc', 'ex', 'obs',
+    'p', 'pp', 'pág', 'pag', 'cap', 'art', 'fig', 'tab', 'vol', 'ed', 'n', 'nº', 'no', 'num',
+    'aprox', 'máx', 'max', 'mín', 'min', 'ref', 'cf', 'op', 'cit', 'ltda', 'cia', 'inc', 'av',
+    'i.e', 'e.g', 'vs', 'séc', 'sec', 'jan', 'fev', 'mar', 'abr', 'jun', 'jul', 'ago', 'set',
+    'out', 'nov', 'dez'
+})
+
+@dataclass
+class Chunk:
+    """Chunk do documento."""
+    index: int
+    # Posição no texto completo do documento: do início da primeira sentença ao fim da última
+    start_offset: int
+    end_offset: int
+    tokens: int
+    text: str
+
+@dataclass
+class _Unit:
+    """Sentença (ou parte de uma sentença longa) com o espaço que a separa da anterior."""
+    start: int
+    gap: str
+    text: str
+    tokens: int
+
+def _is_boundary(buffer: str, sentence_start: int, match: re.Match) -> bool:
+    """Regras do português para decidir se a pontuação encerra a sentença."""
+    if match.group('end') is None:
+        # Linha em branco: sempre encerra
+        return True
+    before = buffer[sentence_start:match.start()]
+    word_match = re.search(r'(\S+)$', before)
+    word = word_match.group(1).lstrip('(["\'“«') if word_match else ''
+    if match.group('end').startswith('.') and word:
+        if word.lower() in ABBREVIATIONS or (len(word) == 1 and word.isalpha()):
+            return False
+        # Numeração de tópico ("1. Integração", "2.3. Escopo")
+        if re.fullmatch(r'\d+(?:\.\d+)*', word) and before.strip() == word:
+            return False
+    # A sentença seguinte começa com minúscula: abreviação desconhecida ("aprox. de")
+    following = buffer[match.end():].lstrip()
+    return not (following and following[0].islower())
+
+def iter_sentences(pieces: Iterable[str]) -> Iterator[Tuple[int, str, str]]:
+    """
+    Sentenças do texto como (posição no texto completo, espaço antes da sentença, sentença).
+    Uma sentença que continua no pedaço seguinte é entregue inteira.
+    """
+    buffer, buffer_offset, scan_from = '', 0, 0
+    for piece in pieces:
+        buffer += piece
+        consumed, undecided = 0, None
+        for match in SENTENCE_BOUNDARY.finditer(buffer, scan_from):
+            if buffer[match.end():].strip() == '':
+                # Ainda não se sabe como começa a próxima sentença: espera o próximo pedaço
+                undecided = match.start()
+                break
+            if not _is_boundary(buffer, consumed, match):
+                continue
+            sentence_end = match.end('end') if match.group('end') is not None else match.start()
+            sentence = buffer[consumed:sentence_end].rstrip()
+            stripped = sentence.lstrip()
+            if stripped:
+                lead = len(sentence) - len(stripped)
+                yield buffer_offset + consumed + lead, buffer[consumed:consumed + lead], stripped
+                # Espaços no fim da sentença ficam no espaço antes da seguinte
+                consumed += len(sentence)
+        buffer_offset += consumed
+        buffer = buffer[consumed:]
+        # Reavalia o fim do buffer (pontuação cujo espaço ou sentença seguinte ainda não tinha chegado)
+        scan_from = max(0, len(buffer) - 8)
+        if undecided is not None:
+            scan_from = min(scan_from, undecided - consumed)
+
+    stripped = buffer.lstrip()
+    if stripped.strip():
+        lead = len(buffer) - len(stripped)
+        yield buffer_offset + lead, buffer[:lead], stripped.rstrip()
+
+def _iter_units(pieces: Iterable[str], max_tokens: int) -> Iterator[_Unit]:
+    """Sentenças com a contagem de tokens; as maiores que max_tokens são divididas entre palavras."""
+    for start, gap, sentence in iter_sentences(pieces):
+        tokens = estimate_tokens(sentence)
+        if tokens <= max_tokens:
+            yield _Unit(start, gap, sentence, tokens)
+            continue
+        for span_start, span_end, span_tokens in token_spans(sentence, max_tokens):
+            part = sentence[span_start:span_end]
+            stripped = part.lstrip()
+            if not stripped.strip():
+                continue
+            lead = len(part) - len(stripped)
+            yield _Unit(start + span_start + lead, gap if span_start == 0 else part[:lead],
+                        stripped.rstrip(), span_tokens)
+
+def _make_chunk(index: int, units: Iterable[_Unit]) -> Chunk:
+    units = list(units)
+    text = units[0].text + ''.join(unit.gap + unit.text for unit in units[1:])
+    return Chunk(
+        index=index,
+        start_offset=units[0].start,
+        end_offset=units[-1].start + len(units[-1].text),
+        tokens=sum(unit.tokens for unit in units),
+        text=text
+    )
+
+def iter_chunks(text: Union[str, Iterable[str]], max_tokens: int = CHUNK_MAX_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Iterator[Chunk]:
+    """
+    Chunks do texto (uma string ou os pedaços do texto em ordem, como as páginas de um PDF).
+
+    Args:
+        max_tokens: tamanho máximo de cada chunk, em tokens estimados
+        overlap_tokens: tokens do fim do chunk anterior repetidos no início do seguinte
+    """
+    pieces = [text] if isinstance(text, str) else text
+    window = deque()
+    window_tokens = 0
+    # Sentenças do chunk atual que ainda não apareceram em nenhum chunk entregue
+    fresh = 0
+    index = 0
+    for unit in _iter_units(pieces, max_tokens):
+        if fresh and window_tokens + unit.tokens > max_tokens:
+            yield _make_chunk(index, window)
+            index += 1
+            fresh = 0
+            # Mantém o fim do chunk como sobreposição, se couber junto com a nova sentença
+            while window and (window_tokens > overlap_tokens or window_tokens + unit.tokens > max_tokens):
+                window_tokens -= window.popleft().tokens
+        window.append(unit)
+        window_tokens += unit.tokens
+        fresh += 1
+    if fresh:
+        yield _make_chunk(index, window)
+
+def chunk_texts(text: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """Textos dos chunks de uma string."""
+    return [chunk.text for chunk in iter_chunks(text, max_tokens, overlap_tokens)]
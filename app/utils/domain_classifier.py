@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Classificação dos tópicos nos domínios do PMBOK cadastrados na tabela domains.
+
+Os nomes dos domínios ("Gestão do Escopo") e as variações usadas nos
+documentos ("Gerenciamento do Escopo", "Gerenciamento das Partes
+Interessadas") viram aliases sem acento e em minúsculas, compilados numa única
+expressão regular: o título de cada tópico é percorrido uma vez, qualquer que
+seja o número de domínios. O domínio gravado é sempre o nome da tabela
+domains, o mesmo usado na busca de resumos por domínio.
+
+Tópicos sem nenhum alias no título usam o nome do documento, como antes.
+Se nem o documento indicar o domínio, o tópico vai para o domínio cujo
+centróide TF-IDF (descrição do domínio mais os tópicos do documento já
+classificados nele) estiver mais próximo do texto do tópico.
+"""
+
+import os
+import re
+import logging
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+logger = logging.getLogger(__name__)
+
+# Similaridade mínima com o centróide para aceitar o domínio sugerido pelo TF-IDF
+DOMAIN_MIN_SIMILARITY = float(os.getenv('DOMAIN_MIN_SIMILARITY', '0.1'))
+
+# "Gestão do Escopo" -> cabeça, preposição e assunto
+DOMAIN_NAME_PATTERN = re.compile(r'^(?:gestao|gerenciamento)\s+(?:de|do|da|dos|das)\s+(?P<subject>.+)$')
+
+DOMAIN_HEADS = ('gestao', 'gerenciamento')
+DOMAIN_PREPOSITIONS = ('de', 'do', 'da', 'dos', 'das')
+
+# Outros nomes do assunto de um domínio nos documentos (chave: assunto sem acento)
+SUBJECT_SYNONYMS = {
+    'tempo': ('cronograma',),
+    'custo': ('custos',),
+    'stakeholders': ('partes interessadas',),
+}
+
+# Expressões que indicam o domínio por si só
+PHRASE_ALIASES = {
+    'integracao': ('metodologias de gerenciamento',),
+}
+
+# Escapes "\\u00e3" gravados como texto em resumos antigos
+UNICODE_ESCAPE_PATTERN = re.compile(r'\\u([0-9a-fA-F]{4})')
+
+def fold(text: str) -> str:
+    """Texto sem acentos, em minúsculas e com os espaços normalizados."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return re.sub(r'\s+', ' ', stripped.casefold()).strip()
+
+def domain_key(domain: Any) -> str:
+    """
+    Chave canônica de um domínio, gravada em topic_summaries.domain_keys.
+    Corrige os escapes ("\\u00e3") e o mojibake ("GestÃ£o") de resumos antigos antes de fold.
+    """
+    if isinstance(domain, dict):
+        domain = domain.get('name', '')
+    if isinstance(domain, bytes):
+        domain = domain.decode('utf-8')
+    text = UNICODE_ESCAPE_PATTERN.sub(lambda match: chr(int(match.group(1), 16)), str(domain or ''))
+    if 'Ã' in text:
+        try:
+            text = text.encode('latin-1').decode('utf-8')
+        except UnicodeError:
+            pass
+    return fold(text)
+
+def domain_keys(domains: Optional[Sequence[Any]]) -> List[str]:
+    """Chaves dos domínios de um resumo, sem repetições."""
+    keys = []
+    for domain in domains or []:
+        key = domain_key(domain)
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+def domain_aliases(name: str) -> List[str]:
+    """Aliases (já normalizados por fold) que identificam o domínio no texto."""
+    folded = fold(name)
+    aliases = {folded}
+    match = DOMAIN_NAME_PATTERN.match(folded)
+    if match:
+        subject = match.group('subject')
+        for current in (subject, *SUBJECT_SYNONYMS.get(subject, ())):
+            aliases.update(f'{head} {preposition} {current}'
+                           for head in DOMAIN_HEADS for preposition in DOMAIN_PREPOSITIONS)
+        aliases.update(PHRASE_ALIASES.get(subject, ()))
+    return sorted(aliases)
+
+class DomainClassifier:
+    """Classificador montado a partir dos domínios (nome, descrição)."""
+
+    def __init__(self, domains: Sequence[Tuple[str, Optional[str]]]):
+        self.domains = [(name, description or '') for name, description in domains]
+        self.alias_to_domain: Dict[str, str] = {}
+        for name, _ in self.domains:
+            for alias in domain_aliases(name):
+                self.alias_to_domain.setdefault(alias, name)
+        # Aliases mais longos primeiro: "gestao das partes interessadas" antes de prefixos menores
+        alternatives = sorted(self.alias_to_domain, key=len, reverse=True)
+        self.pattern = re.compile(r'\b(?:' + '|'.join(map(re.escape, alternatives)) + r')\b') if alternatives else None
+
+    def match(self, text: str) -> List[str]:
+        """Domínios citados no texto, na ordem em que aparecem."""
+        if self.pattern is None:
+            return []
+        found = []
+        for match in self.pattern.finditer(fold(text)):
+            domain = self.alias_to_domain[match.group(0)]
+            if domain not in found:
+                found.append(domain)
+        return found
+
+    def classify_document(self, blocks: Sequence[Dict[str, Any]], document_title: str) -> List[List[str]]:
+        """
+        Domínios de cada tópico do documento, numa única passada.
+
+        Args:
+            blocks: tópicos com 'title' e, opcionalmente, 'content'
+
+        Returns:
+            Lista de domínios de cada tópico, na ordem de blocks
+        """
+        document_domains = self.match(document_title)
+        results = []
+        unlabeled = []
+        for index, block in enumerate(blocks):
+            domains = self.match(block.get('title') or '')
+            if not domains and document_domains:
+                # Se não encontrou domínios específicos, usar o domínio do documento
+                domains = document_domains[:1]
+            if not domains:
+                unlabeled.append(index)
+            results.append(domains)
+
+        if unlabeled:
+            self._nearest_centroid(blocks, results, unlabeled)
+        return results
+
+    def _nearest_centroid(self, blocks: Sequence[Dict[str, Any]], results: List[List[str]], unlabeled: List[int]):
+        """Atribui aos tópicos sem domínio o domínio do centróide TF-IDF mais próximo."""
+        if not self.domains:
+            return
+        texts = [f"{block.get('title') or ''}\n{block.get('content') or ''}" for block in blocks]
+        domain_texts = [f"{name}\n{description}\n{' '.join(domain_aliases(name))}" for name, description in self.domains]
+        try:
+            matrix = TfidfVectorizer(strip_accents='unicode').fit_transform(domain_texts + texts)
+        except ValueError:
+            # Vocabulário vazio (tópicos sem texto)
+            return
+
+        domain_rows, block_rows = matrix[:len(domain_texts)], matrix[len(domain_texts):]
+        centroids = []
+        for position, (name, _) in enumerate(self.domains):
+            members = [index for index, domains in enumerate(results) if name in domains]
+            rows = [domain_rows[position]] + [block_rows[index] for index in members]
+            centroids.append(np.asarray(sum(rows[1:], rows[0]).todense()) / len(rows))
+        similarities = cosine_similarity(block_rows[unlabeled], np.vstack(centroids))
+
+        assigned = 0
+        for index, scores in zip(unlabeled, similarities):
+            best = int(scores.argmax())
+            if scores[best] >= DOMAIN_MIN_SIMILARITY:
+                results[index] = [self.domains[best][0]]
+                assigned += 1
+        logger.info(f"[DOMAIN-CLASSIFIER] {assigned} de {len(unlabeled)} tópicos sem domínio no título "
+                    f"classificados por similaridade")
+
+_classifier: Optional[DomainClassifier] = None
+_classifier_domains: Optional[List[Tuple[str, Optional[str]]]] = None
+
+def load_domain_classifier() -> DomainClassifier:
+    """
+    Classificador com os domínios da tabela domains (os padrões de
+    init_default_domains se a tabela ainda não existir ou estiver vazia).
+    É refeito só quando os domínios mudam.
+    """
+    global _classifier, _classifier_domains
+    from ..database import DEFAULT_DOMAINS
+    from ..database.db_manager import DatabaseManager
+
+    try:
+        with DatabaseManager().get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT name, description FROM domains ORDER BY id')
+            domains = [(row[0], row[1]) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.warning(f"[DOMAIN-CLASSIFIER] Erro ao ler a tabela domains: {str(e)}")
+        domains = []
+    if not domains:
+        domains = [(domain['name'], domain['description']) for domain in DEFAULT_DOMAINS]
+
+    if _classifier is None or domains != _classifier_domains:
+        _classifier = DomainClassifier(domains)
+        _classifier_domains = domains
+        logger.info(f"[DOMAIN-CLASSIFIER] {len(domains)} domínios, {len(_classifier.alias_to_domain)} aliases")
+    return _classifier
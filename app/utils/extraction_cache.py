@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cache do texto extraído dos PDFs, indexado pelo SHA-256 do conteúdo do arquivo.
+
+Extrair o texto de um PDF grande (PyPDF2/pdfplumber) leva segundos e era
+refeito a cada tópico processado. O resultado fica em EXTRACTION_CACHE_DIR:
+- <sha256>.txt.gz: texto extraído (o mesmo que extract_text_from_pdf retorna)
+- <sha256>.json: início de cada página no texto, extrator usado, tempo de
+  extração de cada página e origem
+
+O SHA-256 é calculado lendo o arquivo em blocos e guardado em index.json por
+caminho, tamanho e mtime, para que um arquivo inalterado não seja relido.
+Quando o conteúdo de um caminho muda, o hash muda junto: a entrada antiga é
+removida e o arquivo é extraído de novo.
+"""
+
+import os
+import json
+import gzip
+import time
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Diretório do cache (vazio desativa o cache)
+EXTRACTION_CACHE_DIR = os.getenv(
+    'EXTRACTION_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'instance', 'extraction_cache')
+)
+
+# Versão do formato das entradas; entradas de outra versão são extraídas de novo
+CACHE_FORMAT_VERSION = 1
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def page_piece(page_text: Optional[str]) -> str:
+    """Trecho da página no texto do documento: o texto seguido de quebra de linha, ou vazio."""
+    return page_text + "\n" if page_text else ''
+
+@dataclass
+class ExtractedText:
+    """Texto extraído de um PDF e o início (offset) de cada página nesse texto."""
+    text: str
+    page_offsets: List[int] = field(default_factory=list)
+    sha256: Optional[str] = None
+    extractor: Optional[str] = None
+    page_timings: List[float] = field(default_factory=list)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_offsets)
+
+    def page(self, index: int) -> str:
+        """Texto da página `index` (0-based); vazio se a página não tinha texto."""
+        start = self.page_offsets[index]
+        end = self.page_offsets[index + 1] if index + 1 < len(self.page_offsets) else len(self.text)
+        return self.text[start:end]
+
+    @classmethod
+    def from_pages(cls, pages: List[str], extractor: Optional[str] = None) -> 'ExtractedText':
+        """Junta as páginas como extract_text_from_pdf: páginas com texto seguidas de quebra de linha."""
+        parts, offsets, length = [], [], 0
+        for page_text in pages:
+            offsets.append(length)
+            parts.append(page_piece(page_text))
+            length += len(parts[-1])
+        return cls(text=''.join(parts), page_offsets=offsets, extractor=extractor)
+
+_index_lock = threading.Lock()
+_extract_locks: Dict[str, threading.Lock] = {}
+
+def cache_enabled() -> bool:
+    return bool(EXTRACTION_CACHE_DIR)
+
+def file_sha256(path: str) -> str:
+    """SHA-256 do conteúdo do arquivo, lido em blocos."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _index_path() -> str:
+    return os.path.join(EXTRACTION_CACHE_DIR, 'index.json')
+
+def _entry_paths(sha256: str) -> Tuple[str, str]:
+    return (os.path.join(EXTRACTION_CACHE_DIR, f'{sha256}.txt.gz'),
+            os.path.join(EXTRACTION_CACHE_DIR, f'{sha256}.json'))
+
+def _read_index() -> Dict[str, Dict]:
+    try:
+        with open(_index_path(), 'r', encoding='utf-8') as index_file:
+            return json.load(index_file)
+    except (OSError, ValueError):
+        return {}
+
+def _write_json(path: str, data):
+    """Grava em um arquivo temporário e substitui, para que leitores nunca vejam um arquivo pela metade."""
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as temp_file:
+        json.dump(data, temp_file, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def remove_entry(sha256: str):
+    """Remove a entrada do cache de um conteúdo."""
+    for path in _entry_paths(sha256):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def content_hash(path: str) -> str:
+    """
+    SHA-256 do arquivo, reaproveitando o hash guardado enquanto tamanho e mtime
+    não mudarem. Se o conteúdo do caminho mudou, remove a entrada antiga do cache.
+    """
+    if not cache_enabled():
+        return file_sha256(path)
+    key = os.path.abspath(path)
+    stat = os.stat(path)
+    with _index_lock:
+        index = _read_index()
+        known = index.get(key)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+
+        sha256 = file_sha256(path)
+        if known and known['sha256'] != sha256:
+            logger.info(f"[EXTRACTION-CACHE] Conteúdo de {path} mudou: entrada {known['sha256'][:12]} invalidada")
+            remove_entry(known['sha256'])
+        index[key] = {'sha256': sha256, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        os.makedirs(EXTRACTION_CACHE_DIR, exist_ok=True)
+        _write_json(_index_path(), index)
+        return sha256
+
+def remember_hash(path: str, sha256: str):
+    """Guarda no índice o hash já conhecido do arquivo (ex.: calculado durante o upload)."""
+    if not cache_enabled():
+        return
+    stat = os.stat(path)
+    with _index_lock:
+        index = _read_index()
+        index[os.path.abspath(path)] = {'sha256': sha256, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        os.makedirs(EXTRACTION_CACHE_DIR, exist_ok=True)
+        _write_json(_index_path(), index)
+
+def load_meta(sha256: str) -> Optional[Dict]:
+    """Metadados da entrada do cache (None se não existir ou for de outra versão)."""
+    try:
+        with open(_entry_paths(sha256)[1], 'r', encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_FORMAT_VERSION or not os.path.exists(_entry_paths(sha256)[0]):
+        return None
+    return meta
+
+def load_entry(sha256: str) -> Optional[ExtractedText]:
+    """Lê a entrada do cache (None se não existir, estiver incompleta ou for de outra versão)."""
+    text_path, meta_path = _entry_paths(sha256)
+    try:
+        meta = load_meta(sha256)
+        if meta is None:
+            return None
+        with gzip.open(text_path, 'rt', encoding='utf-8', newline='') as text_file:
+            text = text_file.read()
+    except (OSError, ValueError, EOFError):
+        return None
+    if len(text) != meta.get('length'):
+        return None
+    return ExtractedText(text=text, page_offsets=meta['page_offsets'], sha256=sha256,
+                         extractor=meta.get('extractor'), page_timings=meta.get('page_timings', []))
+
+def save_entry(sha256: str, extracted: ExtractedText, source: Optional[str] = None):
+    """Grava o texto comprimido e depois os metadados (a entrada só vale com os dois)."""
+    text_path, meta_path = _entry_paths(sha256)
+    temp_path = f'{text_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with gzip.open(temp_path, 'wt', encoding='utf-8', newline='', compresslevel=6) as text_file:
+        text_file.write(extracted.text)
+    os.replace(temp_path, text_path)
+    _write_json(meta_path, {
+        'version': CACHE_FORMAT_VERSION,
+        'length': len(extracted.text),
+        'page_offsets': extracted.page_offsets,
+        'extractor': extracted.extractor,
+        'page_timings': extracted.page_timings,
+        'source': source,
+        'created_at': time.time()
+    })
+
+def iter_entry_pages(sha256: str, meta: Dict) -> Iterator[Tuple[int, str]]:
+    """Lê as páginas da entrada do cache uma a uma, sem descomprimir o texto inteiro."""
+    offsets = meta['page_offsets'] + [meta['length']]
+    with gzip.open(_entry_paths(sha256)[0], 'rt', encoding='utf-8', newline='') as text_file:
+        for index in range(len(offsets) - 1):
+            yield index + 1, text_file.read(offsets[index + 1] - offsets[index])
+
+class EntryWriter:
+    """
+    Grava uma entrada do cache página a página. A entrada só passa a valer em
+    commit(); abort() descarta o que foi escrito (extração interrompida).
+    """
+
+    def __init__(self, sha256: str, source: Optional[str] = None):
+        self.sha256 = sha256
+        self.source = source
+        self.text_path = _entry_paths(sha256)[0]
+        self.temp_path = f'{self.text_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self.text_file = gzip.open(self.temp_path, 'wt', encoding='utf-8', newline='', compresslevel=6)
+        self.page_offsets: List[int] = []
+        self.page_timings: List[float] = []
+        self.extractors = set()
+        self.length = 0
+
+    def add_page(self, page_text: Optional[str], seconds: float = 0.0, extractor: Optional[str] = None) -> str:
+        """Acrescenta a página e retorna o trecho dela no texto do documento."""
+        piece = page_piece(page_text)
+        self.page_offsets.append(self.length)
+        self.page_timings.append(round(seconds, 4))
+        if extractor:
+            self.extractors.add(extractor)
+        self.text_file.write(piece)
+        self.length += len(piece)
+        return piece
+
+    def commit(self):
+        self.text_file.close()
+        os.replace(self.temp_path, self.text_path)
+        _write_json(_entry_paths(self.sha256)[1], {
+            'version': CACHE_FORMAT_VERSION,
+            'length': self.length,
+            'page_offsets': self.page_offsets,
+            'extractor': 'PyPDF2+pdfplumber' if 'pdfplumber' in self.extractors else 'PyPDF2',
+            'page_timings': self.page_timings,
+            'source': self.source,
+            'created_at': time.time()
+        })
+
+    def abort(self):
+        self.text_file.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+def cached_pages(path: str, iter_extract: Callable[[str], Iterable[Tuple[str, float, str]]]
+                 ) -> Iterator[Tuple[int, str]]:
+    """
+    Páginas do PDF como (número a partir de 1, trecho da página no texto do
+    documento), lidas do cache ou extraídas sob demanda.
+
+    Na extração, cada página é entregue assim que fica pronta e gravada no
+    cache ao mesmo tempo; a entrada só vale se todas as páginas forem extraídas.
+
+    Args:
+        iter_extract: Gera (texto, segundos, extrator) de cada página, em ordem
+    """
+    if not cache_enabled():
+        for page_no, (page_text, _, _) in enumerate(iter_extract(path), 1):
+            yield page_no, page_piece(page_text)
+        return
+
+    os.makedirs(EXTRACTION_CACHE_DIR, exist_ok=True)
+    sha256 = content_hash(path)
+    meta = load_meta(sha256)
+    if meta is not None:
+        logger.info(f"[EXTRACTION-CACHE] Páginas de {path} lidas do cache ({sha256[:12]})")
+        yield from iter_entry_pages(sha256, meta)
+        return
+
+    writer = EntryWriter(sha256, source=os.path.basename(path))
+    completed = False
+    try:
+        for page_no, (page_text, seconds, extractor) in enumerate(iter_extract(path), 1):
+            yield page_no, writer.add_page(page_text, seconds, extractor)
+        completed = True
+    finally:
+        if completed:
+            writer.commit()
+            logger.info(f"[EXTRACTION-CACHE] {path} guardado no cache ({sha256[:12]})")
+        else:
+            writer.abort()
+
+def cached_extraction(path: str, extract: Callable[[str], ExtractedText]) -> ExtractedText:
+    """
+    Texto extraído do PDF, do cache quando o mesmo conteúdo já foi extraído.
+
+    Args:
+        extract: Função que extrai o texto do arquivo (chamada só em cache miss)
+    """
+    if not cache_enabled():
+        return extract(path)
+
+    try:
+        os.makedirs(EXTRACTION_CACHE_DIR, exist_ok=True)
+        sha256 = content_hash(path)
+    except OSError as e:
+        logger.error(f"[EXTRACTION-CACHE] Cache indisponível, extraindo sem cache: {str(e)}")
+        return extract(path)
+
+    # Requisições simultâneas do mesmo arquivo esperam uma única extração
+    with _index_lock:
+        lock = _extract_locks.setdefault(sha256, threading.Lock())
+    with lock:
+        extracted = load_entry(sha256)
+        if extracted is not None:
+            logger.info(f"[EXTRACTION-CACHE] Texto de {path} lido do cache ({sha256[:12]})")
+            return extracted
+
+        start = time.monotonic()
+        extracted = extract(path)
+        extracted.sha256 = sha256
+        try:
+            save_entry(sha256, extracted, source=os.path.basename(path))
+        except OSError as e:
+            logger.error(f"[EXTRACTION-CACHE] Erro ao gravar o cache de {path}: {str(e)}")
+        logger.info(f"[EXTRACTION-CACHE] {path} extraído em {time.monotonic() - start:.1f}s "
+                    f"({extracted.page_count} páginas) e guardado no cache ({sha256[:12]})")
+        return extracted
@@ -1,13 +1,33 @@
-import json
+import time
 import traceback
 import os
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
 import PyPDF2
 import pdfplumber
-import openai
+from ..api import metrics
+from ..api.circuit_breaker import CircuitOpenError
+from ..api.json_parser import JSONParseError, parse_json_response
+from ..api.token_budget import INSTRUCTION_RESERVE_TOKENS, input_budget, truncate_to_tokens
+from .extraction_cache import ExtractedText, cached_extraction, cached_pages
 
 logger = logging.getLogger(__name__)
 
+# Processos usados na extração de PDFs grandes (1 extrai no próprio processo)
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', str(os.cpu_count() or 1)))
+
+# Mínimo de páginas por tarefa do pool; PDFs menores são extraídos sem processos extras
+PDF_EXTRACT_MIN_PAGES_PER_TASK = int(os.getenv('PDF_EXTRACT_MIN_PAGES_PER_TASK', '8'))
+
+# Versão do prompt de resumo; resumos gerados com outra versão são refeitos por summarize_document
+SUMMARY_PROMPT_VERSION = 1
+
+def summary_model():
+    """Modelo usado na geração dos resumos de tópicos."""
+    return os.getenv('SUMMARY_MODEL_ID', 'gpt-3.5-turbo')
+
 def generate_topic_summary(topic, text):
     """
     Gera um resumo estruturado para um tópico específico usando a API do OpenAI.
@@ -17,13 +37,24 @@ def generate_topic_summary(topic, text):
     logger.info(f"[GENERATE-SUMMARY] Tamanho do texto: {len(text)} caracteres")
     
     try:
+        # Importado aqui para não carregar o cliente OpenAI na extração de PDFs
+        from ..api.openai_client import create_chat_completion, get_openai_client
+        
+        model = summary_model()
+        
+        # Limitar o texto ao orçamento de entrada da etapa (desconta a reserva das instruções)
+        fitted_text = truncate_to_tokens(text, input_budget('summary', model) - INSTRUCTION_RESERVE_TOKENS)
+        if len(fitted_text) < len(text):
+            logger.warning(f"[GENERATE-SUMMARY] Texto truncado para o orçamento de tokens: "
+                           f"{len(text)} -> {len(fitted_text)} caracteres")
+        
         # Preparar o prompt para a API
         prompt = f"""
         Analise o seguinte tópico e texto relacionado ao PMBOK e gere um resumo estruturado.
         
         Tópico: {topic}
         
-        Texto: {text}
+        Texto: {fitted_text}
         
         Gere um resumo que inclua:
         1. Um resumo conciso e informativo
@@ -43,38 +74,41 @@ def generate_topic_summary(topic, text):
         """
         
         logger.info("[GENERATE-SUMMARY] Enviando requisição para a API do OpenAI")
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
+        # openai.ChatCompletion não existe mais na biblioteca 1.x; usa o cliente configurado
+        response = create_chat_completion(
+            get_openai_client(),
+            'summary',
+            model=model,
             messages=[
                 {"role": "system", "content": "Você é um especialista em gerenciamento de projetos e PMBOK."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=1000,
             temperature=0.7
         )
         
         logger.info("[GENERATE-SUMMARY] Resposta recebida da API")
         
-        # Extrair e validar a resposta
+        # Extrair, reparar e validar (campos obrigatórios) o JSON da resposta
+        content = response.choices[0].message.content or ''
         try:
-            summary_data = json.loads(response.choices[0].message.content)
-            
-            # Validar campos obrigatórios
-            required_fields = ['summary', 'key_points', 'practical_examples', 'pmbok_references', 'domains']
-            missing_fields = [field for field in required_fields if field not in summary_data]
-            
-            if missing_fields:
-                logger.error(f"[GENERATE-SUMMARY] Campos obrigatórios ausentes: {missing_fields}")
-                raise ValueError(f"Campos obrigatórios ausentes: {missing_fields}")
-                
-            logger.info("[GENERATE-SUMMARY] Resumo gerado com sucesso")
-            return summary_data
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"[GENERATE-SUMMARY] Erro ao decodificar JSON: {str(e)}")
-            logger.error(f"[GENERATE-SUMMARY] Resposta bruta: {response.choices[0].message.content}")
+            summary_data = parse_json_response(content, stage='summary')
+        except JSONParseError as e:
+            if e.errors:
+                logger.error(f"[GENERATE-SUMMARY] Resposta fora do formato esperado: {e.errors}")
+                metrics.record_result('summary', model, metrics.RESULT_VALIDATION_ERROR)
+            else:
+                logger.error(f"[GENERATE-SUMMARY] Erro ao decodificar JSON: {str(e)}")
+                logger.error(f"[GENERATE-SUMMARY] Resposta bruta: {content}")
+                metrics.record_result('summary', model, metrics.RESULT_PARSE_ERROR)
             raise ValueError(f"Erro ao decodificar resposta da API: {str(e)}")
             
+        metrics.record_result('summary', model, metrics.RESULT_VALID)
+        logger.info("[GENERATE-SUMMARY] Resumo gerado com sucesso")
+        return summary_data
+            
+    except CircuitOpenError:
+        # Modelo indisponível: quem chamou decide se enfileira o resumo
+        raise
     except Exception as e:
         logger.error(f"[GENERATE-SUMMARY] Erro ao gerar resumo: {str(e)}")
         logger.error(f"[GENERATE-SUMMARY] Tipo do erro: {type(e)}")
@@ -84,7 +118,28 @@ def generate_topic_summary(topic, text):
 def extract_text_from_pdf(pdf_path):
     """
     Extrai texto de um arquivo PDF usando PyPDF2 ou pdfplumber como fallback.
+    O resultado fica no cache de extração (ver extraction_cache.py).
     """
+    return extract_pdf_document(pdf_path).text
+
+def extract_pdf_document(pdf_path) -> ExtractedText:
+    """Texto do PDF com o início de cada página, do cache quando o conteúdo já foi extraído."""
+    _check_pdf_path(pdf_path)
+    return cached_extraction(pdf_path, _extract_pages)
+
+def iter_pdf_pages(pdf_path) -> Iterator[Tuple[int, str]]:
+    """
+    Páginas do PDF como (número da página a partir de 1, texto), à medida que são
+    extraídas. Juntos, os textos formam o mesmo texto de extract_text_from_pdf.
+
+    Não guarda o documento inteiro em memória: quem consome (ex.: o segmentador
+    de tópicos) pode processar as primeiras páginas enquanto as seguintes ainda
+    estão sendo extraídas. O cache de extração é usado e preenchido da mesma forma.
+    """
+    _check_pdf_path(pdf_path)
+    return cached_pages(pdf_path, _iter_page_results)
+
+def _check_pdf_path(pdf_path):
     logger.info(f"[EXTRACT-TEXT] Iniciando extração de texto do PDF: {pdf_path}")
     
     if not os.path.exists(pdf_path):
@@ -94,49 +149,138 @@ def extract_text_from_pdf(pdf_path):
     if not pdf_path.lower().endswith('.pdf'):
         logger.error(f"[EXTRACT-TEXT] Arquivo não é um PDF: {pdf_path}")
         raise ValueError(f"Arquivo não é um PDF: {pdf_path}")
-        
-    # Primeira tentativa: PyPDF2
+
+def _extract_range(pdf_path, start, end) -> List[Tuple[str, float, str]]:
+    """
+    Extrai as páginas [start, end) (ver _iter_range).
+
+    Executada nos processos do pool (por isso é uma função de módulo).
+    """
+    return list(_iter_range(pdf_path, start, end))
+
+def _iter_range(pdf_path, start, end) -> Iterator[Tuple[str, float, str]]:
+    """
+    Extrai as páginas [start, end) com PyPDF2, usando o pdfplumber apenas nas
+    páginas em que o PyPDF2 falha ou não encontra texto.
+
+    Gera (texto, segundos, extrator) de cada página.
+    """
+    try:
+        file = open(pdf_path, 'rb')
+        reader_pages = PyPDF2.PdfReader(file).pages
+    except Exception as e:
+        logger.error(f"[EXTRACT-TEXT] PyPDF2 não conseguiu abrir {pdf_path}: {str(e)}")
+        file, reader_pages = None, None
+
+    plumber = None
+    try:
+        for index in range(start, end):
+            page_start = time.perf_counter()
+            page_text, extractor = '', 'PyPDF2'
+            if reader_pages is not None:
+                try:
+                    page_text = reader_pages[index].extract_text() or ''
+                except Exception as e:
+                    logger.warning(f"[EXTRACT-TEXT] PyPDF2 falhou na página {index + 1}: {str(e)}")
+            if not page_text.strip():
+                # Fallback por página: o restante do documento continua com o PyPDF2
+                try:
+                    plumber = plumber or pdfplumber.open(pdf_path)
+                    page_text, extractor = plumber.pages[index].extract_text() or '', 'pdfplumber'
+                except Exception as e:
+                    logger.warning(f"[EXTRACT-TEXT] pdfplumber falhou na página {index + 1}: {str(e)}")
+            yield page_text, time.perf_counter() - page_start, extractor
+    finally:
+        if plumber is not None:
+            plumber.close()
+        if file is not None:
+            file.close()
+
+def _page_count(pdf_path) -> int:
     try:
-        logger.info("[EXTRACT-TEXT] Tentando extrair texto com PyPDF2")
-        text = ""
         with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-                    
-        if not text.strip():
-            logger.warning("[EXTRACT-TEXT] PyPDF2 não conseguiu extrair texto")
-            raise ValueError("PyPDF2 não conseguiu extrair texto")
-            
-        logger.info(f"[EXTRACT-TEXT] PyPDF2 extraiu {len(text)} caracteres")
-        return text
+            return len(PyPDF2.PdfReader(file).pages)
+    except Exception as e:
+        logger.warning(f"[EXTRACT-TEXT] PyPDF2 não conseguiu contar as páginas: {str(e)}")
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+
+def _page_ranges(page_count, workers) -> List[Tuple[int, int]]:
+    """Divide as páginas em faixas contíguas, algumas por processo para equilibrar páginas lentas."""
+    size = max(PDF_EXTRACT_MIN_PAGES_PER_TASK, -(-page_count // (workers * 4)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+def _iter_pooled_ranges(executor, pdf_path, ranges, window) -> Iterator[Tuple[str, float, str]]:
+    """
+    Páginas das faixas extraídas no pool, em ordem. No máximo `window` faixas
+    ficam em andamento ou prontas sem consumo, limitando a memória usada.
+    """
+    pending = deque()
+    for range_start, range_end in ranges:
+        pending.append(executor.submit(_extract_range, pdf_path, range_start, range_end))
+        if len(pending) >= window:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+def _iter_page_results(pdf_path) -> Iterator[Tuple[str, float, str]]:
+    """
+    Extrai o texto página a página, dividindo as páginas entre PDF_EXTRACT_WORKERS
+    processos. Cada página usa o PyPDF2 e, se ele falhar, o pdfplumber.
+
+    Gera (texto, segundos, extrator) de cada página em ordem, assim que a faixa
+    da página fica pronta.
+    """
+    executor = None
+    try:
+        start = time.perf_counter()
+        page_count = _page_count(pdf_path)
+        workers = min(PDF_EXTRACT_WORKERS, -(-page_count // PDF_EXTRACT_MIN_PAGES_PER_TASK))
+        ranges = _page_ranges(page_count, max(workers, 1))
+        
+        if workers <= 1 or len(ranges) <= 1:
+            page_results = _iter_range(pdf_path, 0, page_count)
+        else:
+            logger.info(f"[EXTRACT-TEXT] Extraindo {page_count} páginas com {workers} processos "
+                        f"({len(ranges)} faixas)")
+            executor = ProcessPoolExecutor(max_workers=workers)
+            page_results = _iter_pooled_ranges(executor, pdf_path, ranges, workers * 2)
+        
+        length, has_text, timings, fallback_pages = 0, False, [], []
+        for page_text, seconds, extractor in page_results:
+            timings.append(seconds)
+            length += len(page_text) + 1 if page_text else 0
+            has_text = has_text or bool(page_text.strip())
+            if extractor == 'pdfplumber':
+                fallback_pages.append(len(timings))
+            yield page_text, seconds, extractor
+        
+        if not has_text:
+            logger.error("[EXTRACT-TEXT] Nenhuma página com texto (PyPDF2 e pdfplumber)")
+            raise ValueError("PyPDF2 e pdfplumber não conseguiram extrair texto")
+        
+        slowest = max(range(len(timings)), key=timings.__getitem__)
+        logger.info(f"[EXTRACT-TEXT] {length} caracteres de {page_count} páginas em "
+                    f"{time.perf_counter() - start:.2f}s (soma das páginas {sum(timings):.2f}s, "
+                    f"mais lenta: página {slowest + 1} com {timings[slowest]:.2f}s)")
+        if fallback_pages:
+            logger.info(f"[EXTRACT-TEXT] pdfplumber usado em {len(fallback_pages)} páginas: {fallback_pages[:20]}")
         
     except Exception as e:
-        logger.error(f"[EXTRACT-TEXT] Erro ao extrair texto com PyPDF2: {str(e)}")
+        logger.error(f"[EXTRACT-TEXT] Erro ao extrair texto do PDF: {str(e)}")
         logger.error(f"[EXTRACT-TEXT] Tipo do erro: {type(e)}")
         logger.error(f"[EXTRACT-TEXT] Stack trace: {traceback.format_exc()}")
-        
-        # Segunda tentativa: pdfplumber
-        try:
-            logger.info("[EXTRACT-TEXT] Tentando extrair texto com pdfplumber")
-            text = ""
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                        
-            if not text.strip():
-                logger.error("[EXTRACT-TEXT] pdfplumber não conseguiu extrair texto")
-                raise ValueError("pdfplumber não conseguiu extrair texto")
-                
-            logger.info(f"[EXTRACT-TEXT] pdfplumber extraiu {len(text)} caracteres")
-            return text
-            
-        except Exception as e:
-            logger.error(f"[EXTRACT-TEXT] Erro ao extrair texto com pdfplumber: {str(e)}")
-            logger.error(f"[EXTRACT-TEXT] Tipo do erro: {type(e)}")
-            logger.error(f"[EXTRACT-TEXT] Stack trace: {traceback.format_exc()}")
-            raise ValueError(f"Falha ao extrair texto do PDF: {str(e)}") 
\ No newline at end of file
+        raise ValueError(f"Falha ao extrair texto do PDF: {str(e)}")
+    finally:
+        if executor is not None:
+            # Consumidor parou antes do fim: as faixas que não começaram são canceladas
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def _extract_pages(pdf_path) -> ExtractedText:
+    """Extrai o documento inteiro (ver _iter_page_results)."""
+    pages = list(_iter_page_results(pdf_path))
+    extracted = ExtractedText.from_pages([page[0] for page in pages], 'PyPDF2')
+    extracted.page_timings = [round(page[1], 4) for page in pages]
+    if any(page[2] == 'pdfplumber' for page in pages):
+        extracted.extractor = 'PyPDF2+pdfplumber'
+    return extracted
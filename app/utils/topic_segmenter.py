@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Segmentação em tópicos do texto de um PDF, em streaming.
+
+O segmentador recebe as páginas como (número da página, texto), como em
+pdf_utils.iter_pdf_pages, e entrega cada tópico assim que o título do tópico
+seguinte aparece. Só o tópico atual fica em memória, e quem consome pode
+tratar os primeiros tópicos (ex.: enfileirar resumos) enquanto as páginas
+seguintes ainda estão sendo extraídas.
+
+Um único padrão reconhece os títulos dos dois formatos de documento usados:
+"1." / "1)" e "1-" / "1.2-" / "1.2.3-". Os itens com o mesmo número principal
+seguidos ("1-", "1.1-", "1.2-") formam um só tópico. O texto antes do primeiro
+título é ignorado, e um título sem texto na própria linha usa a próxima linha
+não vazia como título.
+
+Cada tópico traz a posição (offsets) no texto completo do documento, o mesmo
+de extract_text_from_pdf, que é guardada em topic_boundaries (ver
+api/topic_boundaries.py) para enviar ao modelo só o trecho do tópico.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+
+# Versão das regras de segmentação; fronteiras guardadas com outra versão são recalculadas
+SEGMENTER_VERSION = 1
+
+# Título de tópico: "1. Título", "2) Título", "1- Título", "1.2.3- Título".
+# "3.1 Texto" (sem hífen) não é título: número decimal ou subitem sem marcador
+TOPIC_HEADING_PATTERN = re.compile(r'^\s*(?P<label>(?P<number>\d+)(?:(?:\.\d+)*-|[\.\)](?!\d)))\s*(?P<title>.*)$')
+
+@dataclass
+class TopicBlock:
+    """Tópico encontrado no documento."""
+    # Número principal do tópico ("1") e o marcador como aparece no documento ("1.", "1)", "1-")
+    number: str
+    label: str
+    title: str
+    # Texto após a linha do título, até o próximo tópico
+    content: str
+    start_page: int
+    end_page: int
+    # Posição do tópico no texto completo do documento: do início da linha do
+    # título até o início do tópico seguinte (ou o fim do texto)
+    start_offset: int
+    end_offset: int
+
+def iter_lines(pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, int, str]]:
+    """
+    Linhas do documento como (página, posição no texto completo, linha sem a quebra).
+    Uma linha que continua na página seguinte é entregue inteira, com a página em que começa.
+    """
+    pending, pending_page, line_start = '', None, 0
+    for page_no, page_text in pages:
+        position = 0
+        while True:
+            newline = page_text.find('\n', position)
+            if newline < 0:
+                break
+            line = pending + page_text[position:newline]
+            yield (pending_page if pending else page_no), line_start, line
+            line_start += len(line) + 1
+            pending = ''
+            position = newline + 1
+        if position < len(page_text):
+            if not pending:
+                pending_page = page_no
+            pending += page_text[position:]
+    if pending:
+        yield pending_page, line_start, pending
+
+def segment_topics(pages: Iterable[Tuple[int, str]]) -> Iterator[TopicBlock]:
+    """Tópicos do documento, entregues à medida que as páginas são lidas."""
+    current: Optional[dict] = None
+    awaiting_title = False
+    end_offset = 0
+
+    for page_no, offset, line in iter_lines(pages):
+        end_offset = offset + len(line) + 1
+        if awaiting_title:
+            if line.strip():
+                current['title'] = line.strip()
+                current['end_page'] = page_no
+                awaiting_title = False
+            continue
+
+        match = TOPIC_HEADING_PATTERN.match(line)
+        if match and (current is None or match.group('number') != current['number']):
+            if current is not None:
+                yield _topic_block(current, offset)
+            title = match.group('title').strip()
+            current = {'number': match.group('number'), 'label': match.group('label'), 'title': title,
+                       'lines': [], 'start_page': page_no, 'end_page': page_no, 'start_offset': offset}
+            awaiting_title = not title
+        elif current is not None:
+            # Inclui os subitens do mesmo tópico ("1.1-", "1.2-")
+            current['lines'].append(line)
+            current['end_page'] = page_no
+
+    if current is not None:
+        yield _topic_block(current, end_offset)
+
+def _topic_block(current: dict, end_offset: int) -> TopicBlock:
+    return TopicBlock(
+        number=current['number'],
+        label=current['label'],
+        title=current['title'],
+        content='\n'.join(current['lines']).strip(),
+        start_page=current['start_page'],
+        end_page=current['end_page'],
+        start_offset=current['start_offset'],
+        end_offset=end_offset
+    )
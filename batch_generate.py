@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Enfileira a geração de questões em lote (Batch API) para um ou mais domínios.
+Os jobs são executados por `python worker.py`.
+
+Uso:
+    python batch_generate.py --domain "Gerenciamento de Riscos" --num 2000
+    python batch_generate.py --all --num 1000
+"""
+
+import sys
+import argparse
+from app.utils.logging_config import setup_logging
+
+# Configurar logging
+logger = setup_logging()
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Geração de questões em lote pelo Batch API')
+    parser.add_argument('--domain', action='append', default=[], help='Domínio (pode ser repetido)')
+    parser.add_argument('--all', action='store_true', help='Todos os domínios com resumos')
+    parser.add_argument('--num', type=int, default=1000, help='Questões por domínio')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.api.batch_generation import enqueue_batch_generation
+    from app.api.question_service import find_summary_ids_for_domain
+
+    app = create_app()
+    with app.app_context():
+        domains = list(args.domain)
+        if args.all:
+            from app.database.db_manager import DatabaseManager
+            with DatabaseManager().get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT name FROM domains ORDER BY name')
+                domains += [row[0] for row in cursor.fetchall() if find_summary_ids_for_domain(row[0])]
+
+        if not domains:
+            parser.error('Informe --domain ou --all')
+
+        for domain in domains:
+            job_id = enqueue_batch_generation(domain, args.num)
+            print(f"{domain}: job {job_id}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
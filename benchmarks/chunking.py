@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compara as estratégias de divisão do texto dos PDFs em chunks.
+
+- 'palavras': palavras agrupadas por número de caracteres (o antigo
+  split_text_into_chunks, 1000 caracteres);
+- 'paragrafos': um chunk por parágrafo (linha em branco), como a tela
+  TextProcessorScreen do app Kivy;
+- 'sentencas': utils/chunking.py (tokens, sentenças e sobreposição).
+
+Para cada PDF mede o número de chunks, os tokens por chunk e a qualidade da
+recuperação: o título de cada tópico (ver topic_segmenter) é usado como
+consulta TF-IDF e um chunk é relevante se pelo menos metade dele estiver
+dentro do trecho do tópico. São reportados recall@k, MRR e os tokens dos k
+chunks que seriam enviados no prompt.
+
+Uso:
+    python benchmarks/chunking.py data/uploads/resumos/*.pdf
+    python benchmarks/chunking.py arquivo.pdf --max-tokens 200 --overlap 30 --k 3 --json resultado.json
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.token_budget import estimate_tokens
+from app.utils.chunking import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, iter_chunks
+from app.utils.pdf_utils import extract_pdf_document, iter_pdf_pages
+from app.utils.topic_segmenter import segment_topics
+
+STRATEGIES = ('palavras', 'paragrafos', 'sentencas')
+
+def word_chunks(text, chunk_size=1000):
+    """Antigo split_text_into_chunks, com a posição de cada chunk: (início, fim)"""
+    spans = []
+    start = end = size = None
+    for match in re.finditer(r'\S+', text):
+        length = len(match.group(0))
+        if start is not None and size + length > chunk_size:
+            spans.append((start, end))
+            start = None
+        if start is None:
+            start, size = match.start(), length
+        else:
+            size += length + 1
+        end = match.end()
+    if start is not None:
+        spans.append((start, end))
+    return spans
+
+def paragraph_chunks(text):
+    """Um chunk por parágrafo (separados por linha em branco)"""
+    spans = []
+    position = 0
+    for part in re.split(r'(\n\s*\n)', text):
+        stripped = part.strip()
+        if stripped and not re.fullmatch(r'\n\s*\n', part):
+            start = position + part.index(stripped)
+            spans.append((start, start + len(stripped)))
+        position += len(part)
+    return spans
+
+def sentence_chunks(path, max_tokens, overlap_tokens):
+    pages = (page_text for _, page_text in iter_pdf_pages(path))
+    return [(chunk.start_offset, chunk.end_offset) for chunk in iter_chunks(pages, max_tokens, overlap_tokens)]
+
+def evaluate(text, spans, topics, k):
+    """Recall@k, MRR e tokens enviados, usando os títulos dos tópicos como consultas"""
+    chunks = [text[start:end] for start, end in spans]
+    tokens = [estimate_tokens(chunk) for chunk in chunks]
+    result = {
+        'chunks': len(chunks),
+        'avg_tokens': sum(tokens) / len(tokens) if tokens else 0,
+        'max_tokens': max(tokens) if tokens else 0,
+        'queries': 0,
+        'recall_at_k': 0.0,
+        'mrr': 0.0,
+        'avg_prompt_tokens': 0.0
+    }
+    queries = [topic for topic in topics if len(topic.title.strip()) > 2]
+    if not chunks or not queries:
+        return result
+
+    vectorizer = TfidfVectorizer(strip_accents='unicode', ngram_range=(1, 2))
+    matrix = vectorizer.fit_transform(chunks)
+    similarities = cosine_similarity(vectorizer.transform([topic.title for topic in queries]), matrix)
+
+    hits = reciprocal = sent = 0.0
+    for topic, scores in zip(queries, similarities):
+        ranked = np.argsort(scores)[::-1]
+        relevant = {index for index, (start, end) in enumerate(spans)
+                    if min(end, topic.end_offset) - max(start, topic.start_offset) >= (end - start) / 2}
+        rank = next((position for position, index in enumerate(ranked[:10]) if index in relevant), None)
+        if rank is not None:
+            reciprocal += 1 / (rank + 1)
+            if rank < k:
+                hits += 1
+        sent += sum(tokens[index] for index in ranked[:k])
+
+    result.update(
+        queries=len(queries),
+        recall_at_k=hits / len(queries),
+        mrr=reciprocal / len(queries),
+        avg_prompt_tokens=sent / len(queries)
+    )
+    return result
+
+def benchmark(paths, max_tokens, overlap_tokens, k):
+    results = {}
+    for path in paths:
+        text = extract_pdf_document(path).text
+        topics = list(segment_topics(iter_pdf_pages(path)))
+        results[path] = {}
+        for strategy in STRATEGIES:
+            start = time.perf_counter()
+            if strategy == 'palavras':
+                spans = word_chunks(text)
+            elif strategy == 'paragrafos':
+                spans = paragraph_chunks(text)
+            else:
+                spans = sentence_chunks(path, max_tokens, overlap_tokens)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            results[path][strategy] = dict(evaluate(text, spans, topics, k), chunking_ms=elapsed_ms)
+    return results
+
+def print_report(results, k):
+    """Exibe a comparação entre as estratégias"""
+    for path, strategies in results.items():
+        print(os.path.basename(path))
+        print(f"  {'estratégia':<11} {'chunks':>7} {'tokens/chunk':>13} {'máx':>6} {'recall@' + str(k):>9} "
+              f"{'MRR':>6} {'tokens/prompt':>14} {'tempo (ms)':>11}")
+        for strategy, result in strategies.items():
+            print(f"  {strategy:<11} {result['chunks']:>7} {result['avg_tokens']:>13.0f} {result['max_tokens']:>6} "
+                  f"{result['recall_at_k']:>9.0%} {result['mrr']:>6.2f} {result['avg_prompt_tokens']:>14.0f} "
+                  f"{result['chunking_ms']:>11.0f}")
+        print(f"  ({strategies['sentencas']['queries']} consultas)")
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Benchmark das estratégias de divisão em chunks')
+    parser.add_argument('pdfs', nargs='*', help='PDFs avaliados (padrão: data/uploads/resumos/*.pdf)')
+    parser.add_argument('--max-tokens', type=int, default=CHUNK_MAX_TOKENS)
+    parser.add_argument('--overlap', type=int, default=CHUNK_OVERLAP_TOKENS)
+    parser.add_argument('--k', type=int, default=3, help='Chunks enviados por prompt')
+    parser.add_argument('--json', dest='json_path', help='Salva o resultado em JSON')
+    args = parser.parse_args()
+
+    # Os módulos da aplicação configuram o logging em INFO; aqui só interessam avisos
+    logging.getLogger().setLevel(logging.WARNING)
+
+    paths = args.pdfs or sorted(glob.glob(os.path.join('data', 'uploads', 'resumos', '*.pdf')))
+    if not paths:
+        print("Nenhum PDF encontrado")
+        return 1
+
+    results = benchmark(paths, args.max_tokens, args.overlap, args.k)
+    print_report(results, args.k)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compara as engines de geração de questões ('pipeline' x 'fused').
+
+Por padrão reproduz respostas gravadas em fixtures/generation_responses.json,
+sem chamar a API, e mede por questão: latência (soma das latências gravadas
+das chamadas + processamento local), tokens e taxa de aprovação nos
+validadores (validate_answer, validate_distractors).
+
+Uso:
+    python benchmarks/generation_engines.py
+    python benchmarks/generation_engines.py --json resultado.json
+    python benchmarks/generation_engines.py --record   # regrava as respostas usando a API
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.openai_client import (
+    generate_question,
+    generate_answer_with_ai,
+    generate_distractors,
+    generate_fused_question,
+    get_openai_client
+)
+from app.api.prompt_context import as_prompt_context
+
+logger = logging.getLogger(__name__)
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'generation_responses.json')
+
+ENGINES = ('pipeline', 'fused')
+
+def estimate_tokens(text):
+    """Estimativa simples de tokens (~4 caracteres por token)"""
+    return max(1, len(text) // 4) if text else 0
+
+class ReplayCompletions:
+    """Substitui client.chat.completions devolvendo as respostas gravadas, em ordem"""
+
+    def __init__(self, responses, stats):
+        self.responses = list(responses)
+        self.stats = stats
+
+    def create(self, **kwargs):
+        if not self.responses:
+            raise RuntimeError("Nenhuma resposta gravada restante para esta chamada")
+        recorded = self.responses.pop(0)
+        content = recorded['content']
+        usage = recorded.get('usage') or {}
+        prompt_tokens = usage.get('prompt_tokens') or sum(
+            estimate_tokens(message['content']) for message in kwargs.get('messages', []))
+        completion_tokens = usage.get('completion_tokens') or estimate_tokens(content)
+
+        self.stats['calls'] += 1
+        self.stats['api_latency_ms'] += recorded.get('latency_ms', 0)
+        self.stats['prompt_tokens'] += prompt_tokens
+        self.stats['completion_tokens'] += completion_tokens
+
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens)
+        )
+
+class RecordingCompletions:
+    """Encaminha as chamadas para o cliente real e grava conteúdo, latência e uso"""
+
+    def __init__(self, client, recorded):
+        self.client = client
+        self.recorded = recorded
+
+    def create(self, **kwargs):
+        start = time.perf_counter()
+        response = self.client.chat.completions.create(**kwargs)
+        latency_ms = int((time.perf_counter() - start) * 1000)
+        entry = {'content': response.choices[0].message.content, 'latency_ms': latency_ms}
+        if getattr(response, 'usage', None):
+            entry['usage'] = {
+                'prompt_tokens': response.usage.prompt_tokens,
+                'completion_tokens': response.usage.completion_tokens
+            }
+        self.recorded.append(entry)
+        return response
+
+def wrap_client(completions):
+    """Cria um objeto com a mesma interface usada do cliente OpenAI (client.chat.completions.create)"""
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+def run_engine(engine, case, client, model):
+    """Gera uma questão com a engine informada. Retorna True se passou nos validadores."""
+    topic = case['topic']
+    # Mesmo contexto compartilhado por todas as etapas, como em iter_generate_questions
+    summary = as_prompt_context(case['summary'])
+
+    if engine == 'fused':
+        return generate_fused_question(topic=topic, summary=summary, client=client, model=model) is not None
+
+    try:
+        question_data = generate_question(topic=topic, summary=summary, client=client)
+    except Exception as e:
+        logger.warning(f"[BENCHMARK] Falha na etapa de pergunta: {str(e)}")
+        return False
+    answer_data = generate_answer_with_ai(
+        question_data=question_data, topic=topic, subtopic=None, client=client,
+        api_key=None, model=model, topic_summary=summary, related_summary=None
+    )
+    if not answer_data:
+        return False
+    distractors_data, _ = generate_distractors(
+        question_data=question_data, answer_data=answer_data, topic=topic, subtopic=None,
+        client=client, api_key=None, model=model, topic_summary=summary, related_summary=None
+    )
+    return distractors_data is not None
+
+def benchmark(fixture, model):
+    """Executa todas as engines sobre todos os casos gravados"""
+    results = {}
+    for engine in ENGINES:
+        rows = []
+        for case in fixture['cases']:
+            stats = {'calls': 0, 'api_latency_ms': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+            client = wrap_client(ReplayCompletions(case['responses'][engine], stats))
+            start = time.perf_counter()
+            passed = run_engine(engine, case, client, model)
+            local_ms = (time.perf_counter() - start) * 1000
+            rows.append(dict(stats, case=case['id'], passed=passed,
+                             latency_ms=stats['api_latency_ms'] + local_ms))
+
+        total = len(rows)
+        results[engine] = {
+            'cases': rows,
+            'pass_rate': sum(1 for row in rows if row['passed']) / total if total else 0,
+            'avg_latency_ms': sum(row['latency_ms'] for row in rows) / total if total else 0,
+            'avg_calls': sum(row['calls'] for row in rows) / total if total else 0,
+            'avg_prompt_tokens': sum(row['prompt_tokens'] for row in rows) / total if total else 0,
+            'avg_completion_tokens': sum(row['completion_tokens'] for row in rows) / total if total else 0
+        }
+    return results
+
+def record(fixture, model, path):
+    """Regrava as respostas de cada caso chamando a API real"""
+    client = get_openai_client()
+    for case in fixture['cases']:
+        for engine in ENGINES:
+            recorded = []
+            run_engine(engine, case, wrap_client(RecordingCompletions(client, recorded)), model)
+            case['responses'][engine] = recorded
+            logger.info(f"[BENCHMARK] Caso {case['id']} ({engine}): {len(recorded)} respostas gravadas")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(fixture, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+def print_report(results):
+    """Exibe a comparação entre as engines"""
+    print(f"{'engine':<10} {'aprovação':>10} {'latência (ms)':>14} {'chamadas':>9} {'tokens in':>10} {'tokens out':>11}")
+    print('-' * 69)
+    for engine, result in results.items():
+        print(f"{engine:<10} {result['pass_rate']:>10.0%} {result['avg_latency_ms']:>14.0f} "
+              f"{result['avg_calls']:>9.1f} {result['avg_prompt_tokens']:>10.0f} {result['avg_completion_tokens']:>11.0f}")
+
+    pipeline, fused = results.get('pipeline'), results.get('fused')
+    if pipeline and fused and fused['avg_latency_ms'] and fused['avg_prompt_tokens']:
+        print()
+        print(f"fused x pipeline: latência {pipeline['avg_latency_ms'] / fused['avg_latency_ms']:.1f}x menor, "
+              f"tokens de entrada {pipeline['avg_prompt_tokens'] / fused['avg_prompt_tokens']:.1f}x menores")
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Benchmark das engines de geração de questões')
+    parser.add_argument('--fixture', default=FIXTURE_PATH, help='Arquivo com as respostas gravadas')
+    parser.add_argument('--model', default=os.getenv('FUSED_MODEL_ID', 'gpt-3.5-turbo'),
+                        help='Modelo usado nas etapas de resposta/distratores e na engine fused')
+    parser.add_argument('--json', dest='json_path', help='Salva o resultado detalhado em JSON')
+    parser.add_argument('--record', action='store_true', help='Regrava as respostas usando a API')
+    args = parser.parse_args()
+
+    # Os módulos da aplicação configuram o logging em INFO; aqui só interessam avisos
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with open(args.fixture, 'r', encoding='utf-8') as f:
+        fixture = json.load(f)
+
+    if args.record:
+        record(fixture, args.model, args.fixture)
+
+    results = benchmark(fixture, args.model)
+    print_report(results)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Teste de carga da geração de questões contra o modelo falso (fake_openai_server.py).
+
+Gera --questions questões com --concurrency threads usando o cliente em
+processo (OPENAI_API_BASE=fake), com a latência e as falhas configuradas, e
+mede vazão, percentis de latência por questão, taxa de falhas, as chamadas
+e tokens contabilizados pelo modelo falso e as métricas por etapa da
+aplicação (app/api/metrics.py). Os tópicos e resumos vêm dos casos de
+fixtures/generation_responses.json.
+
+Uso:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --engine fused --concurrency 16 --latency lognormal:0.8,0.5
+    python benchmarks/load_test.py --rate-limit-rate 0.05 --error-rate 0.02 --json carga.json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['OPENAI_API_BASE'] = 'fake'
+
+from app.api import metrics, circuit_breaker
+from app.api.fake_openai_server import FakeLLM, FakeOpenAIClient
+from benchmarks.generation_engines import FIXTURE_PATH, ENGINES, run_engine
+
+logger = logging.getLogger(__name__)
+
+def percentile(values, p):
+    """Percentil p (0-100) de uma lista de valores"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def load_test(engine, cases, client, model, questions, concurrency):
+    """Gera `questions` questões em paralelo e mede latência e falhas de cada uma"""
+    latencies, failures = [], []
+    lock = threading.Lock()
+    metrics.reset()
+    circuit_breaker.reset()
+
+    def generate(i):
+        case = cases[i % len(cases)]
+        start = time.perf_counter()
+        try:
+            passed = run_engine(engine, case, client, model)
+            error = None if passed else 'reprovada'
+        except Exception as e:
+            passed, error = False, type(e).__name__
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not passed:
+                failures.append(error)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(generate, range(questions)))
+    wall = time.perf_counter() - start
+
+    return {
+        'engine': engine,
+        'questions': questions,
+        'concurrency': concurrency,
+        'wall_seconds': wall,
+        'throughput_per_min': questions / wall * 60 if wall else 0,
+        'failure_rate': len(failures) / questions if questions else 0,
+        'failures': {error: failures.count(error) for error in set(failures)},
+        'latency_seconds': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies) if latencies else 0
+        },
+        'fake_llm': client.llm.stats(),
+        'metrics': metrics.snapshot()['stages'],
+        'circuits': circuit_breaker.states()
+    }
+
+def print_report(result):
+    """Exibe o resultado do teste de carga"""
+    latency = result['latency_seconds']
+    print(f"engine {result['engine']}: {result['questions']} questões, concorrência {result['concurrency']}")
+    print(f"  tempo total {result['wall_seconds']:.1f}s, vazão {result['throughput_per_min']:.1f} questões/min")
+    print(f"  latência p50 {latency['p50']:.2f}s  p95 {latency['p95']:.2f}s  p99 {latency['p99']:.2f}s  "
+          f"máx {latency['max']:.2f}s")
+    print(f"  falhas {result['failure_rate']:.1%} {result['failures'] or ''}")
+    print(f"  {'tipo':<15} {'chamadas':>9} {'500':>6} {'429':>6} {'tokens in':>10} {'tokens out':>11}")
+    for prompt_type, counters in sorted(result['fake_llm'].items()):
+        print(f"  {prompt_type:<15} {counters['calls']:>9} {counters['errors']:>6} {counters['rate_limited']:>6} "
+              f"{counters['prompt_tokens']:>10} {counters['completion_tokens']:>11}")
+    print(f"  {'etapa':<15} {'válidas':>9} {'rejeitadas':>11} {'p95 (s)':>8}")
+    for stage, models in result['metrics'].items():
+        for stage_metrics in models.values():
+            results = stage_metrics['results']
+            rejected = results.get(metrics.RESULT_PARSE_ERROR, 0) + results.get(metrics.RESULT_VALIDATION_ERROR, 0)
+            p95 = stage_metrics['latency_seconds']['p95'] or 0
+            print(f"  {stage:<15} {results.get(metrics.RESULT_VALID, 0):>9} {rejected:>11} {p95:>8.2f}")
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Teste de carga da geração de questões com o modelo falso')
+    parser.add_argument('--fixture', default=FIXTURE_PATH, help='Arquivo com os casos (tópico e resumo)')
+    parser.add_argument('--engine', choices=ENGINES, default='pipeline')
+    parser.add_argument('--questions', type=int, default=50, help='Número de questões geradas')
+    parser.add_argument('--concurrency', type=int, default=8, help='Gerações simultâneas')
+    parser.add_argument('--model', default=os.getenv('FUSED_MODEL_ID', 'gpt-3.5-turbo'))
+    parser.add_argument('--latency', default='lognormal:0.3,0.5',
+                        help='Distribuição da latência até o primeiro token (ver fake_openai_server.py)')
+    parser.add_argument('--token-latency', type=float, default=0.0, help='Segundos por token gerado')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fração das chamadas que retornam 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fração das chamadas que retornam 429')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', dest='json_path', help='Salva o resultado em JSON')
+    args = parser.parse_args()
+
+    # Os módulos da aplicação configuram o logging em INFO; aqui só interessam erros
+    logging.getLogger().setLevel(logging.ERROR)
+
+    with open(args.fixture, 'r', encoding='utf-8') as f:
+        cases = json.load(f)['cases']
+
+    llm = FakeLLM(latency=args.latency, token_latency=args.token_latency, error_rate=args.error_rate,
+                  rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    result = load_test(args.engine, cases, FakeOpenAIClient(llm), args.model, args.questions, args.concurrency)
+    print_report(result)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    sys.exit(main())
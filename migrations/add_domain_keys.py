@@ -0,0 +1,27 @@
+"""Preenche topic_summaries.domain_keys dos resumos já gravados"""
+
+import os
+import sys
+from pathlib import Path
+
+# Adicionar diretório raiz ao PYTHONPATH
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from app.database.db_manager import DatabaseManager
+
+def upgrade():
+    """Calcula as chaves de domínio dos resumos que ainda não as têm"""
+    # DatabaseManager cria a coluna domain_keys se ela ainda não existir
+    updated = DatabaseManager().backfill_domain_keys()
+    print(f"Chaves de domínio calculadas para {updated} resumos")
+
+def downgrade():
+    """Apaga as chaves de domínio (o SQLite não remove a coluna)"""
+    with DatabaseManager().get_connection() as conn:
+        conn.execute('UPDATE topic_summaries SET domain_keys = NULL')
+        conn.commit()
+
+if __name__ == '__main__':
+    print(f"Caminho absoluto do banco: {os.path.abspath('instance/questoespmp.db')}")
+    upgrade()
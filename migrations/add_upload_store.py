@@ -0,0 +1,31 @@
+"""Registra no armazenamento de uploads os PDFs que já estão em data/uploads/resumos"""
+
+import os
+import sys
+from pathlib import Path
+
+# Adicionar diretório raiz ao PYTHONPATH
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from app.database.db_manager import DatabaseManager
+from app.api.upload_store import adopt_uploads
+
+def upgrade():
+    """Guarda cada PDF uma vez por conteúdo; nomes com o mesmo conteúdo viram aliases"""
+    # DatabaseManager cria as tabelas upload_blobs e upload_aliases se ainda não existirem
+    DatabaseManager()
+    adopted = adopt_uploads()
+    duplicates = sum(1 for stored in adopted if stored.deduplicated)
+    print(f"{len(adopted)} PDFs registrados no armazenamento ({duplicates} com conteúdo repetido)")
+
+def downgrade():
+    """Esquece os aliases; os arquivos em data/uploads/resumos continuam no lugar"""
+    with DatabaseManager().get_connection() as conn:
+        conn.execute('DELETE FROM upload_aliases')
+        conn.execute('DELETE FROM upload_blobs')
+        conn.commit()
+
+if __name__ == '__main__':
+    print(f"Caminho absoluto do banco: {os.path.abspath('instance/questoespmp.db')}")
+    upgrade()
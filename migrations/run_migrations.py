@@ -10,6 +10,8 @@
 
 from app import create_app, db
 from migrations.add_ai_models_table import upgrade, downgrade
+from migrations.add_domain_keys import upgrade as upgrade_domain_keys
+from migrations.add_upload_store import upgrade as upgrade_upload_store
 
 def main():
     """Executa as migrações"""
@@ -31,6 +33,12 @@ def main():
             upgrade()
             print("Upgrade concluído com sucesso!")
             
+            print("Calculando chaves de domínio dos resumos...")
+            upgrade_domain_keys()
+            
+            print("Registrando os PDFs no armazenamento de uploads...")
+            upgrade_upload_store()
+            
         print("Migrações concluídas com sucesso!")
     except Exception as e:
         print(f"Erro ao executar migrações: {str(e)}")
@@ -21,6 +21,7 @@
 from kivymd.uix.spinner import MDSpinner
 from kivymd.uix.progressbar import MDProgressBar
 from kivy.metrics import dp
+from kivy.clock import Clock
 
 from ..utils.file_utils import process_document, save_document_to_temp, delete_temp_file
 
@@ -352,11 +353,26 @@ def execute_process_all(self):
         self.dialogs.append(processing_dialog)
         processing_dialog.open()
         
-        # Process each document
+        # Process documents in a separate thread so the UI stays responsive
+        self.processing_thread = threading.Thread(
+            target=self._process_all_thread, args=(processing_dialog,), daemon=True
+        )
+        self.processing_thread.start()
+    
+    def _process_all_thread(self, processing_dialog):
+        """Process all unprocessed documents in a separate thread."""
         processed_count = 0
         errors = []
+        pending = [i for i, doc in enumerate(self.document_list) if not doc['processed']]
         
-        for i, doc in enumerate(self.document_list):
+        for position, i in enumerate(pending):
+            doc = self.document_list[i]
+            Clock.schedule_once(
+                lambda dt, n=position + 1, name=doc['name']: setattr(
+                    processing_dialog, 'text', f"Processando documentos... ({n}/{len(pending)})\n{name}"
+                ),
+                0
+            )
             if not doc['processed']:
                 try:
                     # Determine document type
@@ -379,6 +395,13 @@ def execute_process_all(self):
                 except Exception as e:
                     errors.append(f"{doc['name']}: {str(e)}")
         
+        Clock.schedule_once(
+            lambda dt: self._finish_process_all(processing_dialog, processed_count, errors),
+            0
+        )
+    
+    def _finish_process_all(self, processing_dialog, processed_count, errors):
+        """Show the results of processing all documents (UI thread)."""
         # Update UI
         self.update_document_list_ui()
         
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Inicia os processos que executam os jobs da fila de geração.
+
+Uso:
+    python worker.py            # usa JOB_WORKERS (padrão: 2)
+    python worker.py --workers 4
+    python worker.py --no-inventory   # não inicia o serviço de reposição do estoque
+"""
+
+import os
+import sys
+import signal
+import argparse
+import threading
+import multiprocessing
+from app.utils.logging_config import setup_logging
+
+# Configurar logging
+logger = setup_logging()
+
+def worker_main(index):
+    """Ponto de entrada de cada processo worker."""
+    from app import create_app
+    from app.api.job_worker import run_worker
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+
+    app = create_app()
+    with app.app_context():
+        run_worker(stop_event=stop_event)
+
+def inventory_main():
+    """Ponto de entrada do processo que vigia o estoque de questões por domínio."""
+    from app import create_app
+    from app.api.question_inventory import run_inventory_filler
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+
+    app = create_app()
+    with app.app_context():
+        run_inventory_filler(stop_event=stop_event)
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Workers da fila de geração de questões')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('JOB_WORKERS', '2')),
+                        help='Número de processos worker')
+    parser.add_argument('--no-inventory', action='store_true',
+                        help='Não inicia o serviço de reposição do estoque de questões')
+    args = parser.parse_args()
+
+    logger.info(f"[WORKER] Iniciando {args.workers} processos worker")
+    processes = []
+    for index in range(args.workers):
+        process = multiprocessing.Process(target=worker_main, args=(index,), name=f'job-worker-{index}')
+        process.start()
+        processes.append(process)
+
+    # Enfileira jobs de reposição; a geração em si é feita pelos workers acima
+    if not args.no_inventory:
+        process = multiprocessing.Process(target=inventory_main, name='inventory-filler')
+        process.start()
+        processes.append(process)
+
+    def shutdown(*args):
+        logger.info("[WORKER] Encerrando workers...")
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for process in processes:
+        process.join()
+    logger.info("[WORKER] Todos os workers foram encerrados")
+
+if __name__ == '__main__':
+    sys.exit(main())